@@ -0,0 +1,72 @@
+"""
+文件作用：热路径微基准，复现性能改动中给出的前后对比数据。
+
+设计要点：
+- 每个基准对比改动前的写法与当前实现，在同一进程、同一输入下计时，输出每次调用的微秒数与倍数。
+- 只依赖 requirements.txt 中已有的包，不访问网络与数据库。
+- 用法：`python -m app.bench [名称 ...] [--number N]`（或 `make bench`），不带名称时运行全部。
+"""
+
+import argparse
+import sys
+import timeit
+from typing import Callable, Dict, List, Tuple
+from jsonschema import ValidationError, validate
+from .services import validators
+
+_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "query": {"type": "string", "minLength": 1},
+        "top_k": {"type": "integer", "minimum": 1, "maximum": 100},
+        "filters": {"type": "object", "additionalProperties": {"type": "string"}},
+        "mode": {"enum": ["bm25", "vector", "hybrid"]},
+    },
+    "required": ["query"],
+}
+_VALID = {"query": "hello world", "top_k": 10, "filters": {"lang": "zh", "src": "kb"}, "mode": "hybrid"}
+_INVALID = {"query": "", "top_k": 1000, "mode": "other"}
+
+
+def _validate_each_call(args: Dict[str, object]) -> None:
+    # 改动前 invoke_tool/_run_stream 的写法：每次调用都检查 schema 并构造新校验器
+    try:
+        validate(instance=args, schema=_SCHEMA)
+    except ValidationError:
+        pass
+
+
+def _validate_cached(args: Dict[str, object]) -> None:
+    validators.validation_error(validators.tool_validator("bench", _SCHEMA), args)
+
+
+def bench_validators(number: int) -> List[Tuple[str, float, float]]:
+    """工具参数校验：jsonschema.validate 对比按工具缓存的已编译校验器。"""
+    rows = []
+    for label, args in (("valid args", _VALID), ("invalid args", _INVALID)):
+        before = timeit.timeit(lambda: _validate_each_call(args), number=number) / number * 1e6
+        after = timeit.timeit(lambda: _validate_cached(args), number=number) / number * 1e6
+        rows.append((label, before, after))
+    return rows
+
+
+BENCHMARKS: Dict[str, Callable[[int], List[Tuple[str, float, float]]]] = {"validators": bench_validators}
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.bench")
+    parser.add_argument("names", nargs="*", help=f"基准名称：{', '.join(BENCHMARKS)}")
+    parser.add_argument("--number", type=int, default=5000, help="每种写法的调用次数")
+    opts = parser.parse_args(argv)
+    unknown = [n for n in opts.names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark: {', '.join(unknown)}")
+    for name in opts.names or list(BENCHMARKS):
+        print(f"{name}: {BENCHMARKS[name].__doc__}")
+        for label, before, after in BENCHMARKS[name](opts.number):
+            print(f"  {label:<14} before {before:9.1f} us/call   after {after:9.1f} us/call   {before / after:6.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
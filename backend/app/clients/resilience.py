@@ -0,0 +1,121 @@
+"""
+文件作用：外部服务调用的弹性原语（熔断器、滚动耗时窗口、抖动退避）。
+
+设计要点：
+- 熔断器按 Endpoint 维度共享：连续失败达到阈值后打开，期间直接快速失败；冷却结束进入半开，
+  只放行一个探测请求，成功则关闭、失败则重新打开。状态变化写入 tcloud_circuit_state。
+- 滚动耗时窗口只保留最近的成功耗时样本，分位数按需排序计算（窗口很小），用于决定对冲等待时间；
+  提供方整体变慢时分位数随之上移，不会在退化期间把每个请求都对冲一遍。
+- 退避为指数增长 + 抖动，避免同时失败的调用在同一时刻重试。
+"""
+
+import random
+import time
+from collections import deque
+from threading import RLock
+from typing import Deque, Dict, List, Optional
+from ..config import settings
+from ..observability import TCLOUD_BREAKER_REJECTED, TCLOUD_BREAKER_STATE
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """连续失败计数型熔断器；线程安全。"""
+
+    def __init__(self, name: str, failures: Optional[int] = None, reset: Optional[float] = None) -> None:
+        self.name = name
+        self.threshold = max(1, failures or settings.tencentcloud_breaker_failures)
+        self.reset = settings.tencentcloud_breaker_reset if reset is None else reset
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._lock = RLock()
+        TCLOUD_BREAKER_STATE.labels(endpoint=name).set(0)
+
+    def _move(self, state: str) -> None:
+        self.state = state
+        TCLOUD_BREAKER_STATE.labels(endpoint=self.name).set(_STATE_CODES[state])
+
+    def allow(self) -> bool:
+        """是否放行本次请求；放行后必须以 record 或 release 结束。"""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset:
+                self._move(HALF_OPEN)
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            TCLOUD_BREAKER_REJECTED.labels(endpoint=self.name).inc()
+            return False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._probing = False
+            if ok:
+                self.failures = 0
+                if self.state != CLOSED:
+                    self._move(CLOSED)
+                return
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+                if self.state != OPEN:
+                    self._move(OPEN)
+
+    def release(self) -> None:
+        """请求被取消（如对冲落败）：不计成败，只归还半开探测名额。"""
+        with self._lock:
+            self._probing = False
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+
+class LatencyWindow:
+    """最近 size 个耗时样本的滚动窗口。"""
+
+    def __init__(self, size: int = 200) -> None:
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def ordered(self) -> List[float]:
+        return sorted(self._samples)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = self.ordered()
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def backoff(attempt: int, base: float, cap: float) -> float:
+    """第 attempt 次重试（从 1 开始）前的等待秒数。"""
+    return min(base * 2 ** (attempt - 1), cap) * random.uniform(0.5, 1.0)
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_LOCK = RLock()
+
+
+def breaker_for(endpoint: str) -> CircuitBreaker:
+    """同一 Endpoint 的所有客户端共享一个熔断器。"""
+    with _LOCK:
+        breaker = _BREAKERS.get(endpoint)
+        if breaker is None:
+            breaker = _BREAKERS[endpoint] = CircuitBreaker(endpoint)
+        return breaker
+
+
+def breakers() -> Dict[str, Dict[str, object]]:
+    with _LOCK:
+        return {name: b.snapshot() for name, b in _BREAKERS.items()}
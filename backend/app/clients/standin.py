@@ -0,0 +1,296 @@
+"""
+文件作用：腾讯云 API 的本地替身（httpx MockTransport），用于在不访问外网的情况下复核客户端行为。
+
+设计要点：
+- 替身独立按 TC3-HMAC-SHA256 规范重算签名（不复用 clients/tencent 的签名代码），签名不符时返回
+  AuthFailure.SignatureFailure，与真实服务一致；通过则按 Action 返回固定响应。
+- 固定测试向量钉住派生签名密钥与完整签名，签名实现或缓存逻辑的任何回归都会使自检失败。
+- 故障注入：按 Action 排队注入连接失败、超时、5xx、限流或慢响应，逐个消费，队列空时正常返回；
+  用于复核重试次数、非幂等接口不重试、熔断器 打开 → 半开 → 关闭 的状态循环以及对冲生效。
+  熔断器按 host 共享，每个场景使用独立的 Endpoint，互不干扰。
+- 自检：`python -m app.clients.standin`（或 `make standin-check`），全部通过时退出码为 0。
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import sys
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Iterator, List, Tuple
+import httpx
+from ..config import settings
+from ..observability import TCLOUD_HEDGES
+from .resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from .tencent import TencentCloudClient, TencentCloudError, derive_signing_key
+
+# 测试向量：SecretKey="standin-secret"，日期 2026-01-01，服务 lkeap
+VECTOR_SECRET_KEY = "standin-secret"
+VECTOR_DATE = "2026-01-01"
+VECTOR_TIMESTAMP = 1767225600  # 2026-01-01T00:00:00Z
+VECTOR_SIGNING_KEY = "fc404e0ddd18d5d353aedc95405e60bac7d5c71c5e927e6b28abe84e1441033d"
+# Host=lkeap.tencentcloudapi.com，Action=ChatCompletions，请求体 b"{}"
+VECTOR_SIGNATURE = "38d874c3bcdb49ca6366e9f85421414379e118f368090e63ea891b49e19035bc"
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def expected_signature(request: httpx.Request, body: bytes, secret_key: str) -> Tuple[str, str]:
+    """按规范从请求本身重算签名，返回 (SecretId, 期望签名)；请求头不完整时抛 ValueError。"""
+    auth = request.headers["Authorization"]
+    algorithm, _, rest = auth.partition(" ")
+    if algorithm != "TC3-HMAC-SHA256":
+        raise ValueError(f"unexpected algorithm {algorithm}")
+    parts = dict(p.strip().split("=", 1) for p in rest.split(","))
+    secret_id, date, service, terminator = parts["Credential"].split("/")
+    signed = parts["SignedHeaders"].split(";")
+    # 规范要求 x-tc-action 取小写，其余头按原值去首尾空白
+    values = {h: request.headers[h].strip() for h in signed}
+    if "x-tc-action" in values:
+        values["x-tc-action"] = values["x-tc-action"].lower()
+    canonical_headers = "".join(f"{h}:{values[h]}\n" for h in signed)
+    canonical = "\n".join(["POST", "/", "", canonical_headers, ";".join(signed), _sha256(body)])
+    to_sign = "\n".join([
+        algorithm, request.headers["X-TC-Timestamp"], f"{date}/{service}/{terminator}", _sha256(canonical.encode("utf-8")),
+    ])
+    key = _hmac(_hmac(_hmac(("TC3" + secret_key).encode("utf-8"), date), service), "tc3_request")
+    return secret_id, hmac.new(key, to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _response(status: int, payload: Dict[str, Any]) -> httpx.Response:
+    return httpx.Response(status, json={"Response": {**payload, "RequestId": "standin"}})
+
+
+class StandIn:
+    """校验签名的本地替身；secrets 为 {SecretId: SecretKey}，seen 记录收到的 (Action, 结果)。
+
+    故障（inject）：connect / timeout / http500 / throttle / slow:<秒> / ok。
+    """
+
+    def __init__(self, secrets: Dict[str, str]) -> None:
+        self.secrets = secrets
+        self.seen: List[Tuple[str, str]] = []
+        self.calls: Counter = Counter()
+        self._faults: Dict[str, Deque[str]] = {}
+
+    def inject(self, action: str, *faults: str) -> None:
+        self._faults.setdefault(action, deque()).extend(faults)
+
+    async def _fault(self, action: str, request: httpx.Request) -> Any:
+        queue = self._faults.get(action)
+        fault = queue.popleft() if queue else "ok"
+        if fault.startswith("slow:"):
+            await asyncio.sleep(float(fault[5:]))
+        elif fault == "connect":
+            raise httpx.ConnectError("stand-in: connection refused", request=request)
+        elif fault == "timeout":
+            raise httpx.ReadTimeout("stand-in: read timeout", request=request)
+        elif fault == "http500":
+            return httpx.Response(500, text="stand-in: internal server error")
+        elif fault == "throttle":
+            return _response(200, {"Error": {"Code": "RequestLimitExceeded", "Message": "stand-in: throttled"}})
+        return None
+
+    def verify(self, request: httpx.Request, body: bytes) -> bool:
+        auth = request.headers.get("Authorization", "")
+        secret_id = auth.partition("Credential=")[2].split("/", 1)[0]
+        if secret_id not in self.secrets:
+            return False
+        try:
+            _, signature = expected_signature(request, body, self.secrets[secret_id])
+        except (KeyError, ValueError):
+            return False
+        return hmac.compare_digest(auth.rpartition("Signature=")[2], signature)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        action = request.headers.get("X-TC-Action", "")
+        self.calls[action] += 1
+        faulted = await self._fault(action, request)
+        if faulted is not None:
+            self.seen.append((action, "fault"))
+            return faulted
+        if not self.verify(request, body):
+            self.seen.append((action, "auth_failure"))
+            return _response(200, {"Error": {"Code": "AuthFailure.SignatureFailure", "Message": "signature mismatch"}})
+        self.seen.append((action, "ok"))
+        return _response(200, {"Action": action, "Echo": json.loads(body or b"{}")})
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+
+def _client(standin: StandIn, endpoint: str, secret_id: str = "AKIDstandin", secret_key: str = VECTOR_SECRET_KEY) -> TencentCloudClient:
+    return TencentCloudClient(secret_id=secret_id, secret_key=secret_key, endpoint=endpoint, transport=standin.transport())
+
+
+async def check_signing() -> List[Tuple[str, bool]]:
+    results: List[Tuple[str, bool]] = []
+    results.append(("derived key matches vector", derive_signing_key(VECTOR_SECRET_KEY, VECTOR_DATE, "lkeap").hex() == VECTOR_SIGNING_KEY))
+    client = _client(StandIn({}), "lkeap.tencentcloudapi.com")
+    try:
+        headers = client.sign("ChatCompletions", b"{}", VECTOR_TIMESTAMP)
+        results.append(("signature matches vector", headers["Authorization"].endswith(f"Signature={VECTOR_SIGNATURE}")))
+        # 缓存的派生密钥：同一天复用同一对象且等于向量，换日后重新派生
+        cached = client._signing_key(VECTOR_DATE)
+        results.append(("cached key matches vector", cached.hex() == VECTOR_SIGNING_KEY))
+        results.append(("cached key reused same day", client._signing_key(VECTOR_DATE) is cached))
+        client.sign("ChatCompletions", b"{}", VECTOR_TIMESTAMP + 86400)
+        results.append(("cached key refreshed next day", client._keys[client.service][0] == "2026-01-02"))
+        client.sign("ChatCompletions", b"{}", VECTOR_TIMESTAMP)
+        results.append(("cached key back to vector", client._keys[client.service][1].hex() == VECTOR_SIGNING_KEY))
+    finally:
+        await client.close()
+
+    standin = StandIn({"AKIDstandin": VECTOR_SECRET_KEY})
+    good = _client(standin, "http://standin-signing.local")
+    bad = _client(standin, "http://standin-signing.local", secret_key="wrong-secret")
+    try:
+        data = await good.invoke_lke("DescribeStandIn", {"q": "中文"})
+        results.append(("stand-in accepts correct signature", data.get("Action") == "DescribeStandIn"))
+        try:
+            await bad.invoke_lke("DescribeStandIn", {})
+            results.append(("stand-in rejects wrong key", False))
+        except TencentCloudError as e:
+            results.append(("stand-in rejects wrong key", e.code == "AuthFailure.SignatureFailure"))
+    finally:
+        await good.close()
+        await bad.close()
+    return results
+
+
+@contextmanager
+def _overrides(**values: Any) -> Iterator[None]:
+    # 临时改写弹性相关配置（退避缩短到毫秒级，自检不必真实等待），退出时恢复
+    saved = {k: getattr(settings, k) for k in values}
+    try:
+        for k, v in values.items():
+            setattr(settings, k, v)
+        yield
+    finally:
+        for k, v in saved.items():
+            setattr(settings, k, v)
+
+
+async def _outcome(client: TencentCloudClient, action: str, **kwargs: Any) -> str:
+    try:
+        await client.invoke_lke(action, {}, **kwargs)
+        return "ok"
+    except TencentCloudError as e:
+        return e.code
+
+
+async def check_retries() -> List[Tuple[str, bool]]:
+    results: List[Tuple[str, bool]] = []
+    standin = StandIn({"AKIDstandin": VECTOR_SECRET_KEY})
+    client = _client(standin, "http://standin-retries.local")
+    # 阈值调高，避免累计失败触发熔断干扰重试计数
+    client.breaker = CircuitBreaker("standin-retries", failures=100)
+    try:
+        with _overrides(tencentcloud_retries=2, tencentcloud_retry_backoff=0.001, tencentcloud_hedge=False):
+            standin.inject("DescribeA", "http500", "timeout")
+            outcome = await _outcome(client, "DescribeA")
+            results.append(("idempotent recovers after 2 retries", outcome == "ok" and standin.calls["DescribeA"] == 3))
+            standin.inject("DescribeB", "http500", "throttle", "http500")
+            outcome = await _outcome(client, "DescribeB")
+            results.append(("idempotent gives up after retries", outcome == "HTTP500" and standin.calls["DescribeB"] == 3))
+            standin.inject("CreateC", "timeout")
+            outcome = await _outcome(client, "CreateC")
+            results.append(("non-idempotent not retried on timeout", outcome == "Timeout" and standin.calls["CreateC"] == 1))
+            standin.inject("CreateD", "connect")
+            outcome = await _outcome(client, "CreateD")
+            results.append(("non-idempotent retried on connect error", outcome == "ok" and standin.calls["CreateD"] == 2))
+            standin.inject("DescribeE", "http500")
+            outcome = await _outcome(client, "DescribeE", idempotent=False)
+            results.append(("explicit idempotent=False not retried", outcome == "HTTP500" and standin.calls["DescribeE"] == 1))
+    finally:
+        await client.close()
+    return results
+
+
+async def check_breaker() -> List[Tuple[str, bool]]:
+    results: List[Tuple[str, bool]] = []
+    standin = StandIn({"AKIDstandin": VECTOR_SECRET_KEY})
+    client = _client(standin, "http://standin-breaker.local")
+    # 小阈值、短冷却的独立熔断器，便于走完整个状态循环
+    breaker = client.breaker = CircuitBreaker("standin-breaker", failures=2, reset=0.05)
+    try:
+        with _overrides(tencentcloud_retries=0, tencentcloud_hedge=False):
+            standin.inject("DescribeX", "http500", "http500")
+            await _outcome(client, "DescribeX")
+            results.append(("stays closed below threshold", breaker.state == CLOSED))
+            await _outcome(client, "DescribeX")
+            results.append(("opens at threshold", breaker.state == OPEN))
+            before = standin.calls["DescribeX"]
+            outcome = await _outcome(client, "DescribeX")
+            results.append(("open fails fast without a request", outcome == "CircuitOpen" and standin.calls["DescribeX"] == before))
+            await asyncio.sleep(0.06)
+            results.append(("half-open admits one probe", breaker.allow() and breaker.state == HALF_OPEN and not breaker.allow()))
+            breaker.release()
+            standin.inject("DescribeX", "timeout")
+            outcome = await _outcome(client, "DescribeX")
+            results.append(("failed probe reopens", outcome == "Timeout" and breaker.state == OPEN))
+            await asyncio.sleep(0.06)
+            outcome = await _outcome(client, "DescribeX")
+            results.append(("successful probe closes", outcome == "ok" and breaker.state == CLOSED and breaker.failures == 0))
+            standin.inject("DescribeX", "throttle")
+            await _outcome(client, "DescribeX")
+            standin.inject("DescribeX", "ok")
+            await _outcome(client, "DescribeX")
+            results.append(("success resets failure count", breaker.state == CLOSED and breaker.failures == 0))
+    finally:
+        await client.close()
+    return results
+
+
+async def check_hedging() -> List[Tuple[str, bool]]:
+    results: List[Tuple[str, bool]] = []
+    standin = StandIn({"AKIDstandin": VECTOR_SECRET_KEY})
+    client = _client(standin, "http://standin-hedging.local")
+    won = TCLOUD_HEDGES.labels(action="DescribeH", outcome="won")
+    try:
+        with _overrides(tencentcloud_retries=0, tencentcloud_hedge=True, tencentcloud_hedge_min_samples=5,
+                        tencentcloud_hedge_quantile=0.95, tencentcloud_hedge_min_delay=0.01):
+            for _ in range(10):
+                await _outcome(client, "DescribeH")
+            # 主请求卡住 2 秒，对冲请求正常返回：应在对冲等待 + 一次正常耗时内完成
+            standin.inject("DescribeH", "slow:2")
+            before, start = won._value.get(), time.perf_counter()
+            outcome = await _outcome(client, "DescribeH")
+            elapsed = time.perf_counter() - start
+            results.append(("hedge wins over stalled primary", outcome == "ok" and elapsed < 0.5 and won._value.get() == before + 1))
+            # 对冲请求先以可重试错误失败：继续等待主请求，而不是返回错误
+            standin.inject("DescribeH", "slow:0.2", "http500")
+            outcome = await _outcome(client, "DescribeH")
+            results.append(("failed hedge falls back to primary", outcome == "ok"))
+            # 非幂等接口从不对冲
+            standin.inject("CreateH", "slow:0.2")
+            await _outcome(client, "CreateH")
+            results.append(("non-idempotent never hedged", standin.calls["CreateH"] == 1))
+    finally:
+        await client.close()
+    return results
+
+
+CHECKS: List[Callable[[], Any]] = [check_signing, check_retries, check_breaker, check_hedging]
+
+
+async def _run() -> bool:
+    ok = True
+    for check in CHECKS:
+        for name, passed in await check():
+            ok = ok and passed
+            print(f"[{'PASS' if passed else 'FAIL'}] {check.__name__}: {name}")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if asyncio.run(_run()) else 1)
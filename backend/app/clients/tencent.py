@@ -1,26 +1,112 @@
 """
-文件作用：腾讯云相关客户端封装（占位实现）。
+文件作用：腾讯云相关客户端封装（TC3 签名、应用级共享连接池）。
 
 设计目标：
 - 从集中配置（环境变量）读取密钥与区域/Endpoint，不在代码中硬编码明文。
 - 使用 httpx（异步）作为基础请求库，后续可替换为官方 SDK。
 - 统一请求超时、重试与日志钩子，便于可观测与治理。
+- 连接复用：整个应用共享一个客户端（FastAPI lifespan 中 open_client 创建、close_client 关闭），
+  连接池限额/长连接保活/HTTP/2 可配置，避免每个请求新建连接池并重新握手 TLS。
+- 可观测：在途请求数与耗时（observability），连接池中活跃/空闲连接数在抓取时实时读取。
+- 签名：TC3-HMAC-SHA256。派生签名密钥 HMAC(HMAC(HMAC("TC3"+SecretKey, 日期), 服务), "tc3_request")
+  只随 UTC 日期与服务变化，按 (服务, 日期) 缓存，每个请求只需一次 HMAC 计算签名。
+- 流式：stream_chat 以 Stream=true 调用 ChatCompletions，逐行解析 SSE 并立即产出增量文本，
+  不做中间缓冲，调用方的首 token 时间即提供方的首 token 时间。
+- 弹性（见 clients/resilience）：每个 Endpoint 一个熔断器，提供方退化时快速失败；可重试的失败
+  （连接/超时/5xx/限流/InternalError）按抖动指数退避重试，但非幂等接口只重试请求未发出的连接失败；
+  可选对冲：幂等调用超过该接口近期 p95 耗时仍未返回时再发一个请求，先成功者胜出、另一个被取消。
+  流式调用只经过熔断器，不重试也不对冲（已产出的 token 无法撤回）。
 
-注意：当前不落地真实签名逻辑（TC3-HMAC-SHA256），仅保留接口形态与注释说明，
-     以避免在未配置密钥时误调用外部服务。生产环境请实现签名或接入官方 SDK。
+注意：未配置 SecretId/SecretKey 时 invoke_lke 返回占位响应，避免在未配置密钥时误调用外部服务。
 """
 
-from typing import Any, Dict, Optional
+import asyncio
+import hashlib
+import hmac
+import importlib.util
+import json
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from threading import RLock
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
 import httpx
 from loguru import logger
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
 from ..config import settings
+from ..observability import TCLOUD_HEDGES, TCLOUD_IN_FLIGHT, TCLOUD_LATENCY, TCLOUD_RETRIES, TCLOUD_TTFT
+from .resilience import CLOSED, LatencyWindow, backoff, breaker_for
+
+_ALGORITHM = "TC3-HMAC-SHA256"
+_CONTENT_TYPE = "application/json; charset=utf-8"
+_SIGNED_HEADERS = "content-type;host;x-tc-action"
+# 可重试的错误码前缀：传输层失败、5xx、限流与提供方内部错误
+_RETRIABLE = ("ConnectError", "Timeout", "NetworkError", "HTTP5", "HTTP429", "InternalError", "RequestLimitExceeded")
+# 无服务端副作用的接口（查询类与生成类），重复执行结果等价，可重试与对冲
+_IDEMPOTENT = ("Describe", "Get", "List", "Query", "Search", "ChatCompletions", "RunRerank")
+
+
+class TencentCloudError(Exception):
+    """腾讯云 API 返回的业务错误（Response.Error）或非 JSON 响应。"""
+
+    def __init__(self, code: str, message: str, request_id: Optional[str] = None) -> None:
+        super().__init__(f"{code}: {message}")
+        self.code = code
+        self.message = message
+        self.request_id = request_id
+
+    @property
+    def retriable(self) -> bool:
+        return self.code.startswith(_RETRIABLE)
+
+
+def _transport_error(e: httpx.HTTPError) -> TencentCloudError:
+    # ConnectError 表示请求未发出，非幂等接口也可安全重试
+    if isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout)):
+        code = "ConnectError"
+    elif isinstance(e, httpx.TimeoutException):
+        code = "Timeout"
+    else:
+        code = "NetworkError"
+    return TencentCloudError(code, repr(e))
+
+
+def _parse_response(resp: httpx.Response) -> Dict[str, Any]:
+    try:
+        data = resp.json()["Response"]
+    except (ValueError, KeyError, TypeError):
+        raise TencentCloudError(f"HTTP{resp.status_code}", resp.text[:200])
+    error = data.get("Error")
+    if error:
+        raise TencentCloudError(error.get("Code", "Unknown"), error.get("Message", ""), data.get("RequestId"))
+    return data
+
+
+def _hmac(key: bytes, msg: str) -> bytes:
+    return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+
+
+def derive_signing_key(secret_key: str, date: str, service: str) -> bytes:
+    return _hmac(_hmac(_hmac(("TC3" + secret_key).encode("utf-8"), date), service), "tc3_request")
+
+
+def string_to_sign(host: str, action: str, body: bytes, timestamp: int, date: str, service: str) -> str:
+    """按 TC3 规范构造待签字符串（POST、根路径、无查询参数）。"""
+    canonical_headers = f"content-type:{_CONTENT_TYPE}\nhost:{host}\nx-tc-action:{action.lower()}\n"
+    canonical_request = "\n".join([
+        "POST", "/", "", canonical_headers, _SIGNED_HEADERS, hashlib.sha256(body).hexdigest(),
+    ])
+    scope = f"{date}/{service}/tc3_request"
+    return "\n".join([_ALGORITHM, str(timestamp), scope, hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()])
 
 
 class TencentCloudClient:
-    """腾讯云通用客户端占位。
+    """腾讯云通用客户端。
 
     - 读取密钥：从环境变量注入（建议使用 Vault/KMS）。
-    - 超时与重试：基础超时配置，重试逻辑可在生产阶段接入。
+    - 超时与重试：基础超时 + 熔断/重试/对冲（invoke_lke），策略见 tencentcloud_retries/hedge/breaker 配置。
+    - 生命周期：应作为应用级单例使用（见 open_client/get_tencent_client），关闭时调用 close()。
     """
 
     def __init__(
@@ -29,36 +115,307 @@ class TencentCloudClient:
         secret_key: Optional[str] = None,
         region: Optional[str] = None,
         endpoint: Optional[str] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
     ) -> None:
+        # transport 仅用于替换底层传输（如 clients/standin 的本地替身），缺省走真实网络
         self.secret_id = secret_id or settings.tencentcloud_secret_id
         self.secret_key = secret_key or settings.tencentcloud_secret_key
         self.region = region or settings.tencentcloud_region
         self.endpoint = endpoint or settings.tencentcloud_lke_endpoint
-        self._client = httpx.AsyncClient(timeout=httpx.Timeout(15.0))
+        self.service = settings.tencentcloud_lke_service
+        self.version = settings.tencentcloud_lke_version
+        # Endpoint 可带协议（本地联调用 http://host:port），否则默认 https
+        self.url = self.endpoint if "://" in self.endpoint else f"https://{self.endpoint}"
+        self.host = httpx.URL(self.url).netloc.decode("ascii")
+        # 服务名 -> (UTC 日期, 派生签名密钥)
+        self._keys: Dict[str, Tuple[str, bytes]] = {}
+        self._keys_lock = RLock()
+        self.breaker = breaker_for(self.host)
+        # Action -> 最近成功调用的耗时，用于计算对冲等待时间
+        self._latency: Dict[str, LatencyWindow] = {}
+        http2 = settings.tencentcloud_http2
+        if http2 and importlib.util.find_spec("h2") is None:
+            logger.warning("[TCloud] h2 not installed, falling back to HTTP/1.1")
+            http2 = False
+        self.limits = httpx.Limits(
+            max_connections=settings.tencentcloud_max_connections,
+            max_keepalive_connections=settings.tencentcloud_max_keepalive,
+            keepalive_expiry=settings.tencentcloud_keepalive_expiry,
+        )
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            limits=self.limits,
+            timeout=httpx.Timeout(settings.tencentcloud_timeout, connect=settings.tencentcloud_connect_timeout),
+            transport=transport,
+        )
 
     async def close(self) -> None:
         await self._client.aclose()
 
-    async def invoke_lke(self, action: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-        """调用腾讯云 LKE 相关接口（占位）。
+    def pool_stats(self) -> Dict[str, int]:
+        """连接池快照：活跃（正在承载请求）与空闲连接数。"""
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = list(getattr(pool, "connections", []))
+        idle = sum(1 for c in connections if c.is_idle())
+        return {"active": len(connections) - idle, "idle": idle}
 
-        说明：
-        - 需要实现 TC3-HMAC-SHA256 签名并设置 Header（X-TC-Action、X-TC-Region 等）。
-        - 此处仅返回占位响应，避免误调用。
-        """
-        logger.info("[TCloud] Skipped real call. Action={}, Endpoint={}", action, self.endpoint)
+    async def _send(self, action: str, request: httpx.Request) -> httpx.Response:
+        # 所有真实调用经此发出：统一记录在途数与耗时
+        start = time.perf_counter()
+        status = "error"
+        TCLOUD_IN_FLIGHT.inc()
+        try:
+            resp = await self._client.send(request)
+            status = str(resp.status_code)
+            return resp
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        finally:
+            TCLOUD_IN_FLIGHT.dec()
+            TCLOUD_LATENCY.labels(action=action, status=status).observe(time.perf_counter() - start)
+
+    @asynccontextmanager
+    async def _open_stream(self, action: str, request: httpx.Request) -> AsyncIterator[httpx.Response]:
+        # 流式调用：在途数与耗时覆盖整个流，退出时关闭响应、连接归还连接池
+        start = time.perf_counter()
+        status = "error"
+        TCLOUD_IN_FLIGHT.inc()
+        try:
+            resp = await self._client.send(request, stream=True)
+            status = str(resp.status_code)
+            try:
+                yield resp
+            finally:
+                await resp.aclose()
+        finally:
+            TCLOUD_IN_FLIGHT.dec()
+            TCLOUD_LATENCY.labels(action=action, status=status).observe(time.perf_counter() - start)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.secret_id and self.secret_key)
+
+    def _signing_key(self, date: str) -> bytes:
+        with self._keys_lock:
+            cached = self._keys.get(self.service)
+            if cached is None or cached[0] != date:
+                cached = self._keys[self.service] = (date, derive_signing_key(self.secret_key or "", date, self.service))
+            return cached[1]
+
+    def sign(self, action: str, body: bytes, timestamp: Optional[int] = None) -> Dict[str, str]:
+        """返回 TC3-HMAC-SHA256 签名后的完整请求头。"""
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        date = datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+        to_sign = string_to_sign(self.host, action, body, timestamp, date, self.service)
+        signature = hmac.new(self._signing_key(date), to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
         return {
-            "skipped": True,
-            "action": action,
-            "endpoint": self.endpoint,
-            "region": self.region,
-            "note": "Placeholder client. Implement TC3 signing or use official SDK in production.",
-            "request": payload,
+            "Authorization": (
+                f"{_ALGORITHM} Credential={self.secret_id}/{date}/{self.service}/tc3_request, "
+                f"SignedHeaders={_SIGNED_HEADERS}, Signature={signature}"
+            ),
+            "Content-Type": _CONTENT_TYPE,
+            "Host": self.host,
+            "X-TC-Action": action,
+            "X-TC-Timestamp": str(timestamp),
+            "X-TC-Version": self.version,
+            "X-TC-Region": self.region,
         }
 
+    def build_request(self, action: str, payload: Dict[str, Any]) -> httpx.Request:
+        body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return self._client.build_request("POST", self.url, content=body, headers=self.sign(action, body))
+
+    def _circuit_open(self) -> TencentCloudError:
+        return TencentCloudError("CircuitOpen", f"circuit open for {self.host}")
+
+    def _window(self, action: str) -> LatencyWindow:
+        window = self._latency.get(action)
+        if window is None:
+            window = self._latency[action] = LatencyWindow()
+        return window
+
+    async def _attempt(self, action: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # 单次调用：经熔断器放行，结果计入熔断器；业务错误（参数错误等）说明提供方正常，不算失败
+        if not self.breaker.allow():
+            raise self._circuit_open()
+        start = time.perf_counter()
+        try:
+            data = _parse_response(await self._send(action, self.build_request(action, payload)))
+        except asyncio.CancelledError:
+            self.breaker.release()
+            raise
+        except httpx.HTTPError as e:
+            self.breaker.record(False)
+            raise _transport_error(e) from e
+        except TencentCloudError as e:
+            self.breaker.record(not e.retriable)
+            raise
+        self.breaker.record(True)
+        self._window(action).observe(time.perf_counter() - start)
+        return data
+
+    async def _hedged(self, action: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        # 主请求超过近期分位耗时仍未返回时发出对冲请求；样本不足或熔断器非关闭时不对冲
+        window = self._window(action)
+        if len(window) < settings.tencentcloud_hedge_min_samples:
+            return await self._attempt(action, payload)
+        delay = max(window.quantile(settings.tencentcloud_hedge_quantile) or 0.0, settings.tencentcloud_hedge_min_delay)
+        hedge = None
+        pending = {asyncio.ensure_future(self._attempt(action, payload))}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if not done and self.breaker.state == CLOSED:
+                TCLOUD_HEDGES.labels(action=action, outcome="launched").inc()
+                hedge = asyncio.ensure_future(self._attempt(action, payload))
+                pending.add(hedge)
+            error: Optional[BaseException] = None
+            while True:
+                for task in done:
+                    exc = task.exception()
+                    # 可重试失败（含对冲请求被熔断拒绝）时继续等另一个请求
+                    if exc is None or not (isinstance(exc, TencentCloudError) and (exc.retriable or exc.code == "CircuitOpen")):
+                        if task is hedge and exc is None:
+                            TCLOUD_HEDGES.labels(action=action, outcome="won").inc()
+                        return task.result()
+                    error = exc
+                if not pending:
+                    raise error  # type: ignore[misc]
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def invoke_lke(self, action: str, payload: Dict[str, Any], idempotent: Optional[bool] = None) -> Dict[str, Any]:
+        """调用腾讯云 LKE 接口，返回 Response 字段内容；业务错误抛 TencentCloudError。
+
+        idempotent 缺省按 Action 名判断，决定失败后能否重试与对冲。
+        未配置密钥时返回占位响应，避免误调用。
+        """
+        if not self.configured:
+            logger.info("[TCloud] Skipped real call (no credentials). Action={}, Endpoint={}", action, self.endpoint)
+            return {
+                "skipped": True,
+                "action": action,
+                "endpoint": self.endpoint,
+                "region": self.region,
+                "note": "TENCENTCLOUD_SECRET_ID/TENCENTCLOUD_SECRET_KEY not configured.",
+                "request": payload,
+            }
+        if idempotent is None:
+            idempotent = action.startswith(_IDEMPOTENT)
+        attempt = 0
+        while True:
+            try:
+                if idempotent and settings.tencentcloud_hedge:
+                    return await self._hedged(action, payload)
+                return await self._attempt(action, payload)
+            except TencentCloudError as e:
+                attempt += 1
+                if attempt > settings.tencentcloud_retries or not e.retriable or not (idempotent or e.code == "ConnectError"):
+                    raise
+                TCLOUD_RETRIES.labels(action=action, code=e.code).inc()
+                delay = backoff(attempt, settings.tencentcloud_retry_backoff, settings.tencentcloud_retry_backoff_max)
+                logger.warning("[TCloud] {} failed ({}), retry {} in {:.2f}s", action, e.code, attempt, delay)
+                await asyncio.sleep(delay)
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        action: str = "ChatCompletions",
+    ) -> AsyncIterator[str]:
+        """流式对话：逐个产出提供方返回的增量文本（Choices[].Delta.Content）。
+
+        messages 为 [{"Role": ..., "Content": ...}]；业务错误抛 TencentCloudError。
+        """
+        payload = {"Model": model or settings.tencentcloud_deepseek_model, "Messages": messages, "Stream": True}
+        if not self.breaker.allow():
+            raise self._circuit_open()
+        start = time.perf_counter()
+        first = True
+        settled = False
+        try:
+            async with self._open_stream(action, self.build_request(action, payload)) as resp:
+                if not resp.headers.get("content-type", "").startswith("text/event-stream"):
+                    # 非流式响应即错误（鉴权失败、参数错误等以普通 JSON 返回）
+                    body = await resp.aread()
+                    try:
+                        error = json.loads(body)["Response"].get("Error") or {}
+                    except (ValueError, KeyError, TypeError, AttributeError):
+                        error = {"Code": f"HTTP{resp.status_code}", "Message": body[:200].decode("utf-8", "replace")}
+                    failure = TencentCloudError(error.get("Code", "Unknown"), error.get("Message", ""))
+                    self.breaker.record(not failure.retriable)
+                    settled = True
+                    raise failure
+                self.breaker.record(True)
+                settled = True
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    try:
+                        event = json.loads(data)
+                    except ValueError:
+                        continue
+                    if event.get("Error"):
+                        raise TencentCloudError(event["Error"].get("Code", "Unknown"), event["Error"].get("Message", ""))
+                    for choice in event.get("Choices") or []:
+                        delta = (choice.get("Delta") or {}).get("Content")
+                        if delta:
+                            if first:
+                                TCLOUD_TTFT.labels(action=action).observe(time.perf_counter() - start)
+                                first = False
+                            yield delta
+        except httpx.HTTPError as e:
+            if not settled:
+                self.breaker.record(False)
+                settled = True
+            raise _transport_error(e) from e
+        finally:
+            if not settled:
+                self.breaker.release()
+
+
+_CLIENT: Optional[TencentCloudClient] = None
+
+
+def open_client() -> TencentCloudClient:
+    """创建应用级共享客户端（FastAPI lifespan 启动时调用）。"""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = TencentCloudClient()
+    return _CLIENT
+
+
+async def close_client() -> None:
+    """关闭共享客户端并释放连接池（FastAPI lifespan 关闭时调用）。"""
+    global _CLIENT
+    client, _CLIENT = _CLIENT, None
+    if client is not None:
+        await client.close()
+
 
 async def get_tencent_client() -> TencentCloudClient:
-    """依赖注入工厂：返回客户端实例。由路由按需关闭。"""
-    return TencentCloudClient()
+    """依赖注入工厂：返回应用级共享客户端（未经 lifespan 启动时按需创建），路由不负责关闭。"""
+    return open_client()
+
+
+class _PoolCollector:
+    """抓取 /metrics 时实时读取共享客户端的连接池状态。"""
+
+    def collect(self) -> Iterator[GaugeMetricFamily]:
+        conns = GaugeMetricFamily("tcloud_http_pool_connections", "腾讯云客户端连接池连接数", labels=["state"])
+        limit = GaugeMetricFamily("tcloud_http_pool_max_connections", "腾讯云客户端连接池上限")
+        client = _CLIENT
+        if client is not None:
+            for state, n in client.pool_stats().items():
+                conns.add_metric([state], n)
+            limit.add_metric([], client.limits.max_connections or 0)
+        yield conns
+        yield limit
 
 
+REGISTRY.register(_PoolCollector())
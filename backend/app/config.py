@@ -29,10 +29,96 @@ class Settings(BaseSettings):
     tencentcloud_region: str = Field(default="ap-guangzhou", alias="TENCENTCLOUD_REGION")
     tencentcloud_lke_endpoint: str = Field(default="lkeap.tencentcloudapi.com", alias="TENCENTCLOUD_LKE_ENDPOINT")
     tencentcloud_deepseek_model: str = Field(default="deepseek-r1", alias="TENCENTCLOUD_DEEPSEEK_MODEL")
+    tencentcloud_lke_service: str = Field(default="lkeap", alias="TENCENTCLOUD_LKE_SERVICE")  # TC3 签名的服务名
+    tencentcloud_lke_version: str = Field(default="2024-05-22", alias="TENCENTCLOUD_LKE_VERSION")  # X-TC-Version
+    # 应用级共享连接池（lifespan 内创建、关闭时释放）
+    tencentcloud_http2: bool = Field(default=True)  # 需安装 h2（httpx[http2]），缺失时退回 HTTP/1.1
+    tencentcloud_max_connections: int = Field(default=100)
+    tencentcloud_max_keepalive: int = Field(default=20)  # 保持空闲长连接数，复用 TLS 会话
+    tencentcloud_keepalive_expiry: float = Field(default=60.0)  # 空闲连接保留秒数
+    tencentcloud_timeout: float = Field(default=15.0)
+    tencentcloud_connect_timeout: float = Field(default=5.0)
+    # 弹性策略（重试 / 对冲 / 熔断）
+    tencentcloud_retries: int = Field(default=2)  # 可重试失败后的最大重试次数（非幂等调用只重试连接失败）
+    tencentcloud_retry_backoff: float = Field(default=0.2)  # 首次重试基础退避（秒），指数增长并加抖动
+    tencentcloud_retry_backoff_max: float = Field(default=5.0)
+    tencentcloud_hedge: bool = Field(default=False)  # 幂等调用超过 p95 耗时仍未返回时发出对冲请求
+    tencentcloud_hedge_quantile: float = Field(default=0.95)
+    tencentcloud_hedge_min_samples: int = Field(default=20)  # 样本不足时不对冲
+    tencentcloud_hedge_min_delay: float = Field(default=0.05)  # 对冲等待下限（秒）
+    tencentcloud_breaker_failures: int = Field(default=5)  # 连续失败次数达到后熔断
+    tencentcloud_breaker_reset: float = Field(default=30.0)  # 熔断持续秒数，之后放行一个探测请求
+
+    # LLM 提供方路由（providers/router）
+    llm_routing_policy: str = Field(default="cost")  # cost / latency / availability
+    llm_fallback_models: str = Field(default="")  # 备选模型（逗号分隔），排在 tencentcloud_deepseek_model 之后作为候选
+    llm_latency_window: int = Field(default=200)  # 每个候选保留的最近耗时样本数
+    llm_error_ewma_alpha: float = Field(default=0.2)  # 错误率 EWMA 的平滑系数
+    llm_error_half_life: float = Field(default=60.0)  # 无新样本时错误率的衰减半衰期（秒），使故障候选能被重新探测
+    llm_unhealthy_error_rate: float = Field(default=0.5)  # 错误率达到该值视为不健康
+    llm_explore_rate: float = Field(default=0.05)  # latency 策略下把单次请求先分给无样本候选的概率，用于获取首批样本
 
     # 其他外部能力
     hyperbrowser_api_key: Optional[str] = Field(default=None, alias="HYPERBROWSER_API_KEY")
 
+    # RAG 检索参数
+    rag_bm25_k1: float = Field(default=1.2)
+    rag_bm25_b: float = Field(default=0.75)
+    rag_embedding_dim: int = Field(default=256)
+    rag_vector_metric: str = Field(default="cosine")  # cosine / dot
+    rag_vector_mode: str = Field(default="exact")  # exact / ivf（大 KB 建议 ivf）
+    rag_ivf_nlist: int = Field(default=1024)
+    rag_ivf_nprobe: int = Field(default=16)
+    rag_ivf_min_vectors: int = Field(default=50000)
+    rag_fusion: str = Field(default="rrf")  # rrf / weighted
+    rag_fusion_depth: int = Field(default=2)  # 每路召回 top_k * depth 个候选参与融合
+    rag_rrf_k: int = Field(default=60)
+    rag_bm25_weight: float = Field(default=1.0)
+    rag_vector_weight: float = Field(default=1.0)
+    # 单路置信阈值（归一化分数）：达到即短路，不等另一路；设为 >1 可关闭短路
+    rag_bm25_confident: float = Field(default=0.6)
+    rag_vector_confident: float = Field(default=0.9)
+    rag_search_workers: int = Field(default=8)
+    rag_ingest_batch: int = Field(default=256)  # 每批写入索引的 chunk 数
+    rag_ingest_queue: int = Field(default=16)  # 上传端与导入管线之间的缓冲块数
+    rag_reindex_workers: int = Field(default=0)  # 重建索引进程数，0 表示使用 CPU 核数
+    rag_reindex_batch: int = Field(default=512)
+    rag_reindex_stale: float = Field(default=600.0)  # 进行中任务的心跳超过该秒数未更新视为 worker 已退出，允许重新提交
+    rag_cache_size: int = Field(default=4096)  # 检索结果缓存条数，0 关闭
+    rag_cache_ttl: float = Field(default=300.0)
+    rag_rerank_candidates: int = Field(default=3)  # 召回 top_k * N 个候选进入重排
+    rag_rerank_batch: int = Field(default=32)
+    rag_rerank_budget_ms: float = Field(default=50.0)  # 默认重排延迟预算，0 表示不限
+    rag_context_tokens: int = Field(default=1024)  # 传给 LLM 的上下文 token 预算
+    rag_dedup_threshold: float = Field(default=0.8)  # MinHash 估计 Jaccard 达到即视为近重复
+    rag_data_dir: str = Field(default="./data/kb")  # 索引段/WAL 存放目录，为空时索引只在内存中
+    rag_segment_flush_docs: int = Field(default=10000)  # 内存写缓冲达到该 chunk 数时落盘为段
+    rag_max_segments: int = Field(default=8)  # 段数超过该值时后台合并
+
+    # Workflow 引擎
+    workflow_run_concurrency: int = Field(default=8)  # 单个运行内同时执行的节点数
+    workflow_global_concurrency: int = Field(default=64)  # 进程内所有运行同时执行的节点数
+    workflow_run_cache_size: int = Field(default=1024)  # 内存中缓存的已结束/挂起运行数
+    workflow_run_cache_ttl: float = Field(default=600.0)
+    workflow_plan_cache_size: int = Field(default=256)  # 按规格哈希缓存的已编译执行计划数
+    workflow_node_timeout: float = Field(default=300.0)  # 节点单次尝试的默认超时（秒），0 为不限
+    workflow_node_retries: int = Field(default=0)  # 节点失败后的默认重试次数
+    workflow_retry_backoff: float = Field(default=1.0)  # 首次重试前的退避秒数（指数增长，带抖动）
+    workflow_retry_backoff_max: float = Field(default=30.0)
+    workflow_event_queue_size: int = Field(default=1000)  # 每个 SSE 订阅者的事件积压上限，溢出后重发快照
+    workflow_event_heartbeat: float = Field(default=15.0)  # SSE 心跳间隔（秒），保持连接并及时发现断开
+
+    # 工具执行运行时
+    tool_global_concurrency: int = Field(default=128)  # 进程内同时执行的工具调用总数
+    tool_default_concurrency: int = Field(default=16)  # 未配置 max_concurrency 的工具的并发上限
+    tool_worker_threads: int = Field(default=16)  # 同步本地函数的线程池大小
+    tool_timeout: float = Field(default=30.0)  # 单次工具调用的默认超时（秒）
+    tool_http_max_connections: int = Field(default=100)
+    # HTTP 后端允许访问的主机（逗号分隔，".example.com" 匹配其子域）；为空时允许任意主机，但拒绝回环/内网/链路本地地址字面量
+    tool_http_allowed_hosts: str = Field(default="")
+    tool_batch_concurrency: int = Field(default=16)  # 批量调用中同时执行的调用数
+    tool_batch_max_items: int = Field(default=1000)  # 单次批量调用的参数组上限
+
     # 可选的缓存/队列等
     redis_url: str = Field(default="redis://localhost:6379/0")
 
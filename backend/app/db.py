@@ -23,8 +23,17 @@ ENGINE = create_engine(_get_db_url(), future=True)
 SessionLocal = sessionmaker(bind=ENGINE, autoflush=False, autocommit=False, future=True)
 
 
+def get_db():
+    # FastAPI 依赖：每个请求一个会话，结束后关闭
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
 def init_db() -> None:
-    from .models import AgentModel  # noqa: F401 引入以创建表
+    from .models import AgentModel, KnowledgeBaseModel, IndexJobModel, WorkflowRunModel, NodeRunModel  # noqa: F401 引入以创建表
     Base.metadata.create_all(bind=ENGINE)
 
 
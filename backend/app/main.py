@@ -4,6 +4,7 @@
 说明：仅包含最小可运行骨架，后续将逐步接入 SSE、Agent 路由与第三方能力。
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from loguru import logger
 from .config import settings
@@ -17,10 +18,23 @@ from fastapi.exceptions import RequestValidationError
 from fastapi import HTTPException
 from .otel import setup_otel
 from .db import init_db
+from .clients import tencent as tencent_client
+from .services import tool_runtime
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 应用级共享的出站连接池：启动时创建，关闭时释放
+    app.state.tencent_client = tencent_client.open_client()
+    try:
+        yield
+    finally:
+        await tencent_client.close_client()
+        await tool_runtime.aclose()
 
 
 def create_app() -> FastAPI:
-    app = FastAPI(title=settings.app_name, debug=settings.debug)
+    app = FastAPI(title=settings.app_name, debug=settings.debug, lifespan=lifespan)
 
     # 中间件
     app.middleware("http")(request_id_middleware)
@@ -1,10 +1,10 @@
 """
-文件作用：ORM 模型定义（起步先实现 Agent）。
+文件作用：ORM 模型定义（Agent、知识库元数据、后台任务、Workflow 运行记录）。
 """
 
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import String, Integer, JSON
-from typing import Optional, Dict, Any
+from sqlalchemy import String, Integer, Float, Boolean, JSON, ForeignKey, Index
+from typing import Optional, Dict, List, Any
 from .db import Base
 
 
@@ -19,3 +19,67 @@ class AgentModel(Base):
     metadata_json: Mapped[Dict[str, Any]] = mapped_column("metadata", JSON, default={})
 
 
+class KnowledgeBaseModel(Base):
+    # 只存 KB 元数据；检索索引以段文件形式存放在 rag_data_dir 下
+    __tablename__ = "knowledge_bases"
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    name: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
+    payload: Mapped[Dict[str, Any]] = mapped_column(JSON, default={})
+
+
+class IndexJobModel(Base):
+    # 后台任务（KB 重建索引）状态存库，多 worker 部署下任一 worker 都能查询
+    __tablename__ = "index_jobs"
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    kb: Mapped[str] = mapped_column(String(64), index=True)
+    kind: Mapped[str] = mapped_column(String(32))
+    status: Mapped[str] = mapped_column(String(32))
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    done: Mapped[int] = mapped_column(Integer, default=0)
+    progress: Mapped[float] = mapped_column(Float, default=0.0)
+    error: Mapped[Optional[str]] = mapped_column(String(2000), nullable=True)
+    created_at: Mapped[float] = mapped_column(Float)
+    updated_at: Mapped[float] = mapped_column(Float)  # 心跳：执行中的 worker 每批更新
+    finished_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    # 进行中时等于 kb、结束后置空；唯一约束保证同一 KB 同时只有一个进行中的任务（NULL 不参与唯一性）
+    active_kb: Mapped[Optional[str]] = mapped_column(String(64), nullable=True, unique=True)
+
+
+class WorkflowRunModel(Base):
+    __tablename__ = "workflow_runs"
+    # (workflow_id, created_at) 支撑按工作流的键集分页；status 支撑按状态筛选（如待审批）
+    __table_args__ = (
+        Index("ix_workflow_runs_workflow_created", "workflow_id", "created_at"),
+        Index("ix_workflow_runs_status", "status"),
+    )
+    id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    workflow_id: Mapped[str] = mapped_column(String(64))
+    status: Mapped[str] = mapped_column(String(32))
+    created_at: Mapped[float] = mapped_column(Float)
+    started_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    finished_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(String(2000), nullable=True)
+    # 启动时的规格快照，挂起后据此恢复
+    spec: Mapped[Dict[str, Any]] = mapped_column(JSON, default={})
+    spec_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    # 回放来源运行与强制重算起点
+    replay_of: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    from_node: Mapped[Optional[str]] = mapped_column(String(200), nullable=True)
+
+
+class NodeRunModel(Base):
+    __tablename__ = "workflow_node_runs"
+    run_id: Mapped[str] = mapped_column(String(64), ForeignKey("workflow_runs.id"), primary_key=True)
+    node_id: Mapped[str] = mapped_column(String(200), primary_key=True)
+    position: Mapped[int] = mapped_column(Integer)
+    type: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    status: Mapped[str] = mapped_column(String(32))
+    depends_on: Mapped[List[str]] = mapped_column(JSON, default=[])
+    output: Mapped[Optional[Any]] = mapped_column(JSON, nullable=True)
+    error: Mapped[Optional[str]] = mapped_column(String(2000), nullable=True)
+    # sha256(节点定义 + 上游输出)，回放时据此判断能否复用
+    input_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    memoized: Mapped[bool] = mapped_column(Boolean, default=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    started_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    finished_at: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
@@ -5,12 +5,21 @@
 import time
 from typing import Callable
 from fastapi import Request
-from prometheus_client import Counter, Histogram, REGISTRY, generate_latest, CollectorRegistry, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, generate_latest, CollectorRegistry, CONTENT_TYPE_LATEST
 from starlette.responses import Response
 
 
 HTTP_REQUESTS = Counter('http_requests_total', 'HTTP 请求数量', ['method', 'path', 'status'])
 HTTP_LATENCY = Histogram('http_request_duration_seconds', 'HTTP 请求耗时', ['method', 'path'])
+RAG_CACHE_HITS = Counter('rag_query_cache_hits_total', 'KB 检索缓存命中数')
+RAG_CACHE_MISSES = Counter('rag_query_cache_misses_total', 'KB 检索缓存未命中数')
+TCLOUD_IN_FLIGHT = Gauge('tcloud_http_requests_in_flight', '腾讯云客户端在途请求数')
+TCLOUD_LATENCY = Histogram('tcloud_http_request_duration_seconds', '腾讯云客户端请求耗时', ['action', 'status'])
+TCLOUD_TTFT = Histogram('tcloud_stream_first_token_seconds', '腾讯云流式响应首 token 耗时', ['action'])
+TCLOUD_RETRIES = Counter('tcloud_retries_total', '腾讯云客户端重试次数', ['action', 'code'])
+TCLOUD_HEDGES = Counter('tcloud_hedged_requests_total', '腾讯云客户端对冲请求数', ['action', 'outcome'])
+TCLOUD_BREAKER_STATE = Gauge('tcloud_circuit_state', '腾讯云熔断器状态（0 关闭 / 1 半开 / 2 打开）', ['endpoint'])
+TCLOUD_BREAKER_REJECTED = Counter('tcloud_circuit_rejected_total', '熔断期间被快速失败的请求数', ['endpoint'])
 
 
 async def metrics_handler() -> Response:
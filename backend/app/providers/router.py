@@ -1,11 +1,43 @@
 """
-文件作用：Provider Router 占位，按策略选择模型与多模态提供商。
+文件作用：Provider Router，按策略与实时表现选择 LLM 提供方/模型，并维护各候选的记分板。
+
+设计要点：
+- 候选：tencentcloud_deepseek_model 为首选，llm_fallback_models 依次为备选。所有候选是同一提供方、
+  同一 Endpoint 上的不同模型，因此记分板只给模型打分，不给提供方打分：提供方整体故障由客户端按
+  Endpoint 共享的熔断器处理，对所有候选一视同仁，不参与候选之间的排序。
+- 记分板：每个 (提供方, 模型) 保留最近 llm_latency_window 个耗时样本（滚动分布，查询时计算分位数与直方图）
+  和错误率 EWMA。流式调用的耗时取首 token 时间，即用户感知的等待。只有可重试类失败
+  （连接/超时/5xx/限流）计入错误率，参数错误等业务错误不代表提供方不健康。
+- 错误率在没有新样本时按 llm_error_half_life 衰减，被判为不健康而不再分到流量的候选过一段时间会
+  重新变得可选，相当于自动探测恢复；再次失败则立即回到不健康。
+- 健康：错误率低于 llm_unhealthy_error_rate。熔断器状态只在记分板中展示（circuit 字段），
+  打开时换哪个候选结果都一样，不据此判不健康。
+- 策略：cost 固定使用首选模型；latency 在健康候选中按 p95 从低到高。无样本的候选（新加入的模型）
+  取已测候选 p95 的中位数作为中性先验，不会凭空排在所有已测候选之前而吃掉全部流量；另以
+  llm_explore_rate 的概率把单次请求先分给一个无样本候选，使其逐步获得样本。
+  availability 按配置顺序取第一个健康候选。后两者在流式调用首 token 之前出现
+  模型级的可重试失败（超时/5xx/限流等）时切换到下一个候选，探测新候选或某个模型突然故障都不会把
+  错误暴露给用户；熔断（CircuitOpen）与连接失败属于 Endpoint 级故障，下一个候选同样会失败，直接抛出。
+  不健康的候选总是排在健康候选之后（按错误率），全部不健康时仍返回错误率最低者而不是直接拒绝。
 """
 
+import random
+import statistics
+import time
 from dataclasses import dataclass
-from typing import Optional
+from threading import RLock
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import httpx
+from loguru import logger
+from ..clients.resilience import CLOSED, LatencyWindow, breakers
+from ..clients.tencent import TencentCloudClient, TencentCloudError
 from ..config import settings
-from dataclasses import replace
+
+POLICIES = ("cost", "latency", "availability")
+# Endpoint 级失败：所有候选共用同一 Endpoint，换模型无济于事，不切换候选、也不计入模型错误率
+_ENDPOINT_ERRORS = ("CircuitOpen", "ConnectError")
+# 记分板直方图的桶上界（秒）
+_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
 
 
 @dataclass
@@ -15,22 +47,176 @@ class ProviderChoice:
     endpoint: Optional[str] = None
 
 
+class _Score:
+    """单个候选的滚动耗时分布 + 错误率 EWMA。"""
+
+    def __init__(self) -> None:
+        self.latency = LatencyWindow(settings.llm_latency_window)
+        self.errors = 0.0
+        self.stamp = time.monotonic()
+        self.calls = 0
+        self.failures = 0
+
+    def error_rate(self, now: float) -> float:
+        return self.errors * 0.5 ** ((now - self.stamp) / settings.llm_error_half_life)
+
+    def observe(self, ok: bool, seconds: Optional[float]) -> None:
+        now = time.monotonic()
+        rate = self.error_rate(now)
+        self.errors = rate + settings.llm_error_ewma_alpha * ((0.0 if ok else 1.0) - rate)
+        self.stamp = now
+        self.calls += 1
+        if ok:
+            if seconds is not None:
+                self.latency.observe(seconds)
+        else:
+            self.failures += 1
+
+
+_SCORES: Dict[Tuple[str, str], _Score] = {}
+_LOCK = RLock()
+
+
+def candidates() -> List[ProviderChoice]:
+    models = [settings.tencentcloud_deepseek_model]
+    for model in settings.llm_fallback_models.split(","):
+        model = model.strip()
+        if model and model not in models:
+            models.append(model)
+    return [ProviderChoice(name="tencentcloud", model=m, endpoint=settings.tencentcloud_lke_endpoint) for m in models]
+
+
+def _score(choice: ProviderChoice) -> _Score:
+    with _LOCK:
+        score = _SCORES.get((choice.name, choice.model))
+        if score is None:
+            score = _SCORES[(choice.name, choice.model)] = _Score()
+        return score
+
+
+def record(choice: ProviderChoice, ok: bool, seconds: Optional[float] = None) -> None:
+    """记录一次调用结果；seconds 为成功调用的耗时（流式为首 token 时间）。"""
+    with _LOCK:
+        _score(choice).observe(ok, seconds)
+
+
+def _circuit(choice: ProviderChoice) -> str:
+    # 熔断器按 Endpoint 的 host 共享（见 TencentCloudClient），同一 Endpoint 的候选状态相同；尚未发起过请求时视为关闭
+    endpoint = choice.endpoint or ""
+    host = httpx.URL(endpoint if "://" in endpoint else f"https://{endpoint}").netloc.decode("ascii")
+    state = breakers().get(host)
+    return state["state"] if state else CLOSED
+
+
+def rank(task: str, policy: str = "cost") -> List[ProviderChoice]:
+    """按策略返回候选的优先顺序（至少一个）；未知策略按 cost 处理。"""
+    choices = candidates()
+    if policy not in ("latency", "availability"):
+        return choices
+    now = time.monotonic()
+    healthy: List[Tuple[float, int, ProviderChoice]] = []
+    unhealthy: List[Tuple[float, int, ProviderChoice]] = []
+    unsampled: List[int] = []
+    with _LOCK:
+        p95s = {i: _score(c).latency.quantile(0.95) for i, c in enumerate(choices)}
+        for i, choice in enumerate(choices):
+            rate = _score(choice).error_rate(now)
+            if rate >= settings.llm_unhealthy_error_rate:
+                unhealthy.append((rate, i, choice))
+            else:
+                healthy.append((0.0, i, choice))
+                if p95s[i] is None:
+                    unsampled.append(i)
+    if policy == "latency":
+        # 无样本候选取已测健康候选 p95 的中位数作先验；都没有样本时按配置顺序
+        measured = [p95s[i] for _, i, _ in healthy if p95s[i] is not None]
+        prior = statistics.median(measured) if measured else 0.0
+        healthy = [(prior if p95s[i] is None else p95s[i], i, c) for _, i, c in healthy]
+        if unsampled and measured and random.random() < settings.llm_explore_rate:
+            # 探测：本次请求先给一个无样本候选，失败时仍会按排序切换到其余候选
+            first = random.choice(unsampled)
+            healthy = [(-1.0 if i == first else v, i, c) for v, i, c in healthy]
+    return [c for _, _, c in sorted(healthy, key=lambda t: t[:2])] + [c for _, _, c in sorted(unhealthy, key=lambda t: t[:2])]
+
+
 def choose_llm(task: str, policy: str = "cost") -> ProviderChoice:
-    """占位动态策略：按策略返回不同提供商/模型。
+    """按策略选择提供方/模型：
 
-    - cost：偏向低成本（默认 DeepSeek 占位）
-    - latency：可切至本地/区域近的提供商（占位返回相同）
-    - availability：可按健康度降级（占位返回相同）
+    - cost：偏向低成本（配置的首选模型）
+    - latency：健康候选中近期 p95 耗时最低者（无样本候选按已测中位数计，偶尔被探测）
+    - availability：按配置顺序的第一个健康候选
     """
-    choice = ProviderChoice(
-        name="tencentcloud",
-        model=settings.tencentcloud_deepseek_model,
-        endpoint=settings.tencentcloud_lke_endpoint,
-    )
-    if policy == "latency":
-        return replace(choice)
-    if policy == "availability":
-        return replace(choice)
-    return choice
+    return rank(task, policy)[0]
+
+
+async def stream_chat(
+    client: TencentCloudClient,
+    messages: List[Dict[str, str]],
+    task: str = "chat",
+    policy: Optional[str] = None,
+    model: Optional[str] = None,
+) -> AsyncIterator[str]:
+    """经路由的流式对话：指定 model 时直接使用，否则按策略选择，并把结果计入记分板。
+
+    latency/availability 策略下，首 token 之前的模型级可重试失败会切换到下一个候选；
+    Endpoint 级失败（熔断/连接失败）与已产出 token 后的失败直接抛出。
+    """
+    policy = policy or settings.llm_routing_policy
+    if model:
+        choices = [ProviderChoice(name="tencentcloud", model=model, endpoint=client.endpoint)]
+    else:
+        choices = rank(task, policy)
+        if policy not in ("latency", "availability"):
+            choices = choices[:1]
+    for i, choice in enumerate(choices):
+        start = time.perf_counter()
+        started = False
+        try:
+            async for delta in client.stream_chat(messages, choice.model):
+                if not started:
+                    record(choice, True, time.perf_counter() - start)
+                    started = True
+                yield delta
+            if not started:
+                record(choice, True, time.perf_counter() - start)
+            return
+        except TencentCloudError as e:
+            model_failure = e.retriable and not e.code.startswith(_ENDPOINT_ERRORS)
+            if model_failure and not started:
+                record(choice, False)
+            if started or not model_failure or i == len(choices) - 1:
+                raise
+            logger.warning("[Router] {} failed before first token ({}), failing over to {}", choice.model, e.code, choices[i + 1].model)
 
 
+def scoreboard() -> List[Dict[str, Any]]:
+    """记分板快照：各候选模型的样本数、p50/p95、耗时直方图、错误率与健康状态；circuit 为所在 Endpoint 的共享熔断器状态。"""
+    now = time.monotonic()
+    out = []
+    with _LOCK:
+        for choice in candidates():
+            score = _score(choice)
+            samples = score.latency.ordered()
+            histogram, j = [], 0
+            for bound in _BUCKETS:
+                while j < len(samples) and samples[j] <= bound:
+                    j += 1
+                histogram.append({"le": "+Inf" if bound == float("inf") else bound, "count": j})
+            rate = score.error_rate(now)
+            circuit = _circuit(choice)
+            p50, p95 = score.latency.quantile(0.5), score.latency.quantile(0.95)
+            out.append({
+                "name": choice.name,
+                "model": choice.model,
+                "endpoint": choice.endpoint,
+                "samples": len(samples),
+                "p50_ms": None if p50 is None else round(p50 * 1000, 1),
+                "p95_ms": None if p95 is None else round(p95 * 1000, 1),
+                "histogram": histogram,
+                "error_rate": round(rate, 4),
+                "calls": score.calls,
+                "failures": score.failures,
+                "circuit": circuit,
+                "healthy": rate < settings.llm_unhealthy_error_rate,
+            })
+    return out
@@ -3,30 +3,26 @@
 """
 
 import asyncio
+import json
 import uuid
-from typing import List
-from fastapi import APIRouter, HTTPException, Depends
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from ..schemas.agent import Agent, AgentCreate, AgentUpdate
 from ..auth import require_roles
 from ..security import dlp_check, prompt_injection_guard
 from .tools import DB as TOOL_DB
-from jsonschema import validate as jsonschema_validate, ValidationError
+from ..clients.tencent import TencentCloudClient, TencentCloudError, get_tencent_client
+from ..providers import router as provider_router
+from ..services import tool_runtime, validators
 from sqlalchemy.orm import Session
-from ..db import SessionLocal
+from ..db import get_db
 from ..models import AgentModel
 
 
 router = APIRouter(prefix="/agents", tags=["agents"])
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-
 @router.get("", response_model=List[Agent])
 def list_agents(db: Session = Depends(get_db)):
     rows = db.query(AgentModel).all()
@@ -89,32 +85,90 @@ def bind_tool(agent_id: str, tool_id: str, user=Depends(require_roles("basic")),
     return Agent(id=r.id, name=r.name, description=r.description, system_prompt=r.system_prompt, model=r.model, version=r.version, metadata=meta)
 
 
-async def _run_stream(agent: Agent):
+def _sse(event: Dict[str, Any]) -> str:
+    return f"data: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+
+async def _run_stream(
+    agent: Agent,
+    client: TencentCloudClient,
+    prompt: Optional[str] = None,
+    policy: Optional[str] = None,
+    tool_args: Optional[Dict[str, Dict[str, Any]]] = None,
+):
     tools = list(agent.metadata.get("tools", []))
     if not tools:
-        for i in range(3):
-            yield f"data: {{\"agent_id\": \"{agent.id}\", \"delta\": \"step {i+1}\"}}\n\n"
-            await asyncio.sleep(0.4)
+        if not client.configured:
+            # 未配置提供方密钥：保留占位输出，便于本地联调
+            for i in range(3):
+                yield _sse({"agent_id": agent.id, "delta": f"step {i+1}"})
+                await asyncio.sleep(0.4)
+            return
+        messages = [{"Role": "system", "Content": agent.system_prompt}] if agent.system_prompt else []
+        messages.append({"Role": "user", "Content": prompt or ""})
+        # 逐 token 转发：每收到一段增量立即作为一条 SSE 事件写出，不做缓冲
+        try:
+            # Agent 指定了 model 时固定使用，否则由 Provider Router 按策略选择
+            async for delta in provider_router.stream_chat(client, messages, "agent", policy, agent.model):
+                yield _sse({"agent_id": agent.id, "delta": delta})
+        except TencentCloudError as e:
+            yield _sse({"agent_id": agent.id, "error": str(e)})
         return
+    calls = []
+    tool_args = tool_args or {}
     for tid in tools:
         tool = TOOL_DB.get(tid)
         if not tool:
-            yield f"data: {{\"warning\": \"tool {tid} not found\"}}\n\n"
+            yield _sse({"warning": f"tool {tid} not found"})
             continue
-        args = {}
-        try:
-            jsonschema_validate(instance=args, schema=tool.schema or {"type": "object"})
-            yield f"data: {{\"tool\": \"{tool.name}\", \"status\": \"validated\"}}\n\n"
-        except ValidationError as e:
-            yield f"data: {{\"tool\": \"{tool.name}\", \"error\": \"{e.message}\"}}\n\n"
-        await asyncio.sleep(0.3)
+        # 只调用调用方提供了参数的工具，不以空参数臆造调用真实后端
+        args = tool_args.get(tid)
+        if args is None:
+            yield _sse({"tool": tool.name, "status": "skipped", "reason": "no arguments provided"})
+            continue
+        error = validators.validation_error(validators.tool_validator(tid, tool.schema), args)
+        if error is None:
+            yield _sse({"tool": tool.name, "status": "validated"})
+            calls.append((tool, args))
+        else:
+            yield _sse({"tool": tool.name, "error": error})
+    # 同一步内的工具调用相互独立：并行扇出，按完成顺序推送，步骤耗时取决于最慢的工具
+    async for i, result in tool_runtime.as_completed(calls):
+        name = calls[i][0].name
+        if isinstance(result, tool_runtime.ToolError):
+            event = {"tool": name, "error": str(result)}
+        else:
+            event = {"tool": name, "status": "done", "result": result}
+        yield _sse(event)
 
 
 @router.get("/{agent_id}/run")
-async def run_agent(agent_id: str):
-    agent = DB.get(agent_id)
-    if not agent:
-        raise HTTPException(status_code=404, detail="Agent not found")
-    return StreamingResponse(_run_stream(agent), media_type="text/event-stream")
+async def run_agent(
+    agent_id: str,
+    prompt: Optional[str] = None,
+    policy: Optional[str] = None,
+    tool_args: Optional[str] = Query(default=None, description='JSON 对象：{"<tool_id>": {参数}}，未提供参数的工具不调用'),
+    db: Session = Depends(get_db),
+    client: TencentCloudClient = Depends(get_tencent_client),
+):
+    if policy is not None and policy not in provider_router.POLICIES:
+        raise HTTPException(status_code=400, detail=f"policy must be one of {', '.join(provider_router.POLICIES)}")
+    args = _parse_tool_args(tool_args)
+    dlp_check(prompt)
+    prompt_injection_guard(prompt)
+    agent = await run_in_threadpool(get_agent, agent_id, db)
+    return StreamingResponse(_run_stream(agent, client, prompt, policy, args), media_type="text/event-stream")
+
+
+def _parse_tool_args(raw: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    if not raw:
+        return {}
+    try:
+        parsed = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="tool_args must be valid JSON")
+    if not isinstance(parsed, dict) or not all(isinstance(v, dict) for v in parsed.values()):
+        raise HTTPException(status_code=400, detail="tool_args must map tool ids to argument objects")
+    return parsed
 
 
@@ -1,12 +1,15 @@
 """
-文件作用：Conversation 路由（CRUD 与 /messages SSE 占位）。
+文件作用：Conversation 路由（CRUD 与 /messages SSE 逐 token 流式回复）。
 """
 
 import asyncio
+import json
 import uuid
-from typing import List
-from fastapi import APIRouter, HTTPException
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse
+from ..clients.tencent import TencentCloudClient, TencentCloudError, get_tencent_client
+from ..providers import router as provider_router
 from ..schemas.conversation import Conversation, ConversationCreate, Message
 
 
@@ -46,17 +49,33 @@ def append_message(conv_id: str, msg: Message):
     return conv
 
 
-async def _msg_stream(conv: Conversation):
-    for i in range(3):
-        yield f"data: {{\"conversation_id\": \"{conv.id}\", \"delta\": \"msg {i+1}\"}}\n\n"
-        await asyncio.sleep(0.4)
+async def _msg_stream(conv: Conversation, client: TencentCloudClient, policy: Optional[str] = None):
+    if not client.configured:
+        # 未配置提供方密钥：保留占位输出，便于本地联调
+        for i in range(3):
+            yield f"data: {{\"conversation_id\": \"{conv.id}\", \"delta\": \"msg {i+1}\"}}\n\n"
+            await asyncio.sleep(0.4)
+        return
+    messages = [{"Role": m.role, "Content": m.content} for m in conv.messages if m.role in ("system", "user", "assistant")]
+    parts: List[str] = []
+    # 逐 token 转发：每收到一段增量立即写出；完整回复仅在结束后拼接一次写入会话
+    try:
+        async for delta in provider_router.stream_chat(client, messages, "chat", policy):
+            parts.append(delta)
+            yield f"data: {json.dumps({'conversation_id': conv.id, 'delta': delta}, ensure_ascii=False)}\n\n"
+    except TencentCloudError as e:
+        yield f"data: {json.dumps({'conversation_id': conv.id, 'error': str(e)}, ensure_ascii=False)}\n\n"
+        return
+    conv.messages.append(Message(id=str(uuid.uuid4()), role="assistant", content="".join(parts)))
 
 
 @router.get("/{conv_id}/messages")
-async def stream_messages(conv_id: str):
+async def stream_messages(conv_id: str, policy: Optional[str] = None, client: TencentCloudClient = Depends(get_tencent_client)):
+    if policy is not None and policy not in provider_router.POLICIES:
+        raise HTTPException(status_code=400, detail=f"policy must be one of {', '.join(provider_router.POLICIES)}")
     conv = DB.get(conv_id)
     if not conv:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    return StreamingResponse(_msg_stream(conv), media_type="text/event-stream")
+    return StreamingResponse(_msg_stream(conv, client, policy), media_type="text/event-stream")
 
 
@@ -1,58 +1,91 @@
 """
-文件作用：知识库（KB）路由（CRUD、文档上载、重建索引占位）。
+文件作用：知识库（KB）路由（CRUD、文档上载、重建索引）。KB 元数据存数据库，索引数据见 services/kbstore。
 """
 
+import asyncio
 import uuid
 from typing import List, Dict, Any, Optional
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from ..services import rag
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..db import SessionLocal, get_db
+from ..models import KnowledgeBaseModel
+from ..observability import RAG_CACHE_HITS, RAG_CACHE_MISSES
+from ..services import ingest, jobs, rag
+from ..services.chunker import chunk_text
 from ..security import dlp_check, prompt_injection_guard
 
 
 router = APIRouter(prefix="/kb", tags=["kb"])
 
-DB: dict[str, Dict[str, Any]] = {}
+# 已确认存在的 KB：KB 不可删除，命中后检索/导入无需每次查库
+_KNOWN: set = set()
+
+
+def _to_dict(r: KnowledgeBaseModel) -> Dict[str, Any]:
+    return {"id": r.id, **(r.payload or {})}
+
+
+def _ensure_kb(kid: str) -> None:
+    if kid in _KNOWN:
+        return
+    with SessionLocal() as db:
+        if db.get(KnowledgeBaseModel, kid) is None:
+            raise HTTPException(status_code=404, detail="KB not found")
+    _KNOWN.add(kid)
 
 
 @router.get("", response_model=List[Dict[str, Any]])
-def list_kb():
-    return list(DB.values())
+def list_kb(db: Session = Depends(get_db)):
+    return [_to_dict(r) for r in db.query(KnowledgeBaseModel).all()]
 
 
 @router.post("", response_model=Dict[str, Any])
-def create_kb(payload: Dict[str, Any]):
+def create_kb(payload: Dict[str, Any], db: Session = Depends(get_db)):
     kid = str(uuid.uuid4())
-    kb = {"id": kid, **payload}
-    DB[kid] = kb
-    return kb
+    name = payload.get("name")
+    row = KnowledgeBaseModel(id=kid, name=str(name) if name is not None else None, payload=payload)
+    db.add(row)
+    db.commit()
+    return _to_dict(row)
 
 
 @router.get("/{kid}", response_model=Dict[str, Any])
-def get_kb(kid: str):
-    kb = DB.get(kid)
-    if not kb:
+def get_kb(kid: str, db: Session = Depends(get_db)):
+    r = db.get(KnowledgeBaseModel, kid)
+    if not r:
         raise HTTPException(status_code=404, detail="KB not found")
-    return kb
+    return _to_dict(r)
 
 
 @router.post("/{kid}/documents")
 def upload_doc(kid: str, meta: Dict[str, Any]):
-    if kid not in DB:
-        raise HTTPException(status_code=404, detail="KB not found")
+    _ensure_kb(kid)
     return {"kb": kid, "uploaded": True, "meta": meta}
 
 
 @router.post("/{kid}/reindex")
 def reindex(kid: str):
-    if kid not in DB:
-        raise HTTPException(status_code=404, detail="KB not found")
-    return {"kb": kid, "index_job": str(uuid.uuid4())}
+    _ensure_kb(kid)
+    job = jobs.start_reindex(kid)
+    return {"kb": kid, "index_job": job["id"], "status": job["status"]}
+
+
+@router.get("/{kid}/reindex/{job_id}")
+def reindex_status(kid: str, job_id: str):
+    job = jobs.get_job(job_id)
+    if not job or job["kb"] != kid:
+        raise HTTPException(status_code=404, detail="Index job not found")
+    return job
 
 
 class IngestRequest(BaseModel):
     text: str
-    chunk_size: int = 500
+    # 分块 token 预算与相邻块重叠 token 数
+    max_tokens: int = Field(default=256, ge=8)
+    overlap_tokens: int = Field(default=32, ge=0)
     # 多源导入占位参数（Python 3.9 兼容 Optional 写法）
     source: Optional[str] = None  # e.g. notion/confluence/gdrive
     permission_tag: Optional[str] = None  # 权限标签占位
@@ -60,24 +93,83 @@ class IngestRequest(BaseModel):
 
 @router.post("/{kid}/documents/ingest")
 def ingest_text(kid: str, body: IngestRequest):
-    if kid not in DB:
-        raise HTTPException(status_code=404, detail="KB not found")
-    # 占位：简单分段
+    _ensure_kb(kid)
+    # 整篇导入：命中 DLP/注入则整体拒绝，之后与流式导入共用 分块 → 索引 管线
     dlp_check(body.text)
     prompt_injection_guard(body.text)
-    chunks = [body.text[i:i+body.chunk_size] for i in range(0, len(body.text), body.chunk_size)]
-    reranked = rag.rerank(chunks)
-    compact = rag.compress(reranked)
-    return {"kb": kid, "chunks": len(chunks), "preview": compact[:200], "source": body.source, "permission_tag": body.permission_tag}
+    stats = ingest.new_stats()
+    chunks = chunk_text(body.text, body.max_tokens, body.overlap_tokens)
+    ingest.index_stream(kid, chunks, stats, settings.rag_ingest_batch)
+    return {"kb": kid, "chunks": stats["chunks"], "preview": stats["preview"], "source": body.source, "permission_tag": body.permission_tag}
+
+
+@router.post("/{kid}/documents/ingest/stream")
+async def ingest_stream(
+    kid: str,
+    request: Request,
+    max_tokens: int = Query(default=256, ge=8),
+    overlap_tokens: int = Query(default=32, ge=0),
+    source: Optional[str] = None,
+):
+    """流式导入：请求体为纯文本（分块上传）或 NDJSON（Content-Type 含 ndjson，每行 {"text": ...}）。"""
+    await run_in_threadpool(_ensure_kb, kid)
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+    src = ingest.QueueSource(settings.rag_ingest_queue)
+    stats = ingest.new_stats()
+
+    def consume() -> Dict[str, Any]:
+        try:
+            return ingest.run_stream(kid, src, max_tokens, overlap_tokens, ndjson, settings.rag_ingest_batch, stats)
+        finally:
+            src.drain()
+
+    job = asyncio.ensure_future(run_in_threadpool(consume))
+    try:
+        async for data in request.stream():
+            if job.done():
+                break
+            if data:
+                await run_in_threadpool(src.queue.put, data)
+    finally:
+        await run_in_threadpool(src.queue.put, None)
+    try:
+        await job
+    except (ValueError, UnicodeError) as e:
+        # 出错前已写入的批次保留在 KB 中（不回滚），告知调用方已写入多少，便于从出错处续传或清理
+        raise HTTPException(status_code=400, detail={
+            "message": f"Invalid ingest stream: {e}",
+            "kb": kid,
+            "indexed_chunks": stats["chunks"],
+            "records": stats["records"],
+        })
+    return {"kb": kid, "source": source, **stats}
 
 
 @router.get("/{kid}/search")
-def kb_search(kid: str, q: str):
-    if kid not in DB:
-        raise HTTPException(status_code=404, detail="KB not found")
-    # 混检占位
-    items = rag.hybrid_retrieve(q)
-    reranked = rag.rerank(items)
-    return {"kb": kid, "query": q, "items": reranked}
-
-
+def kb_search(kid: str, q: str, top_k: int = 10, fusion: Optional[str] = None, budget_ms: Optional[float] = Query(default=None, gt=0)):
+    _ensure_kb(kid)
+    # 缓存键含索引版本：导入/重建后版本递增，旧结果不再命中并随 LRU/TTL 淘汰
+    key = (kid, rag.normalize_query(q), rag.get_index(kid).version, top_k, fusion or settings.rag_fusion, budget_ms)
+    cached = rag.QUERY_CACHE.get(key)
+    if cached is not None:
+        RAG_CACHE_HITS.inc()
+        return {"kb": kid, "query": q, **cached}
+    RAG_CACHE_MISSES.inc()
+    # 混检：BM25 倒排 + 向量，按 chunk_id 融合；多召回一些候选交给重排
+    hits = rag.hybrid_search(kid, q, top_k * settings.rag_rerank_candidates, fusion)
+    texts = [rag.get_chunk(kid, cid) for cid, _ in hits]
+    order = rag.rerank(q, texts, budget_ms)[:top_k]
+    result = {
+        "items": [texts[i] for i in order],
+        "hits": [{"id": hits[i][0], "score": hits[i][1]} for i in order],
+    }
+    rag.QUERY_CACHE.set(key, result)
+    return {"kb": kid, "query": q, **result}
+
+
+@router.get("/{kid}/context")
+def kb_context(kid: str, q: str, top_k: int = 10, max_tokens: Optional[int] = Query(default=None, ge=1)):
+    """检索并压缩为可直接拼入提示词的上下文。"""
+    result = kb_search(kid, q, top_k, fusion=None, budget_ms=None)
+    context = rag.compress(result["items"], q, max_tokens)
+    return {"kb": kid, "query": q, "context": context, "chunks": len(result["items"])}
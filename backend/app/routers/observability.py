@@ -1,19 +1,17 @@
 """
 文件作用：可观测性与计费只读占位接口。
+Prometheus 指标由 main.py 注册的 /metrics 提供（observability.metrics_handler），这里不再定义同名路由。
 """
 
 from fastapi import APIRouter
+from ..config import settings
 from ..audit_store import list_events
+from ..providers import router as provider_router
 
 
 router = APIRouter(prefix="", tags=["observability", "billing"])
 
 
-@router.get("/metrics")
-def get_metrics():
-    return {"latency_p95_ms": 1200, "success_rate": 0.92, "token_usage": 123456}
-
-
 @router.get("/traces")
 def get_traces():
     return {"traces": []}
@@ -24,6 +22,12 @@ def get_audits():
     return {"events": list_events()}
 
 
+@router.get("/providers/scoreboard")
+def get_provider_scoreboard():
+    """LLM 提供方实时记分板（滚动耗时分布、错误率 EWMA、熔断状态）。"""
+    return {"policy": settings.llm_routing_policy, "providers": provider_router.scoreboard()}
+
+
 @router.get("/usage")
 def get_usage():
     return {"requests": 1000, "tokens": 500000}
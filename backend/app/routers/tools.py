@@ -1,12 +1,16 @@
 """
-文件作用：工具（函数调用）路由（CRUD、/test、/invoke 占位）。
+文件作用：工具（函数调用）路由（CRUD、/test、/invoke 与 /invoke:batch 经 services/tool_runtime 执行）。
 """
 
+import json
 import uuid
-from typing import List, Dict, Any
+from typing import AsyncIterator, List, Dict, Any
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from ..config import settings
 from ..schemas.tool import Tool, ToolCreate, ToolUpdate
-from jsonschema import validate as jsonschema_validate, ValidationError
+from ..services import tool_runtime, validators
+from jsonschema import SchemaError
 
 
 router = APIRouter(prefix="/tools", tags=["tools"])
@@ -19,10 +23,23 @@ def list_tools():
     return list(DB.values())
 
 
+def _compile(tool: Tool) -> None:
+    # 保存时即编译校验器并检查后端配置：非法配置直接拒绝，首次调用也无需再编译
+    try:
+        validators.tool_validator(tool.id, tool.schema)
+    except SchemaError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid tool schema: {e.message}")
+    try:
+        tool_runtime.check_backend(tool.backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid tool backend: {e}")
+
+
 @router.post("", response_model=Tool)
 def create_tool(payload: ToolCreate):
     tool_id = str(uuid.uuid4())
     tool = Tool(id=tool_id, **payload.model_dump())
+    _compile(tool)
     DB[tool_id] = tool
     return tool
 
@@ -43,6 +60,9 @@ def update_tool(tool_id: str, payload: ToolUpdate):
     data = tool.model_dump()
     data.update({k: v for k, v in payload.model_dump(exclude_unset=True).items() if v is not None})
     updated = Tool(**data)
+    validators.invalidate(tool_id)
+    tool_runtime.forget(tool_id)
+    _compile(updated)
     DB[tool_id] = updated
     return updated
 
@@ -51,6 +71,8 @@ def update_tool(tool_id: str, payload: ToolUpdate):
 def delete_tool(tool_id: str):
     if tool_id in DB:
         del DB[tool_id]
+        validators.invalidate(tool_id)
+        tool_runtime.forget(tool_id)
     return {"deleted": True}
 
 
@@ -60,14 +82,49 @@ def test_tool(payload: Dict[str, Any]):
 
 
 @router.post("/{tool_id}/invoke")
-def invoke_tool(tool_id: str, args: Dict[str, Any]):
+async def invoke_tool(tool_id: str, args: Dict[str, Any]):
     tool = DB.get(tool_id)
     if not tool:
         raise HTTPException(status_code=404, detail="Tool not found")
+    error = validators.validation_error(validators.tool_validator(tool_id, tool.schema), args)
+    if error is not None:
+        raise HTTPException(status_code=400, detail=f"Schema validation failed: {error}")
     try:
-        jsonschema_validate(instance=args, schema=tool.schema or {"type": "object"})
-    except ValidationError as e:
-        raise HTTPException(status_code=400, detail=f"Schema validation failed: {e.message}")
-    return {"tool": tool_id, "args": args, "result": "placeholder"}
-
-
+        result = await tool_runtime.invoke(tool, args)
+    except tool_runtime.ToolError as e:
+        raise HTTPException(status_code=502, detail=f"Tool failed: {e}")
+    return {"tool": tool_id, "args": args, "result": result}
+
+
+def _ndjson(item: Dict[str, Any]) -> str:
+    return json.dumps(item, ensure_ascii=False, default=str) + "\n"
+
+
+async def _batch_stream(tool: Tool, items: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    # 同一个已编译校验器校验全部参数组；不合法的立即返回错误行，不进入执行
+    validator = validators.tool_validator(tool.id, tool.schema)
+    calls, index = [], []
+    for i, args in enumerate(items):
+        error = validators.validation_error(validator, args)
+        if error is not None:
+            yield _ndjson({"index": i, "error": f"Schema validation failed: {error}"})
+        else:
+            calls.append((tool, args))
+            index.append(i)
+    # 按完成顺序逐行返回；客户端断开时未完成的调用随生成器关闭被取消
+    async for j, result in tool_runtime.as_completed(calls, limit=settings.tool_batch_concurrency):
+        if isinstance(result, tool_runtime.ToolError):
+            yield _ndjson({"index": index[j], "error": f"Tool failed: {result}"})
+        else:
+            yield _ndjson({"index": index[j], "result": result})
+
+
+@router.post("/{tool_id}/invoke:batch")
+async def invoke_tool_batch(tool_id: str, items: List[Dict[str, Any]]):
+    """批量调用：请求体为参数对象数组，结果以 NDJSON 流式返回（每行 {"index", "result" | "error"}，按完成顺序）。"""
+    tool = DB.get(tool_id)
+    if not tool:
+        raise HTTPException(status_code=404, detail="Tool not found")
+    if len(items) > settings.tool_batch_max_items:
+        raise HTTPException(status_code=400, detail=f"Batch too large (max {settings.tool_batch_max_items} items)")
+    return StreamingResponse(_batch_stream(tool, items), media_type="application/x-ndjson")
@@ -1,11 +1,19 @@
 """
-文件作用：Workflow 路由（CRUD、/run、/replay 占位）。
+文件作用：Workflow 路由（CRUD、/run 后台执行、/replay 记忆化回放）。
+
+说明：创建/更新时即把规格编译为执行计划（services/workflow.compile_spec），非法图返回 400；
+/run 直接使用已编译的计划，不再解析规格。
 """
 
+import json
 import uuid
-from typing import List, Dict, Any
-from fastapi import APIRouter, HTTPException
+from typing import AsyncIterator, List, Dict, Any, Optional
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from ..config import settings
 from ..services import workflow as wf
+from ..services.pubsub import LAGGED
 from ..auth import require_abac
 from fastapi import Depends
 
@@ -13,6 +21,8 @@ from fastapi import Depends
 router = APIRouter(prefix="/workflows", tags=["workflows"])
 
 DB: dict[str, Dict[str, Any]] = {}
+# 工作流 ID -> 当前版本的已编译计划
+PLANS: Dict[str, wf.Plan] = {}
 
 
 @router.get("", response_model=List[Dict[str, Any]])
@@ -20,12 +30,28 @@ def list_workflows():
     return list(DB.values())
 
 
+def _save(wid: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    spec = {**payload, "id": wid}
+    try:
+        plan = wf.compile_spec(spec)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid workflow: {e}")
+    DB[wid] = spec
+    PLANS[wid] = plan
+    return spec
+
+
 @router.post("", response_model=Dict[str, Any])
 def create_workflow(payload: Dict[str, Any]):
-    wid = str(uuid.uuid4())
-    wf = {"id": wid, **payload}
-    DB[wid] = wf
-    return wf
+    return _save(str(uuid.uuid4()), payload)
+
+
+@router.put("/{wid}", response_model=Dict[str, Any])
+def update_workflow(wid: str, payload: Dict[str, Any]):
+    # 整体替换；进行中的运行使用启动时的规格快照，不受影响
+    if wid not in DB:
+        raise HTTPException(status_code=404, detail="Workflow not found")
+    return _save(wid, payload)
 
 
 @router.get("/{wid}", response_model=Dict[str, Any])
@@ -36,31 +62,42 @@ def get_workflow(wid: str):
     return wf
 
 
+def _start(wid: str, replay_of: Optional[str] = None, from_node: Optional[str] = None) -> Dict[str, Any]:
+    try:
+        return wf.start_run(wid, PLANS[wid], replay_of, from_node)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid workflow: {e}")
+
+
 @router.post("/{wid}/run", dependencies=[Depends(require_abac("workflow", "create"))])
-def run_workflow(wid: str):
+async def run_workflow(wid: str):
+    # 异步端点：在事件循环内提交后台执行，立即返回 run_id，进度通过 /workflows/runs/{run_id} 查询
     if wid not in DB:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    spec = DB[wid]
-    run = wf.start_run(wid, spec)
-    return run
+    return _start(wid)
 
 
 @router.post("/{wid}/replay", dependencies=[Depends(require_abac("workflow", "create"))])
-def replay_workflow(wid: str, run_id: str):
+async def replay_workflow(wid: str, run_id: str, from_node: Optional[str] = None):
+    """回放：复用旧运行中输入与定义未变的节点输出；指定 from_node 时从该节点起（含下游）强制重算。"""
     if wid not in DB:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    old = wf.get_run(run_id)
-    if not old:
+    old = await run_in_threadpool(wf.get_run, run_id)
+    if not old or old["workflow_id"] != wid:
         raise HTTPException(status_code=404, detail="Run not found")
-    run = wf.start_run(wid, DB[wid])
-    return {"replay_of": run_id, **run}
+    return _start(wid, run_id, from_node)
 
 
-@router.get("/{wid}/runs", response_model=List[Dict[str, Any]])
-def list_workflow_runs(wid: str):
+@router.get("/{wid}/runs", response_model=Dict[str, Any])
+def list_workflow_runs(wid: str, limit: int = Query(default=50, ge=1, le=200), cursor: Optional[str] = None):
+    """按创建时间倒序分页；把返回的 next_cursor 作为 cursor 传入获取下一页。"""
     if wid not in DB:
         raise HTTPException(status_code=404, detail="Workflow not found")
-    return wf.list_runs(wid)
+    try:
+        items, next_cursor = wf.list_runs(wid, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": items, "next_cursor": next_cursor}
 
 
 @router.get("/runs/{run_id}", response_model=Dict[str, Any])
@@ -71,15 +108,71 @@ def get_workflow_run(run_id: str):
     return run
 
 
-@router.post("/runs/{run_id}/approve", dependencies=[Depends(require_abac("workflow", "update"))])
-def approve_run_node(run_id: str, node_id: str):
-    run = wf.get_run(run_id)
-    if not run:
+_FINAL = ("completed", "failed", "cancelled")
+
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+def _run_view(run: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in run.items() if k != "spec"}
+
+
+async def _run_events(run_id: str) -> AsyncIterator[str]:
+    """先订阅再取快照，二者之间的变化不会丢失；之后逐条推送节点/运行事件，运行结束即关闭。"""
+    with wf.subscribe(run_id) as sub:
+        run = await run_in_threadpool(wf.get_run, run_id)
+        if run is None:
+            return
+        yield _sse("snapshot", _run_view(run))
+        if run["status"] in _FINAL:
+            return
+        while True:
+            event = await sub.get(timeout=settings.workflow_event_heartbeat)
+            if event is None:
+                # 心跳注释行：保持代理连接，断开的客户端在写入时被发现
+                yield ": keep-alive\n\n"
+            elif event is LAGGED:
+                # 积压溢出，丢失的事件以最新快照补齐
+                run = await run_in_threadpool(wf.get_run, run_id)
+                yield _sse("snapshot", _run_view(run))
+                if run["status"] in _FINAL:
+                    return
+            else:
+                kind, data = event
+                yield _sse(kind, data)
+                if kind == "run" and data["status"] in _FINAL:
+                    return
+
+
+@router.get("/runs/{run_id}/events")
+async def stream_workflow_run(run_id: str):
+    """SSE：推送运行进度（snapshot / node / run 事件），替代轮询 /workflows/runs/{run_id}。"""
+    if not await run_in_threadpool(wf.get_run, run_id):
         raise HTTPException(status_code=404, detail="Run not found")
-    for n in run.get("nodes", []):
-        if n.get("node") == node_id and n.get("type") == "approval":
-            n["status"] = "approved"
-            return {"ok": True, "run": run_id, "node": node_id}
-    raise HTTPException(status_code=404, detail="Approval node not found")
+    return StreamingResponse(_run_events(run_id), media_type="text/event-stream")
 
 
+@router.post("/runs/{run_id}/approve", dependencies=[Depends(require_abac("workflow", "update"))])
+async def approve_run_node(run_id: str, node_id: str):
+    # 异步端点：恢复执行需在事件循环内提交
+    try:
+        await wf.approve_node(run_id, node_id, {"approved": True})
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Run or approval node not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"ok": True, "run": run_id, "node": node_id}
+
+
+@router.post("/runs/{run_id}/cancel", dependencies=[Depends(require_abac("workflow", "update"))])
+async def cancel_workflow_run(run_id: str):
+    # 调度中的运行异步结束（status 为 cancelling），结果以 /workflows/runs/{run_id} 为准
+    try:
+        status = await wf.cancel_run(run_id)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Run not found")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"ok": True, "run": run_id, "status": status}
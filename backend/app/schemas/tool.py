@@ -10,6 +10,10 @@ class ToolBase(BaseModel):
     name: str = Field(min_length=1)
     description: Optional[str] = None
     schema: Dict[str, Any] = {}
+    # 执行后端：{"type": "http", "url": ...} 或 {"type": "local", "function": ...}，为空时返回占位结果
+    backend: Dict[str, Any] = {}
+    max_concurrency: Optional[int] = Field(default=None, ge=1)  # 该工具同时执行的调用数上限
+    rate_limit: Optional[float] = Field(default=None, gt=0)  # 每秒调用数上限
 
 
 class ToolCreate(ToolBase):
@@ -19,6 +23,9 @@ class ToolCreate(ToolBase):
 class ToolUpdate(BaseModel):
     description: Optional[str] = None
     schema: Optional[Dict[str, Any]] = None
+    backend: Optional[Dict[str, Any]] = None
+    max_concurrency: Optional[int] = Field(default=None, ge=1)
+    rate_limit: Optional[float] = Field(default=None, gt=0)
 
 
 class Tool(ToolBase):
@@ -16,18 +16,22 @@ PROMPT_INJECTION_HINTS = [
 ]
 
 
-def dlp_check(text: Optional[str]) -> None:
-    if not text:
-        return
-    if SENSITIVE_REGEX.search(text):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="DLP policy violation")
+def dlp_violation(text: Optional[str]) -> bool:
+    return bool(text) and SENSITIVE_REGEX.search(text) is not None
 
 
-def prompt_injection_guard(text: Optional[str]) -> None:
+def prompt_injection_detected(text: Optional[str]) -> bool:
     if not text:
-        return
+        return False
     lower = text.lower()
-    if any(h in lower for h in PROMPT_INJECTION_HINTS):
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Prompt injection detected")
+    return any(h in lower for h in PROMPT_INJECTION_HINTS)
 
 
+def dlp_check(text: Optional[str]) -> None:
+    if dlp_violation(text):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="DLP policy violation")
+
+
+def prompt_injection_guard(text: Optional[str]) -> None:
+    if prompt_injection_detected(text):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Prompt injection detected")
@@ -0,0 +1,198 @@
+"""
+文件作用：BM25 倒排索引（增量写入 + Max-Score 剪枝的 Top-K 查询）。
+
+设计要点：
+- 倒排表按词项存放 (doc, tf) 两个紧凑 array，doc 为递增整数，天然有序，便于二分跳转。
+- 每个词项增量维护 max_tf 与 min_len，可 O(1) 得到该词项得分上界，无需随 avgdl 变化重算。
+- 查询采用 Max-Score（DAAT）：按上界把词项分为“必要/非必要”两组，只在必要词项上
+  枚举候选文档，非必要词项按需二分探查；阈值抬升后大量长倒排被跳过，延迟不随语料线性增长。
+"""
+
+import math
+from array import array
+from bisect import bisect_left
+from heapq import heappush, heapreplace, nlargest
+from itertools import accumulate
+from threading import RLock
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class _Postings:
+    __slots__ = ("docs", "tfs", "max_tf", "min_len")
+
+    def __init__(self) -> None:
+        self.docs = array("I")
+        self.tfs = array("I")
+        self.max_tf = 0
+        self.min_len = 0
+
+
+class BM25Index:
+    """单个 KB 的 BM25 倒排索引，线程安全。"""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, _Postings] = {}
+        self._doc_len = array("I")
+        self._chunk_ids: List[str] = []
+        self._total_len = 0
+        # IDF 只依赖 (N, df)，写入后整体失效，查询时按需回填
+        self._idf: Dict[str, float] = {}
+        self._lock = RLock()
+
+    def __len__(self) -> int:
+        return len(self._chunk_ids)
+
+    def add(self, chunk_id: str, tokens: Sequence[str]) -> None:
+        self.add_many([(chunk_id, tokens)])
+
+    def add_many(self, items: Iterable[Tuple[str, Sequence[str]]]) -> None:
+        with self._lock:
+            for chunk_id, tokens in items:
+                doc = len(self._chunk_ids)
+                dl = len(tokens)
+                self._chunk_ids.append(chunk_id)
+                self._doc_len.append(dl)
+                self._total_len += dl
+                tf: Dict[str, int] = {}
+                for t in tokens:
+                    tf[t] = tf.get(t, 0) + 1
+                for t, n in tf.items():
+                    p = self._postings.get(t)
+                    if p is None:
+                        p = self._postings[t] = _Postings()
+                        p.min_len = dl
+                    p.docs.append(doc)
+                    p.tfs.append(n)
+                    if n > p.max_tf:
+                        p.max_tf = n
+                    if dl < p.min_len:
+                        p.min_len = dl
+            self._idf.clear()
+
+    @property
+    def total_len(self) -> int:
+        return self._total_len
+
+    def df(self, term: str) -> int:
+        p = self._postings.get(term)
+        return len(p.docs) if p is not None else 0
+
+    def export(self) -> Tuple[List[str], array, Dict[str, Tuple[array, array]]]:
+        """导出 (chunk_ids, doc_len, {term: (docs, tfs)}) 快照，用于落盘为不可变段。"""
+        with self._lock:
+            postings = {t: (array("I", p.docs), array("I", p.tfs)) for t, p in self._postings.items()}
+            return list(self._chunk_ids), array("I", self._doc_len), postings
+
+    def _term_idf(self, term: str, p: _Postings) -> float:
+        idf = self._idf.get(term)
+        if idf is None:
+            n, df = len(self._chunk_ids), len(p.docs)
+            idf = self._idf[term] = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        return idf
+
+    def _upper_bound(self, idf: float, p: _Postings, avgdl: float) -> float:
+        # tf 越大、文档越短得分越高，故 (max_tf, min_len) 组合给出安全上界
+        tf = p.max_tf
+        return idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * p.min_len / avgdl))
+
+    def max_possible(self, terms: Iterable[str]) -> float:
+        """查询理论满分（tf→∞ 时各词项得分之和），用于把 BM25 分数归一化到 [0, 1)。"""
+        with self._lock:
+            n = len(self._chunk_ids)
+            total = 0.0
+            for t in set(terms):
+                p = self._postings.get(t)
+                # 未出现的词项按 df=0 计入，缺词的查询因此难以被判定为“高置信”
+                idf = self._term_idf(t, p) if p is not None else math.log(1.0 + (n + 0.5) / 0.5)
+                total += idf * (self.k1 + 1)
+            return total
+
+    def search(
+        self,
+        terms: Iterable[str],
+        top_k: int = 10,
+        idf: Optional[Dict[str, float]] = None,
+        avgdl: Optional[float] = None,
+    ) -> List[Tuple[str, float]]:
+        """返回 [(chunk_id, score)]，按得分降序。
+
+        idf/avgdl 由调用方传入时使用全局统计（多段联合检索），否则使用本索引自身统计。
+        """
+        with self._lock:
+            n = len(self._chunk_ids)
+            if not n or top_k <= 0:
+                return []
+            if avgdl is None:
+                avgdl = (self._total_len / n) or 1.0
+            lists = []
+            for t in set(terms):
+                p = self._postings.get(t)
+                if p is not None:
+                    w = idf[t] if idf is not None else self._term_idf(t, p)
+                    lists.append((self._upper_bound(w, p, avgdl), w, p))
+            if not lists:
+                return []
+            k1p1 = self.k1 + 1
+            norm_base = self.k1 * (1 - self.b)
+            norm_scale = self.k1 * self.b / avgdl
+            doc_len = self._doc_len
+            if len(lists) == 1:
+                # 单词项无可剪枝：直接整表打分后取 Top-K，省去游标调度开销
+                _, w, p = lists[0]
+                scored = nlargest(top_k, zip(
+                    (w * tf * k1p1 / (tf + norm_base + norm_scale * doc_len[d]) for d, tf in zip(p.docs, p.tfs)),
+                    p.docs,
+                ))
+                return [(self._chunk_ids[d], s) for s, d in scored]
+            # 上界升序：前缀和 prefix[i] 表示前 i+1 个词项最多能贡献的分数
+            lists.sort(key=lambda x: x[0])
+            prefix = list(accumulate(x[0] for x in lists))
+            m = len(lists)
+            cursors = [0] * m
+            heap: List[Tuple[float, int]] = []
+            threshold = 0.0
+            first = 0  # lists[:first] 为非必要词项：其上界之和不足以进入 Top-K
+
+            while first < m:
+                cand = -1
+                for i in range(first, m):
+                    docs = lists[i][2].docs
+                    c = cursors[i]
+                    if c < len(docs) and (cand < 0 or docs[c] < cand):
+                        cand = docs[c]
+                if cand < 0:
+                    break
+                norm = norm_base + norm_scale * doc_len[cand]
+                score = 0.0
+                for i in range(first, m):
+                    _, w, p = lists[i]
+                    c = cursors[i]
+                    if c < len(p.docs) and p.docs[c] == cand:
+                        tf = p.tfs[c]
+                        score += w * tf * k1p1 / (tf + norm)
+                        cursors[i] = c + 1
+                for i in range(first - 1, -1, -1):
+                    if score + prefix[i] <= threshold:
+                        break
+                    _, w, p = lists[i]
+                    c = cursors[i] = bisect_left(p.docs, cand, cursors[i])
+                    if c < len(p.docs) and p.docs[c] == cand:
+                        tf = p.tfs[c]
+                        score += w * tf * k1p1 / (tf + norm)
+
+                if len(heap) < top_k:
+                    heappush(heap, (score, cand))
+                    if len(heap) < top_k:
+                        continue
+                elif score > threshold:
+                    heapreplace(heap, (score, cand))
+                else:
+                    continue
+                threshold = heap[0][0]
+                while first < m and prefix[first] <= threshold:
+                    first += 1
+
+            heap.sort(reverse=True)
+            return [(self._chunk_ids[d], s) for s, d in heap]
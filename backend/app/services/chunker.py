@@ -0,0 +1,191 @@
+"""
+文件作用：语义感知、按 token 预算的分块器（替代按固定字符数切片）。
+
+设计要点：
+- 单遍扫描：用正则在缓冲区上定位句子/段落边界，句子以 (起点, 终点, token 数) 的位置元组记录，
+  只有真正产出 chunk 时才切一次片，不做逐段复制。
+- token 预算：句子累加到 max_tokens 前切块；段落结束且已达半个预算时提前切块，尽量不跨段落。
+- 重叠窗口：切块后保留尾部不超过 overlap_tokens 的整句作为下一块开头，提升跨块召回。
+- 超长句（单句超过预算）退化为按 token 边界硬切：每个窗口 max_tokens 个 token，相邻窗口重叠
+  overlap_tokens 个，保证每块都不超预算。硬切是增量的：一旦确知句子已超过预算就逐窗口产出，
+  不必等到句末，因此没有句子/段落边界的输入（日志、base64 等）也不会无限缓冲。
+- 超长单词/符号串（_MAX_TOKEN_CHARS * max_tokens 个字符内不足 max_tokens 个 token）按字符切出单独成块。
+- 支持流式 feed：未完结的最后一句留在缓冲区，已消费前缀定期压缩，缓冲区大小与文档总长无关。
+  跨 feed 的边界从缓冲区尾部可能属于边界的字符处续扫，而不是回退固定字符数。
+- 一次性分块与流式分块走同一套增量逻辑，且每个切分决定只依赖已确定属于当前句的文本，
+  因此同一文本无论如何分段 feed，产出的 chunk 都相同（/kb 导入与 NDJSON 流式导入索引一致）。
+"""
+
+import re
+from collections import deque
+from typing import Deque, Iterable, Iterator, Tuple
+from .tokenizer import token_spans
+
+# 段落（空行）或句末标点（含中英文，及其后的引号/括号与空白）视为句子边界
+_BOUNDARY_RE = re.compile(r"\n[ \t]*\n\s*|[。！？!?；;…]+[”’」』）)\"']*\s*|\.(?=\s)\s*")
+
+# 可能出现在边界中的字符（空白之外）；续扫时从缓冲区尾部这些字符组成的连续段开头开始
+_BOUNDARY_CHARS = frozenset("。！？!?；;….”’」』）)\"'")
+# 单个 token 的字符数估计上限：句内连续这么多倍 max_tokens 个字符仍不足预算（超长单词、无 token 的符号串）时按字符硬切
+_MAX_TOKEN_CHARS = 64
+
+_Sentence = Tuple[int, int, int]  # (start, end, tokens)
+
+
+class Chunker:
+    def __init__(self, max_tokens: int = 256, overlap_tokens: int = 32) -> None:
+        self.max_tokens = max(1, max_tokens)
+        self.overlap_tokens = max(0, min(overlap_tokens, self.max_tokens // 2))
+        self._buf = ""
+        self._sents: Deque[_Sentence] = deque()  # 当前块内的句子（含上一块带来的重叠句）
+        self._tokens = 0
+        self._fresh = 0  # 自上次产出后新加入的句子数；为 0 时当前块只有重叠内容，不应产出
+        self._pending = 0  # 尚未完结句子的起点（硬切中为下一个窗口的起点）
+        self._scan = 0
+        self._hard = False  # 当前句已确知超预算，正在逐窗口硬切
+
+    def feed(self, text: str) -> Iterator[str]:
+        if not text:
+            return
+        self._buf += text
+        self._scan = max(self._pending, self._scan)
+        for m in _BOUNDARY_RE.finditer(self._buf, self._scan):
+            if m.end() == len(self._buf):
+                # 触及缓冲区末尾的边界可能尚未完整（如后续还有空行），等更多输入再判定
+                self._scan = m.start()
+                break
+            yield from self._advance(m.end(), True, m.group().count("\n") >= 2)
+        else:
+            # 边界可能跨越两次 feed（如 "\n " + " \n"）：从尾部可能属于边界的字符段开头续扫
+            self._scan = self._tail_start()
+        # 之后的边界只可能从 _scan 开始，其前的文本确定属于当前句
+        yield from self._advance(self._scan, False, False)
+        self._compact()
+
+    def flush(self) -> Iterator[str]:
+        if self._buf[self._pending:].strip():
+            yield from self._advance(len(self._buf), True, True)
+        self._pending = len(self._buf)
+        if self._fresh:
+            yield self._emit()
+        self._buf, self._sents, self._tokens, self._fresh, self._pending, self._scan = "", deque(), 0, 0, 0, 0
+        self._hard = False
+
+    def _tail_start(self) -> int:
+        i = len(self._buf)
+        while i > self._pending and (self._buf[i - 1].isspace() or self._buf[i - 1] in _BOUNDARY_CHARS):
+            i -= 1
+        return i
+
+    def _advance(self, end: int, final: bool, paragraph_end: bool) -> Iterator[str]:
+        # 处理当前句 [_pending, end)：final 表示 end 为句末，否则 end 之前的文本确定属于当前句、句末在其后。
+        # 非 final 时只做已能确定的切分（字符硬切、后面确知还有 token 的完整窗口），其余等更多输入
+        char_limit = self.max_tokens * _MAX_TOKEN_CHARS
+        step = self.max_tokens - self.overlap_tokens
+        while True:
+            start = self._pending
+            # 少于 max_tokens 个字符既凑不满预算也到不了字符上限，无需计数
+            if not final and end - start <= self.max_tokens:
+                return
+            if start + char_limit <= end:
+                spans = token_spans(self._buf, start, start + char_limit, limit=self.max_tokens + 1)
+                if len(spans) <= self.max_tokens:
+                    # 超长单词/符号串：按字符切出的片段单独成块（无 token 则丢弃），不进入句子窗口
+                    if self._fresh:
+                        yield self._emit()
+                    self._sents.clear()
+                    self._tokens = 0
+                    self._hard = False
+                    if spans:
+                        yield self._buf[start: start + char_limit]
+                    self._pending = start + char_limit
+                    continue
+            else:
+                spans = token_spans(self._buf, start, end, limit=self.max_tokens + 1)
+            if len(spans) > self.max_tokens:
+                # 句子超预算：产出一个完整窗口（其后还有 token，第 max_tokens 个 token 必然完整），下一窗口重叠 overlap_tokens
+                if not self._hard:
+                    if self._fresh:
+                        yield self._emit()
+                    self._sents.clear()
+                    self._tokens = 0
+                    self._hard = True
+                yield self._buf[spans[0][0]: spans[self.max_tokens - 1][1]]
+                self._pending = spans[step][0]
+                continue
+            if not final:
+                return
+            if self._hard:
+                # 最后一个窗口：除去与上一窗口的重叠后仍有新 token 才产出
+                if len(spans) > self.overlap_tokens:
+                    yield self._buf[spans[0][0]: spans[-1][1]]
+                self._hard = False
+            else:
+                yield from self._add_sentence(start, end, paragraph_end, len(spans))
+            self._pending = end
+            return
+
+    def _add_sentence(self, start: int, end: int, paragraph_end: bool, n: int) -> Iterator[str]:
+        # n 为句子 token 数，不超过 max_tokens（超预算的句子由 _advance 硬切）
+        if not n:
+            if paragraph_end and self._fresh and self._tokens * 2 >= self.max_tokens:
+                yield self._emit()
+            return
+        while self._sents and self._tokens + n > self.max_tokens:
+            if self._fresh:
+                yield self._emit()
+            else:
+                _, _, dropped = self._sents.popleft()
+                self._tokens -= dropped
+        self._sents.append((start, end, n))
+        self._tokens += n
+        self._fresh += 1
+        if paragraph_end and self._tokens * 2 >= self.max_tokens:
+            yield self._emit()
+
+    def _emit(self) -> str:
+        chunk = self._buf[self._sents[0][0]: self._sents[-1][1]].strip()
+        # 保留尾部整句作为重叠；至少丢弃一句，保证窗口前进
+        kept = 0
+        keep = 0
+        for _, _, n in reversed(self._sents):
+            if kept + n > self.overlap_tokens or keep + 1 >= len(self._sents):
+                break
+            kept += n
+            keep += 1
+        for _ in range(len(self._sents) - keep):
+            self._sents.popleft()
+        self._tokens = kept
+        self._fresh = 0
+        return chunk
+
+    def _compact(self) -> None:
+        # 已产出的前缀超过缓冲区一半时整体左移，摊还 O(1)
+        keep_from = self._sents[0][0] if self._sents else self._pending
+        if keep_from and keep_from * 2 >= len(self._buf):
+            self._buf = self._buf[keep_from:]
+            self._sents = deque((s - keep_from, e - keep_from, n) for s, e, n in self._sents)
+            self._pending -= keep_from
+            self._scan = max(0, self._scan - keep_from)
+
+
+def split_sentences(text: str) -> Iterator[Tuple[int, int]]:
+    """按句子边界切分，返回各句 (start, end) 位置；不做切片复制。"""
+    start = 0
+    for m in _BOUNDARY_RE.finditer(text):
+        if text[start:m.end()].strip():
+            yield start, m.end()
+        start = m.end()
+    if text[start:].strip():
+        yield start, len(text)
+
+
+def chunk_stream(pieces: Iterable[str], max_tokens: int = 256, overlap_tokens: int = 32) -> Iterator[str]:
+    chunker = Chunker(max_tokens, overlap_tokens)
+    for piece in pieces:
+        yield from chunker.feed(piece)
+    yield from chunker.flush()
+
+
+def chunk_text(text: str, max_tokens: int = 256, overlap_tokens: int = 32) -> Iterator[str]:
+    return chunk_stream([text], max_tokens, overlap_tokens)
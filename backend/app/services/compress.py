@@ -0,0 +1,101 @@
+"""
+文件作用：RAG 上下文压缩——把检索到的 chunk 打包进固定 token 预算。
+
+步骤：
+1. 近重复去除：对每个 chunk 的 3-gram shingle 计算 MinHash 签名，估计 Jaccard 相似度，
+   与更靠前（排名更高）的 chunk 相似度达到阈值的直接丢弃。
+2. 句级抽取：按查询词重叠度给句子打分（叠加 chunk 名次先验），贪心选取高分句直至预算用尽；
+   输出时恢复原文顺序，保证上下文可读。无查询或无句子命中时退化为按名次整块装箱。
+"""
+
+import zlib
+from typing import List, Optional, Sequence, Set, Tuple
+import numpy as np
+from .chunker import split_sentences
+from .tokenizer import tokenize
+
+_NUM_PERM = 64
+_SHINGLE = 3
+# 大于 2^32 的素数：哈希值与系数均 < 2^32，乘积不会溢出 uint64
+_PRIME = np.uint64(4294967311)
+_RNG = np.random.default_rng(20240501)
+_A = _RNG.integers(1, 2 ** 32, _NUM_PERM, dtype=np.uint64)
+_B = _RNG.integers(0, 2 ** 32, _NUM_PERM, dtype=np.uint64)
+
+
+def minhash(tokens: Sequence[str]) -> np.ndarray:
+    if not tokens:
+        return np.full(_NUM_PERM, np.iinfo(np.uint64).max, dtype=np.uint64)
+    shingles = {" ".join(tokens[i:i + _SHINGLE]) for i in range(max(1, len(tokens) - _SHINGLE + 1))}
+    h = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((np.outer(h, _A) + _B) % _PRIME).min(axis=0)
+
+
+def dedup(chunks: Sequence[str], threshold: float = 0.8) -> List[int]:
+    """返回保留的 chunk 下标（保持原顺序）。"""
+    kept: List[int] = []
+    sigs: List[np.ndarray] = []
+    for i, text in enumerate(chunks):
+        sig = minhash(tokenize(text))
+        if sigs and (np.stack(sigs) == sig).mean(axis=1).max() >= threshold:
+            continue
+        kept.append(i)
+        sigs.append(sig)
+    return kept
+
+
+def compress(chunks: Sequence[str], query: Optional[str] = None, max_tokens: int = 1024, dedup_threshold: float = 0.8) -> str:
+    keep = dedup(chunks, dedup_threshold)
+    q_terms: Set[str] = set(tokenize(query or ""))
+    # (score, chunk 名次, 句起点, 句终点, token 数)
+    sents: List[Tuple[float, int, int, int, int]] = []
+    for rank, ci in enumerate(keep):
+        text = chunks[ci]
+        for start, end in split_sentences(text):
+            toks = tokenize(text[start:end])
+            if not toks:
+                continue
+            overlap = len(q_terms.intersection(toks)) / len(q_terms) if q_terms else 0.0
+            if overlap > 0:
+                sents.append((overlap + 0.1 / (1 + rank), ci, start, end, len(toks)))
+
+    if not sents:
+        return _pack_chunks([chunks[i] for i in keep], max_tokens)
+
+    sents.sort(key=lambda s: -s[0])
+    chosen: List[Tuple[int, int, int]] = []
+    seen: Set[str] = set()
+    used = 0
+    for _, ci, start, end, n in sents:
+        if used + n > max_tokens:
+            continue
+        key = " ".join(chunks[ci][start:end].split())
+        if key in seen:
+            continue
+        seen.add(key)
+        chosen.append((ci, start, end))
+        used += n
+
+    chosen.sort()
+    parts: List[str] = []
+    last_chunk = -1
+    for ci, start, end in chosen:
+        sent = chunks[ci][start:end].strip()
+        if ci == last_chunk:
+            parts[-1] += " " + sent
+        else:
+            parts.append(sent)
+            last_chunk = ci
+    return "\n".join(parts)
+
+
+def _pack_chunks(chunks: Sequence[str], max_tokens: int) -> str:
+    out: List[str] = []
+    used = 0
+    for text in chunks:
+        n = len(tokenize(text))
+        if used + n > max_tokens:
+            continue
+        out.append(text)
+        used += n
+    return "\n".join(out)
@@ -0,0 +1,52 @@
+"""
+文件作用：本地可插拔的文本向量化（Embedding）函数，保证 RAG 在离线环境可运行。
+
+说明：
+- 默认实现为特征哈希（单词 + 相邻词二元组），无模型依赖、跨进程结果稳定（使用 crc32 而非加盐的 hash()）。
+- 生产可通过 set_embedder 替换为本地模型（如 bge/m3e）或远程服务，签名保持 List[str] -> (n, dim) float32。
+"""
+
+import zlib
+from typing import Callable, Optional, Sequence
+import numpy as np
+from .tokenizer import tokenize
+from ..config import settings
+
+Embedder = Callable[[Sequence[str]], np.ndarray]
+
+
+def hashing_embed(texts: Sequence[str], dim: Optional[int] = None) -> np.ndarray:
+    dim = dim or settings.rag_embedding_dim
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        toks = tokenize(text)
+        feats = toks + [a + b for a, b in zip(toks, toks[1:])]
+        for f in feats:
+            h = zlib.crc32(f.encode("utf-8"))
+            # 最高位决定符号，降低哈希碰撞带来的系统性偏差
+            out[row, h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norms = np.linalg.norm(out, axis=1, keepdims=True)
+    np.divide(out, norms, out=out, where=norms > 0)
+    return out
+
+
+_EMBEDDER: Embedder = hashing_embed
+
+
+def get_embedder() -> Embedder:
+    return _EMBEDDER
+
+
+def set_embedder(fn: Embedder) -> None:
+    global _EMBEDDER
+    _EMBEDDER = fn
+
+
+def embed(texts: Sequence[str]) -> np.ndarray:
+    if not texts:
+        return np.zeros((0, settings.rag_embedding_dim), dtype=np.float32)
+    return np.ascontiguousarray(_EMBEDDER(list(texts)), dtype=np.float32)
+
+
+def embed_one(text: str) -> np.ndarray:
+    return embed([text])[0]
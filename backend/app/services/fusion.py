@@ -0,0 +1,33 @@
+"""
+文件作用：多路检索结果融合（RRF 与加权分数归一化），按 chunk_id 合并。
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+Ranking = Sequence[Tuple[str, float]]
+
+
+def rrf_fuse(rankings: Sequence[Ranking], k: int = 60, weights: Optional[Sequence[float]] = None) -> List[Tuple[str, float]]:
+    """Reciprocal Rank Fusion：只依赖名次，不受各路分数量纲影响。"""
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for w, ranking in zip(weights, rankings):
+        for rank, (cid, _) in enumerate(ranking):
+            fused[cid] = fused.get(cid, 0.0) + w / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
+
+
+def weighted_fuse(rankings: Sequence[Ranking], weights: Optional[Sequence[float]] = None) -> List[Tuple[str, float]]:
+    """各路分数 min-max 归一化到 [0, 1] 后加权求和，保留分数差距信息。"""
+    weights = weights or [1.0] * len(rankings)
+    fused: Dict[str, float] = {}
+    for w, ranking in zip(weights, rankings):
+        if not ranking:
+            continue
+        scores = [s for _, s in ranking]
+        lo, hi = min(scores), max(scores)
+        span = hi - lo
+        for cid, s in ranking:
+            norm = (s - lo) / span if span > 0 else 1.0
+            fused[cid] = fused.get(cid, 0.0) + w * norm
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
@@ -0,0 +1,145 @@
+"""
+文件作用：流式文档导入管线（decode → chunk → DLP → tokenize/embed → index）。
+
+设计要点：
+- 各阶段均为生成器，逐块向下游传递；任一时刻内存中只保留一个网络块、一个分块缓冲与一个写入批次，
+  RSS 与上传文件大小无关。
+- 上传端（asyncio）与管线（工作线程）之间用有界队列衔接，队列满时上传端等待，形成背压。
+- 流式导入无法像整篇导入那样整体拒绝，命中 DLP/提示注入的 chunk 会被丢弃并计数。
+- 格式错误（非法 JSON、记录不是对象、text 不是字符串）抛 ValueError，由路由返回 400；此前已写入的批次
+  不回滚（整体预校验需要缓存整个上传，违背流式的内存约束），错误响应中带上已写入的 chunk 数。
+"""
+
+import codecs
+import json
+import queue
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from . import rag
+from .chunker import chunk_stream
+from ..security import dlp_violation, prompt_injection_detected
+
+
+class QueueSource:
+    """有界队列数据源：生产者 put 字节块，None 作为结束标记。"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=maxsize)
+        self._closed = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        while not self._closed:
+            item = self.queue.get()
+            if item is None:
+                self._closed = True
+                return
+            yield item
+
+    def drain(self) -> None:
+        # 管线异常退出时继续消费到结束标记，避免生产者阻塞在满队列上
+        for _ in self:
+            pass
+
+
+def decode(byte_chunks: Iterable[bytes], stats: Dict[str, Any], encoding: str = "utf-8") -> Iterator[str]:
+    # 增量解码：多字节字符被网络块截断时由解码器暂存，不会产生乱码
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    for data in byte_chunks:
+        stats["bytes"] += len(data)
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def ndjson_records(pieces: Iterable[str], stats: Dict[str, Any]) -> Iterator[str]:
+    """把 NDJSON 文本流切成记录，每行形如 {"text": "..."}；仅缓存未完结的最后一行。"""
+    carry: List[str] = []
+    for piece in pieces:
+        if "\n" not in piece:
+            # 超长记录跨多个网络块时只追加片段，避免反复拼接字符串
+            carry.append(piece)
+            continue
+        lines = piece.split("\n")
+        carry.append(lines[0])
+        lines[0] = "".join(carry)
+        carry = [lines.pop()]
+        for line in lines:
+            text = _record_text(line)
+            if text:
+                stats["records"] += 1
+                yield text
+    text = _record_text("".join(carry))
+    if text:
+        stats["records"] += 1
+        yield text
+
+
+def _record_text(line: str) -> str:
+    line = line.strip()
+    if not line:
+        return ""
+    obj = json.loads(line)
+    # 每行必须是 {"text": ...} 对象；数字、字符串、数组、null 与非字符串的 text 一样按格式错误处理
+    if not isinstance(obj, dict):
+        raise ValueError(f"record must be a JSON object, got {type(obj).__name__}")
+    text = obj.get("text", "")
+    if not isinstance(text, str):
+        raise ValueError(f"record text must be a string, got {type(text).__name__}")
+    return text
+
+
+def guard(chunks: Iterable[str], stats: Dict[str, Any]) -> Iterator[str]:
+    for chunk in chunks:
+        if dlp_violation(chunk) or prompt_injection_detected(chunk):
+            stats["rejected"] += 1
+            continue
+        yield chunk
+
+
+def batched(items: Iterable[str], size: int) -> Iterator[List[str]]:
+    batch: List[str] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def new_stats() -> Dict[str, Any]:
+    return {"bytes": 0, "records": 0, "chunks": 0, "rejected": 0, "preview": ""}
+
+
+def index_stream(kid: str, chunks: Iterable[str], stats: Dict[str, Any], batch_size: int) -> Dict[str, Any]:
+    """tokenize/embed/index 阶段：按批写入索引，批内完成分词与向量化。"""
+    for batch in batched(chunks, batch_size):
+        if not stats["preview"]:
+            stats["preview"] = batch[0][:200]
+        rag.index_chunks(kid, batch)
+        stats["chunks"] += len(batch)
+    return stats
+
+
+def run_stream(
+    kid: str,
+    byte_chunks: Iterable[bytes],
+    max_tokens: int,
+    overlap_tokens: int,
+    ndjson: bool = False,
+    batch_size: int = 256,
+    stats: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """执行整条导入管线；stats 由调用方传入时，失败后仍可从中读取已写入的 chunk 数。"""
+    stats = new_stats() if stats is None else stats
+    pieces: Iterable[str] = decode(byte_chunks, stats)
+    if ndjson:
+        # 每条记录是独立文档，分块不跨记录边界
+        chunks: Iterable[str] = (
+            c for rec in ndjson_records(pieces, stats) for c in chunk_stream([rec], max_tokens, overlap_tokens)
+        )
+    else:
+        chunks = chunk_stream(pieces, max_tokens, overlap_tokens)
+    return index_stream(kid, guard(chunks, stats), stats, batch_size)
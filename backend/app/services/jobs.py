@@ -0,0 +1,172 @@
+"""
+文件作用：后台任务子系统（当前承载 KB 重建索引 reindex）。
+
+设计要点：
+- 分词与向量化是 CPU 密集型，放进进程池跨核并行；主进程只负责把结果写入新索引。
+- 新索引与旧索引并存（side-by-side），构建期间查询照常走旧索引；完成后由 rag.swap_index 写成新段并原子切换 manifest。
+- 内存有界：旧索引按批流式读取（不整体物化 chunk 列表），提交窗口为 workers * 2 个批次；
+  新索引边建边按 rag_segment_flush_docs 条落盘为段（kbstore.Rebuild），内存中只保留一个未满的 memtable。
+- 任务状态存库（index_jobs），任一 worker 都能查询进度；同一 KB 的进行中任务由 active_kb 唯一约束互斥，
+  多个 worker 同时提交也只会有一个执行重建（索引存储在磁盘上共享）。执行中每批更新心跳，
+  持有任务的 worker 崩溃后，心跳超过 rag_reindex_stale 的任务在下次提交时被标记失败并释放。
+- 进程池使用 spawn 启动，避免在多线程的服务进程中 fork；当前 Embedder 通过 initializer 传给子进程，
+  因此自定义 Embedder 需为可 import 的顶层函数。
+"""
+
+import multiprocessing
+import os
+import time
+import uuid
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import RLock
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from loguru import logger
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from . import rag
+from .embedding import embed, get_embedder, set_embedder
+from .tokenizer import tokenize
+from ..config import settings
+from ..db import SessionLocal
+from ..models import IndexJobModel
+
+# index_jobs.error 列长度；PostgreSQL 等会拒绝超长字符串，写入前截断
+_ERROR_MAX = IndexJobModel.__table__.c.error.type.length or 2000
+_FIELDS = ("kb", "kind", "status", "total", "done", "progress", "error", "created_at", "finished_at")
+_LOCK = RLock()
+_PROCS: Optional[ProcessPoolExecutor] = None
+# 驱动线程：负责切批、收集进程池结果、写入新索引并切换
+_DRIVER = ThreadPoolExecutor(max_workers=2, thread_name_prefix="kb-jobs")
+
+
+def _prepare_batch(texts: List[str]) -> Tuple[List[List[str]], np.ndarray]:
+    # 在子进程中执行：分词 + 向量化
+    return [tokenize(t) for t in texts], embed(texts)
+
+
+def _workers() -> int:
+    return settings.rag_reindex_workers or os.cpu_count() or 1
+
+
+def _get_procs() -> ProcessPoolExecutor:
+    global _PROCS
+    with _LOCK:
+        if _PROCS is None:
+            _PROCS = ProcessPoolExecutor(
+                max_workers=_workers(),
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=set_embedder,
+                initargs=(get_embedder(),),
+            )
+        return _PROCS
+
+
+def _to_dict(r: IndexJobModel) -> Dict[str, Any]:
+    return {"id": r.id, **{k: getattr(r, k) for k in _FIELDS}}
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        r = db.get(IndexJobModel, job_id)
+        return _to_dict(r) if r else None
+
+
+def _update(job_id: str, **fields: Any) -> None:
+    if fields.get("status") in ("completed", "failed"):
+        fields["active_kb"] = None
+    with SessionLocal() as db:
+        db.execute(update(IndexJobModel).where(IndexJobModel.id == job_id).values(updated_at=time.time(), **fields))
+        db.commit()
+
+
+def _prune(db: Any) -> None:
+    # 与审计存储一致：最多保留 1000 条任务记录，优先淘汰最早结束的
+    count = db.query(func.count(IndexJobModel.id)).scalar()
+    if count < 1000:
+        return
+    old = (
+        db.query(IndexJobModel.id)
+        .filter(IndexJobModel.finished_at.isnot(None))
+        .order_by(IndexJobModel.finished_at)
+        .limit(count - 999)
+    )
+    db.query(IndexJobModel).filter(IndexJobModel.id.in_([r.id for r in old])).delete(synchronize_session=False)
+    db.commit()
+
+
+def start_reindex(kid: str) -> Dict[str, Any]:
+    """提交 KB 重建任务；同一 KB 已有进行中的任务（任一 worker 提交）时直接返回该任务。"""
+    now = time.time()
+    with SessionLocal() as db:
+        # 心跳超时的进行中任务：持有它的 worker 已退出，标记失败并释放占位
+        db.execute(
+            update(IndexJobModel)
+            .where(IndexJobModel.active_kb == kid, IndexJobModel.updated_at < now - settings.rag_reindex_stale)
+            .values(status="failed", error="worker lost", finished_at=now, active_kb=None)
+        )
+        db.commit()
+        _prune(db)
+        job = IndexJobModel(
+            id=str(uuid.uuid4()), kb=kid, kind="reindex", status="queued", total=0, done=0, progress=0.0,
+            created_at=now, updated_at=now, active_kb=kid,
+        )
+        db.add(job)
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            running = db.query(IndexJobModel).filter(IndexJobModel.active_kb == kid).one_or_none()
+            if running is not None:
+                return _to_dict(running)
+            # 占位者恰好在此期间结束，重新提交
+            return start_reindex(kid)
+        result = _to_dict(job)
+    _DRIVER.submit(_run_reindex, result["id"], kid)
+    return result
+
+
+def _run_reindex(job_id: str, kid: str) -> None:
+    new = None
+    try:
+        old = rag.get_index(kid)
+        # 按写入顺序流式读取：读到的前 submitted 个之后写入的增量由 swap_index 在切换前追平；
+        # total 为开始时的条数，期间有新写入时进度按已读条数修正
+        chunks = old.iter_chunks()
+        total = len(old)
+        _update(job_id, status="running", total=total)
+        new = old.start_rebuild()
+        batch_size = settings.rag_reindex_batch
+        procs = _get_procs()
+        window = _workers() * 2
+        pending: deque = deque()
+        done = submitted = 0
+
+        def collect() -> None:
+            nonlocal done
+            batch, fut = pending.popleft()
+            tokens, vectors = fut.result()
+            new.add([cid for cid, _ in batch], [t for _, t in batch], tokens, vectors)
+            done += len(batch)
+            _update(job_id, done=done, progress=round(done / max(total, submitted), 4))
+
+        while True:
+            batch = list(islice(chunks, batch_size))
+            if not batch:
+                break
+            submitted += len(batch)
+            pending.append((batch, procs.submit(_prepare_batch, [t for _, t in batch])))
+            if len(pending) >= window:
+                collect()
+        while pending:
+            collect()
+        rag.swap_index(kid, new, submitted)
+        _update(job_id, status="completed", total=submitted, progress=1.0, finished_at=time.time())
+        logger.info("[KB] reindex done kb={} chunks={}", kid, submitted)
+    except Exception as e:
+        logger.error("[KB] reindex failed kb={}: {}", kid, e)
+        if new is not None:
+            new.discard()
+        _update(job_id, status="failed", error=str(e)[:_ERROR_MAX], finished_at=time.time())
@@ -0,0 +1,366 @@
+"""
+文件作用：单个 KB 的检索存储——内存写缓冲（memtable）+ WAL + 不可变内存映射段 + manifest。
+
+设计要点：
+- 写入先追加 WAL（NDJSON，每行 {"id","text"}）再进 memtable；memtable 达到 rag_segment_flush_docs 条时
+  落盘为不可变段并切换到新 WAL。重启只需 mmap 打开各段并重放一个有界的 WAL，秒级恢复。
+- manifest.json 记录段列表与当前 WAL，先写临时文件再 os.replace 原子替换；被替换的段/WAL 在切换后删除。
+- 多个 uvicorn worker 共享同一目录：写入持有 flock 串行化；读取前只做 stat 比较，manifest 变化则重新打开段列表，
+  WAL 增长则追放增量。段文件经 mmap 共享页缓存，各进程只额外持有各自的小 memtable。
+- 段数超过 rag_max_segments 时后台合并为一个段，控制查询扇出。
+- BM25 的 N/avgdl/df 跨 memtable 与各段汇总后统一计算 IDF，分数与单一索引一致。
+- root 为 None 时为纯内存索引（无 WAL/段），用于测试。
+- 重建（Rebuild）边写边落盘：替换内容每满 rag_segment_flush_docs 条写成一个段（尚未进入 manifest，
+  对查询不可见），内存中只有一个未满的 memtable；切换时连同追平的增量一次性发布。
+"""
+
+import fcntl
+import json
+import os
+import shutil
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from heapq import nlargest
+from itertools import islice
+from threading import RLock
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from loguru import logger
+from .bm25 import BM25Index
+from .embedding import embed
+from .segments import Segment, merge_segments, term_hash, write_segment
+from .tokenizer import tokenize
+from .vector_index import VectorIndex
+from ..config import settings
+
+_MANIFEST = "manifest.json"
+# 段合并在后台单线程执行，不阻塞写入与查询
+_MERGER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kb-merge")
+
+
+class _MemTable:
+    """可变部分：BM25 倒排 + 向量索引 + chunk 原文，均在内存中。"""
+
+    def __init__(self) -> None:
+        self.bm25 = BM25Index(k1=settings.rag_bm25_k1, b=settings.rag_bm25_b)
+        self.vectors = VectorIndex(
+            dim=settings.rag_embedding_dim,
+            metric=settings.rag_vector_metric,
+            mode=settings.rag_vector_mode,
+            nlist=settings.rag_ivf_nlist,
+            nprobe=settings.rag_ivf_nprobe,
+            ivf_min_vectors=settings.rag_ivf_min_vectors,
+        )
+        self.chunks: Dict[str, str] = {}
+
+    def add(self, ids: List[str], texts: List[str], tokens: List[List[str]], vectors: np.ndarray) -> None:
+        self.chunks.update(zip(ids, texts))
+        self.bm25.add_many(zip(ids, tokens))
+        self.vectors.add(ids, vectors)
+
+
+def _ivf_nlist(n: int) -> int:
+    if settings.rag_vector_mode != "ivf" or n < settings.rag_ivf_min_vectors:
+        return 0
+    return settings.rag_ivf_nlist
+
+
+class Rebuild:
+    """重建中的替换内容。持久模式下按 rag_segment_flush_docs 条分段落盘，内存占用与 KB 大小无关。"""
+
+    def __init__(self, root: Optional[str]) -> None:
+        self.root = root
+        self.segments: List[Segment] = []
+        self.mem = _MemTable()
+
+    def add(self, ids: List[str], texts: List[str], tokens: List[List[str]], vectors: np.ndarray) -> None:
+        self.mem.add(ids, texts, tokens, vectors)
+        if self.root is not None and len(self.mem.chunks) >= settings.rag_segment_flush_docs:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.root is None or not self.mem.chunks:
+            return
+        ids, doc_len, postings = self.mem.bm25.export()
+        _, vectors = self.mem.vectors.export()
+        self.segments.append(write_segment(self.root, ids, [self.mem.chunks[i] for i in ids], doc_len, postings, vectors, _ivf_nlist(len(ids))))
+        self.mem = _MemTable()
+
+    def discard(self) -> None:
+        """重建失败：删除已写出但未发布的段。"""
+        for s in self.segments:
+            shutil.rmtree(s.path, ignore_errors=True)
+        self.segments = []
+
+
+class KBIndex:
+    """单个 KB 的检索数据。读取无锁（基于不可变视图快照），写入串行。"""
+
+    def __init__(self, root: Optional[str] = None) -> None:
+        self.root = root
+        # 串行化写入；重建切换时持有它以追平增量，查询不受影响
+        self.write_lock = RLock()
+        self._sync_lock = RLock()
+        # (段列表, memtable)：整体替换，读者取一次引用即得到一致视图
+        self._view: Tuple[List[Segment], _MemTable] = ([], _MemTable())
+        self._manifest_version = 0
+        # 内存模式为写入次数；持久模式为当前 WAL 已应用的字节数
+        self._seq = 0
+        self._wal: Optional[str] = None
+        self._manifest_key: Optional[Tuple[int, int, int]] = None
+        self._merging = False
+        if root is not None:
+            os.makedirs(root, exist_ok=True)
+            self._lock_fd = os.open(os.path.join(root, "LOCK"), os.O_RDWR | os.O_CREAT, 0o644)
+            with self._exclusive():
+                if self._manifest_key is None:
+                    self._publish([], new_wal=True)
+
+    @property
+    def version(self) -> Tuple[int, int]:
+        # 索引版本：写入/落盘/合并/重建均会改变，作为查询缓存键的一部分，旧结果自然失效；
+        # 持久模式下由 manifest 版本与 WAL 偏移构成，多个 worker 对同一状态得到相同版本
+        return self._manifest_version, self._seq
+
+    def __len__(self) -> int:
+        segments, mem = self._view
+        return len(mem.chunks) + sum(len(s) for s in segments)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    # ---- 跨进程同步 ----
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        with self.write_lock, self._sync_lock:
+            if self.root is None:
+                yield
+                return
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                self._sync_locked()
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def sync(self) -> None:
+        """追上其他进程的写入；无变化时只有两次 stat。正在同步/写入时直接返回，读者从不阻塞。"""
+        if self.root is None or not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            self._sync_locked()
+        finally:
+            self._sync_lock.release()
+
+    def _sync_locked(self) -> None:
+        for attempt in range(3):
+            try:
+                st = os.stat(self._path(_MANIFEST))
+            except FileNotFoundError:
+                return
+            key = (st.st_ino, st.st_mtime_ns, st.st_size)
+            try:
+                if key != self._manifest_key:
+                    self._load_manifest(key)
+                else:
+                    self._seq = self._replay(self._view[1], self._wal, self._seq)
+                return
+            except FileNotFoundError:
+                # 读取期间段/WAL 被其他进程的合并或落盘删除：重读 manifest
+                self._manifest_key = None
+                if attempt == 2:
+                    raise
+
+    def _load_manifest(self, key: Tuple[int, int, int]) -> None:
+        with open(self._path(_MANIFEST), encoding="utf-8") as f:
+            manifest = json.load(f)
+        opened = {s.name: s for s in self._view[0]}
+        segments = [opened.get(name) or Segment(self._path(name)) for name in manifest["segments"]]
+        mem = _MemTable()
+        seq = self._replay(mem, manifest["wal"], 0)
+        self._view = (segments, mem)
+        self._manifest_version, self._wal, self._seq = manifest["version"], manifest["wal"], seq
+        self._manifest_key = key
+
+    def _replay(self, mem: _MemTable, wal: str, offset: int) -> int:
+        """把 WAL 中 offset 之后的完整行写入 memtable，返回新的偏移。"""
+        path = self._path(wal)
+        if os.path.getsize(path) <= offset:
+            return offset
+        with open(path, "rb") as f:
+            f.seek(offset)
+            data = f.read()
+        # 末尾不完整的一行可能正在被写入，留到下次
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return offset
+        records = [json.loads(line) for line in data[:end].splitlines() if line.strip()]
+        if records:
+            texts = [r["text"] for r in records]
+            mem.add([r["id"] for r in records], texts, [tokenize(t) for t in texts], embed(texts))
+        return offset + end
+
+    def _publish(self, segments: List[Segment], new_wal: bool) -> None:
+        """原子写出新 manifest 并切换视图；new_wal 时 memtable 已落盘，换用空 WAL。调用方持有 flock。"""
+        old_segments, mem = self._view
+        old_wal, wal, seq = self._wal, self._wal, self._seq
+        if new_wal:
+            wal, seq, mem = f"wal-{uuid.uuid4().hex}.log", 0, _MemTable()
+            open(self._path(wal), "wb").close()
+        version = self._manifest_version + 1
+        tmp = self._path(_MANIFEST + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "segments": [s.name for s in segments], "wal": wal}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._path(_MANIFEST))
+        st = os.stat(self._path(_MANIFEST))
+        self._view = (segments, mem)
+        self._manifest_version, self._wal, self._seq = version, wal, seq
+        self._manifest_key = (st.st_ino, st.st_mtime_ns, st.st_size)
+        # manifest 切换后再删除旧文件；其他进程已映射的段在 Linux 上可继续读到其重新加载为止
+        if old_wal and old_wal != wal:
+            try:
+                os.remove(self._path(old_wal))
+            except FileNotFoundError:
+                pass
+        live = {s.name for s in segments}
+        for s in old_segments:
+            if s.name not in live:
+                shutil.rmtree(s.path, ignore_errors=True)
+
+    # ---- 写入 ----
+    def add(self, ids: List[str], texts: List[str], tokens: List[List[str]], vectors: np.ndarray) -> None:
+        with self._exclusive():
+            mem = self._view[1]
+            if self.root is None:
+                self._seq += 1
+            else:
+                data = "".join(json.dumps({"id": i, "text": t}, ensure_ascii=False) + "\n" for i, t in zip(ids, texts))
+                raw = data.encode("utf-8")
+                with open(self._path(self._wal), "ab") as f:
+                    f.write(raw)
+                    f.flush()
+                    os.fsync(f.fileno())
+                self._seq += len(raw)
+            mem.add(ids, texts, tokens, vectors)
+            if self.root is not None and len(mem.chunks) >= settings.rag_segment_flush_docs:
+                self._flush_locked()
+            self._maybe_merge()
+
+    def _flush_locked(self) -> None:
+        segments, mem = self._view
+        if not mem.chunks:
+            return
+        ids, doc_len, postings = mem.bm25.export()
+        _, vectors = mem.vectors.export()
+        seg = write_segment(self.root, ids, [mem.chunks[i] for i in ids], doc_len, postings, vectors, _ivf_nlist(len(ids)))
+        self._publish(segments + [seg], new_wal=True)
+
+    def _maybe_merge(self) -> None:
+        if self.root is None or self._merging or len(self._view[0]) <= settings.rag_max_segments:
+            return
+        self._merging = True
+        _MERGER.submit(self._merge)
+
+    def _merge(self) -> None:
+        try:
+            segments = list(self._view[0])
+            merged = merge_segments(self.root, segments, _ivf_nlist(sum(len(s) for s in segments)))
+            with self._exclusive():
+                current = self._view[0]
+                if [s.name for s in current[: len(segments)]] != [s.name for s in segments]:
+                    # 合并期间段列表被重建或其他进程的合并替换，本次结果作废
+                    shutil.rmtree(merged.path, ignore_errors=True)
+                    return
+                self._publish([merged] + current[len(segments):], new_wal=False)
+            logger.info("[KB] merged {} segments into {} ({} chunks)", len(segments), merged.name, len(merged))
+        except Exception as e:
+            logger.error("[KB] segment merge failed root={}: {}", self.root, e)
+        finally:
+            self._merging = False
+
+    def start_rebuild(self) -> Rebuild:
+        """开始一次重建：替换内容的段直接写在本 KB 目录下，切换前不进入 manifest。"""
+        return Rebuild(self.root)
+
+    def replace_with(self, new: Rebuild, synced: int) -> None:
+        """用重建结果替换本索引内容。synced 为重建已读取的前 synced 个 chunk（按写入顺序），其后写入的增量在切换前追平。"""
+        with self._exclusive():
+            delta = list(islice(self.iter_chunks(), synced, None))
+            if delta:
+                ids = [cid for cid, _ in delta]
+                texts = [t for _, t in delta]
+                new.add(ids, texts, [tokenize(t) for t in texts], embed(texts))
+            if self.root is None:
+                self._view = (new.segments, new.mem)
+                self._manifest_version += 1
+                return
+            new.flush()
+            self._publish(new.segments, new_wal=True)
+        self._maybe_merge()
+
+    # ---- 读取 ----
+    def iter_chunks(self) -> Iterator[Tuple[str, str]]:
+        """按写入顺序遍历 (chunk_id, 原文)；落盘与合并都保持该顺序。"""
+        segments, mem = self._view
+        for s in segments:
+            yield from s.iter_chunks()
+        yield from list(mem.chunks.items())
+
+    def get_text(self, chunk_id: str) -> str:
+        segments, mem = self._view
+        text = mem.chunks.get(chunk_id)
+        if text is not None:
+            return text
+        for s in reversed(segments):
+            text = s.get_text(chunk_id)
+            if text is not None:
+                return text
+        return ""
+
+    def _bm25_stats(self, segments: List[Segment], mem: _MemTable, terms: Sequence[str]) -> Tuple[int, float, np.ndarray, np.ndarray]:
+        """汇总全局 (N, avgdl, 各词项 idf, 词项哈希)。"""
+        n = len(mem.bm25) + sum(len(s) for s in segments)
+        total = mem.bm25.total_len + sum(s.total_len for s in segments)
+        hashes = term_hash(terms)
+        df = np.fromiter((mem.bm25.df(t) for t in terms), dtype=np.int64, count=len(terms))
+        for s in segments:
+            df += s.df(hashes)
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        return n, (total / n if n else 0.0) or 1.0, idf, hashes
+
+    def search_bm25(self, terms: Iterable[str], top_k: int = 10) -> List[Tuple[str, float]]:
+        segments, mem = self._view
+        if not segments:
+            return mem.bm25.search(terms, top_k)
+        terms = list(set(terms))
+        if not terms or top_k <= 0:
+            return []
+        n, avgdl, idf, hashes = self._bm25_stats(segments, mem, terms)
+        if not n:
+            return []
+        hits = mem.bm25.search(terms, top_k, idf=dict(zip(terms, idf.tolist())), avgdl=avgdl)
+        for s in segments:
+            hits.extend(s.search_bm25(hashes, idf, avgdl, settings.rag_bm25_k1, settings.rag_bm25_b, top_k))
+        return nlargest(top_k, hits, key=lambda h: h[1])
+
+    def bm25_max_possible(self, terms: Iterable[str]) -> float:
+        segments, mem = self._view
+        if not segments:
+            return mem.bm25.max_possible(terms)
+        terms = list(set(terms))
+        _, _, idf, _ = self._bm25_stats(segments, mem, terms)
+        return float(idf.sum()) * (settings.rag_bm25_k1 + 1)
+
+    def search_vectors(self, queries: np.ndarray, top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        segments, mem = self._view
+        results = mem.vectors.search_batch(queries, top_k)
+        if not segments:
+            return results
+        prepared = mem.vectors.prepare(queries)
+        for s in segments:
+            for r, hits in enumerate(s.search_vectors(prepared, top_k, settings.rag_ivf_nprobe)):
+                results[r].extend(hits)
+        return [nlargest(top_k, hits, key=lambda h: h[1]) for hits in results]
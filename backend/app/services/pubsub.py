@@ -0,0 +1,92 @@
+"""
+文件作用：进程内发布/订阅（按主题分发事件到 asyncio 队列），用于把执行器的状态变化推送给 SSE 连接。
+
+设计要点：
+- 订阅者各自持有有界队列，发布只做 put_nowait，不等待慢消费者；无订阅者时发布仅一次字典查找。
+- 队列满时丢弃该订阅者的积压并放入 LAGGED 标记，消费者据此重新拉取快照，而不是无限堆积内存。
+- 发布可来自任意线程：非订阅者所在事件循环时经 call_soon_threadsafe 投递。
+- 仅限本进程；多 worker 部署时只能收到本进程内执行的运行的事件。
+"""
+
+import asyncio
+from threading import RLock
+from typing import Any, Dict, Optional, Set
+
+# 订阅者积压溢出后收到的标记：之前的事件已丢失，需重新同步
+LAGGED = object()
+
+
+class Subscription:
+    def __init__(self, hub: "PubSub", topic: str, maxsize: int) -> None:
+        self.topic = topic
+        self._hub = hub
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._loop = asyncio.get_running_loop()
+
+    def _deliver(self, event: Any) -> None:
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(LAGGED)
+
+    async def get(self, timeout: Optional[float] = None) -> Any:
+        """取下一条事件；超时返回 None。"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self) -> None:
+        self._hub._unsubscribe(self)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+class PubSub:
+    """线程安全的进程内事件分发器。"""
+
+    def __init__(self, maxsize: int = 1000) -> None:
+        self.maxsize = maxsize
+        self._subs: Dict[str, Set[Subscription]] = {}
+        self._lock = RLock()
+
+    def subscribe(self, topic: str) -> Subscription:
+        """订阅主题；需在事件循环内调用，用完须 close（或作为上下文管理器使用）。"""
+        sub = Subscription(self, topic, self.maxsize)
+        with self._lock:
+            self._subs.setdefault(topic, set()).add(sub)
+        return sub
+
+    def _unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self._subs.get(sub.topic)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subs[sub.topic]
+
+    def publish(self, topic: str, event: Any) -> None:
+        with self._lock:
+            subs = self._subs.get(topic)
+            if not subs:
+                return
+            subs = list(subs)
+        try:
+            current = asyncio.get_running_loop()
+        except RuntimeError:
+            current = None
+        for sub in subs:
+            if sub._loop is current:
+                sub._deliver(event)
+            else:
+                sub._loop.call_soon_threadsafe(sub._deliver, event)
+
+    def subscribers(self, topic: str) -> int:
+        with self._lock:
+            return len(self._subs.get(topic, ()))
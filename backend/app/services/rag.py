@@ -1,36 +1,151 @@
 """
-文件作用：RAG 服务占位（检索/重排/压缩）。
+文件作用：RAG 服务（按 KB 维护检索索引；检索/重排/压缩）。
+说明：BM25 倒排与向量索引均由 /kb/{kid}/documents/ingest 增量写入；向量默认使用本地哈希 Embedding。
+索引数据按 KB 存放在 rag_data_dir/<kid> 下（见 kbstore），首次访问时打开，进程重启无需重建。
 """
 
-from typing import List, Tuple
+import os
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from threading import RLock
+from typing import Dict, Iterable, List, Optional, Tuple
+from .cache import TTLCache
+from .compress import compress as compress_chunks
+from .embedding import embed
+from .fusion import rrf_fuse, weighted_fuse
+from .kbstore import KBIndex, Rebuild
+from .rerank import rerank as rerank_candidates
+from .tokenizer import tokenize
+from ..config import settings
 
 
-def bm25_search(query: str) -> List[Tuple[str, float]]:
-    # 占位：BM25 返回（文本, 分数）
-    return [(f"bm25 chunk for: {query}", 1.0)]
+_INDEXES: Dict[str, KBIndex] = {}
+_LOCK = RLock()
+QUERY_CACHE = TTLCache(maxsize=settings.rag_cache_size, ttl=settings.rag_cache_ttl)
+# 混检两路并发执行；NumPy 矩阵乘会释放 GIL，向量检索可与 BM25 真正并行
+_POOL = ThreadPoolExecutor(max_workers=settings.rag_search_workers, thread_name_prefix="rag-search")
 
 
-def vector_search(query: str) -> List[Tuple[str, float]]:
-    # 占位：向量检索返回（文本, 相似度）
-    return [(f"vector chunk for: {query}", 0.9)]
+def get_index(kid: str) -> KBIndex:
+    with _LOCK:
+        idx = _INDEXES.get(kid)
+        if idx is None:
+            root = None
+            if settings.rag_data_dir:
+                # kid 直接作为目录名，拒绝路径分隔符与 . / ..
+                if os.path.basename(kid) != kid or kid in ("", ".", ".."):
+                    raise ValueError(f"invalid kb id: {kid!r}")
+                root = os.path.join(settings.rag_data_dir, kid)
+            idx = _INDEXES[kid] = KBIndex(root)
+    # 其他 worker 可能已写入：读前追平（无变化时仅 stat）
+    idx.sync()
+    return idx
 
 
-def hybrid_retrieve(query: str) -> List[str]:
-    # 简单合并去重
-    items = [t for t, _ in bm25_search(query) + vector_search(query)]
-    seen, out = set(), []
-    for it in items:
-        if it not in seen:
-            seen.add(it)
-            out.append(it)
-    return out
+def index_chunks(kid: str, chunks: Iterable[str]) -> List[str]:
+    """把 chunk 写入 KB 索引（增量），返回分配的 chunk_id 列表。"""
+    texts = list(chunks)
+    ids = [uuid.uuid4().hex for _ in texts]
+    # 分词与向量化在锁外完成，锁内只做写入
+    tokens = [tokenize(t) for t in texts]
+    vectors = embed(texts)
+    get_index(kid).add(ids, texts, tokens, vectors)
+    return ids
 
 
-def rerank(chunks: List[str]) -> List[str]:
-    return chunks
+def swap_index(kid: str, new: Rebuild, synced: int) -> None:
+    """以重建结果替换 KB 内容。synced 为重建已读取的 chunk 数，其后写入的增量在切换前追平。"""
+    get_index(kid).replace_with(new, synced)
 
 
-def compress(chunks: List[str]) -> str:
-    return "\n".join(chunks)
+def get_chunk(kid: str, chunk_id: str) -> str:
+    return get_index(kid).get_text(chunk_id)
 
 
+def bm25_search(kid: str, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+    # 返回（chunk_id, 分数）
+    return get_index(kid).search_bm25(tokenize(query), top_k)
+
+
+def vector_search(kid: str, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+    # 返回（chunk_id, 相似度）
+    return vector_search_batch(kid, [query], top_k)[0]
+
+
+def vector_search_batch(kid: str, queries: List[str], top_k: int = 10) -> List[List[Tuple[str, float]]]:
+    # 多个查询一次矩阵乘完成打分
+    return get_index(kid).search_vectors(embed(queries), top_k)
+
+
+def normalize_query(query: str) -> str:
+    # 大小写与空白差异不影响检索结果，归一化后提升缓存命中率
+    return " ".join(query.lower().split())
+
+
+def _confident(hits: List[Tuple[str, float]], top_k: int, scale: float, threshold: float) -> bool:
+    # 第 K 名的归一化分数仍达阈值，说明这一路已给出可信的完整 Top-K
+    return len(hits) >= top_k > 0 and scale > 0 and hits[top_k - 1][1] / scale >= threshold
+
+
+def hybrid_search(kid: str, query: str, top_k: int = 10, fusion: Optional[str] = None) -> List[Tuple[str, float]]:
+    """BM25 与向量检索并发执行并按 chunk_id 融合，返回 [(chunk_id, 融合分)]。
+
+    任一路先返回且置信时直接采用其结果，不再等待另一路；此时仍经同一融合公式打分（另一路视为空），
+    返回的分数与完整融合同一量纲。
+    """
+    fusion = fusion or settings.rag_fusion
+    depth = top_k * settings.rag_fusion_depth
+    terms = tokenize(query)
+    idx = get_index(kid)
+    futures = {
+        _POOL.submit(idx.search_bm25, terms, depth): "bm25",
+        _POOL.submit(vector_search, kid, query, depth): "vector",
+    }
+    results: Dict[str, List[Tuple[str, float]]] = {}
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            name = futures[fut]
+            hits = results[name] = fut.result()
+            confident = (
+                _confident(hits, top_k, idx.bm25_max_possible(terms), settings.rag_bm25_confident)
+                if name == "bm25"
+                else _confident(hits, top_k, 1.0, settings.rag_vector_confident)
+            )
+            if confident and pending:
+                for other in pending:
+                    other.cancel()
+                pending = set()
+                break
+    return _fuse(results, fusion)[:top_k]
+
+
+def _fuse(results: Dict[str, List[Tuple[str, float]]], fusion: str) -> List[Tuple[str, float]]:
+    rankings = [results.get("bm25", []), results.get("vector", [])]
+    weights = [settings.rag_bm25_weight, settings.rag_vector_weight]
+    if fusion == "weighted":
+        return weighted_fuse(rankings, weights)
+    return rrf_fuse(rankings, k=settings.rag_rrf_k, weights=weights)
+
+
+def hybrid_retrieve(kid: str, query: str, top_k: int = 10, fusion: Optional[str] = None) -> List[str]:
+    idx = get_index(kid)
+    return [idx.get_text(cid) for cid, _ in hybrid_search(kid, query, top_k, fusion)]
+
+
+def rerank(query: str, chunks: List[str], budget_ms: Optional[float] = None) -> List[int]:
+    """按相关性重排，返回新顺序的下标；budget_ms 限制重排耗时，超出部分保持原顺序。"""
+    if budget_ms is None:
+        budget_ms = settings.rag_rerank_budget_ms or None
+    return rerank_candidates(query, chunks, budget_ms, settings.rag_rerank_batch)
+
+
+def compress(chunks: List[str], query: Optional[str] = None, max_tokens: Optional[int] = None) -> str:
+    """把 chunk 压缩进 token 预算：近重复去除 + 按查询重叠的句级抽取。"""
+    return compress_chunks(
+        chunks,
+        query,
+        max_tokens or settings.rag_context_tokens,
+        settings.rag_dedup_threshold,
+    )
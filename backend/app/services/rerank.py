@@ -0,0 +1,106 @@
+"""
+文件作用：可插拔重排器（默认本地词汇特征模型）与按延迟预算的批量打分。
+
+设计要点：
+- 重排器接口与 Cross-Encoder 一致：对 (query, 候选文本) 成对打分，按批调用，便于替换为本地/远程模型。
+- 默认 LexicalReranker 使用查询词覆盖率、二元组命中、邻近度、整句命中与词频饱和等特征线性组合，无模型依赖。
+- 延迟预算：逐批打分并测量单条耗时，下一批按剩余预算收缩；预算用尽即截断，
+  未打分的候选保持检索（融合）顺序排在已打分候选之后，不丢结果。
+"""
+
+import time
+from typing import Dict, List, Optional, Protocol, Sequence, Tuple
+from .tokenizer import tokenize
+
+
+class Reranker(Protocol):
+    def score_batch(self, query: str, texts: Sequence[str]) -> List[float]:
+        ...
+
+
+class LexicalReranker:
+    weights = {"coverage": 0.4, "bigram": 0.2, "proximity": 0.15, "phrase": 0.15, "tf": 0.1}
+
+    def score_batch(self, query: str, texts: Sequence[str]) -> List[float]:
+        q_terms = tokenize(query)
+        q_set = set(q_terms)
+        q_bigrams = set(zip(q_terms, q_terms[1:]))
+        phrase = " ".join(q_terms)
+        return [self._score(q_set, q_bigrams, phrase, tokenize(t)) for t in texts]
+
+    def _score(self, q_set: set, q_bigrams: set, phrase: str, toks: List[str]) -> float:
+        if not q_set or not toks:
+            return 0.0
+        w = self.weights
+        tf: Dict[str, int] = {}
+        hits: List[Tuple[int, str]] = []
+        for i, t in enumerate(toks):
+            if t in q_set:
+                tf[t] = tf.get(t, 0) + 1
+                hits.append((i, t))
+        if not hits:
+            return 0.0
+        score = w["coverage"] * len(tf) / len(q_set)
+        score += w["tf"] * sum(min(n, 3) for n in tf.values()) / (3 * len(q_set))
+        if q_bigrams:
+            found = sum(1 for bg in zip(toks, toks[1:]) if bg in q_bigrams)
+            score += w["bigram"] * min(1.0, found / len(q_bigrams))
+        if len(tf) > 1:
+            score += w["proximity"] * len(tf) / self._min_window(hits, len(tf))
+        else:
+            score += w["proximity"] * (1.0 if len(q_set) == 1 else 0.0)
+        if len(q_set) > 1 and phrase in " ".join(toks):
+            score += w["phrase"]
+        return score
+
+    @staticmethod
+    def _min_window(hits: List[Tuple[int, str]], need: int) -> int:
+        # 双指针求覆盖全部命中词项的最短窗口长度（token 数）
+        counts: Dict[str, int] = {}
+        best = hits[-1][0] - hits[0][0] + 1
+        left = 0
+        for pos, term in hits:
+            counts[term] = counts.get(term, 0) + 1
+            while len(counts) == need:
+                lpos, lterm = hits[left]
+                best = min(best, pos - lpos + 1)
+                counts[lterm] -= 1
+                if not counts[lterm]:
+                    del counts[lterm]
+                left += 1
+        return best
+
+
+_RERANKER: Reranker = LexicalReranker()
+
+
+def set_reranker(reranker: Reranker) -> None:
+    global _RERANKER
+    _RERANKER = reranker
+
+
+def rerank(query: str, texts: Sequence[str], budget_ms: Optional[float] = None, batch_size: int = 32) -> List[int]:
+    """返回候选的新顺序（下标列表）。budget_ms 为 None 时不限时，全部打分。"""
+    deadline = None if budget_ms is None else time.perf_counter() + budget_ms / 1000.0
+    per_item: Optional[float] = None
+    scored: List[Tuple[float, int]] = []
+    pos = 0
+    while pos < len(texts):
+        size = batch_size
+        if deadline is not None:
+            remaining = deadline - time.perf_counter()
+            if per_item is not None:
+                size = min(size, int(remaining / per_item) if per_item > 0 else size)
+            if remaining <= 0 or size <= 0:
+                break
+        batch = texts[pos: pos + size]
+        start = time.perf_counter()
+        scores = _RERANKER.score_batch(query, batch)
+        cost = (time.perf_counter() - start) / len(batch)
+        # 单条耗时取 EWMA，平滑单批抖动
+        per_item = cost if per_item is None else 0.7 * per_item + 0.3 * cost
+        scored.extend((s, pos + i) for i, s in enumerate(scores))
+        pos += len(batch)
+    # 稳定排序：同分保持原检索顺序
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return [i for _, i in scored] + list(range(pos, len(texts)))
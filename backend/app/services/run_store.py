@@ -0,0 +1,105 @@
+"""
+文件作用：Workflow 运行记录的数据库存取（workflow_runs / workflow_node_runs）。
+
+说明：运行记录为 dict 形态（与 services/workflow 及路由返回一致），节点结果按 position 排序返回。
+列表使用 (created_at, id) 键集分页：每页一次走 (workflow_id, created_at) 索引的范围查询，与历史运行总数无关。
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import and_, or_, update
+from sqlalchemy.orm import Session
+from ..db import SessionLocal
+from ..models import NodeRunModel, WorkflowRunModel
+
+_RUN_FIELDS = ("workflow_id", "status", "created_at", "started_at", "finished_at", "error", "spec", "spec_hash", "replay_of", "from_node")
+_NODE_FIELDS = ("type", "status", "depends_on", "output", "error", "input_hash", "memoized", "attempts", "started_at", "finished_at")
+
+
+def _run_row(run: Dict[str, Any]) -> WorkflowRunModel:
+    return WorkflowRunModel(id=run["id"], **{k: run.get(k) for k in _RUN_FIELDS})
+
+
+def _node_row(run_id: str, position: int, node: Dict[str, Any]) -> NodeRunModel:
+    return NodeRunModel(run_id=run_id, node_id=node["node"], position=position, **{k: node.get(k) for k in _NODE_FIELDS})
+
+
+def _to_dict(r: WorkflowRunModel, nodes: List[NodeRunModel]) -> Dict[str, Any]:
+    run = {"id": r.id, **{k: getattr(r, k) for k in _RUN_FIELDS}}
+    run["nodes"] = [{"node": n.node_id, **{k: getattr(n, k) for k in _NODE_FIELDS}} for n in nodes]
+    return run
+
+
+def save_run(run: Dict[str, Any], with_nodes: bool = True) -> None:
+    """整体写入（upsert）运行记录；with_nodes=False 时只更新运行行。"""
+    with SessionLocal() as db:
+        db.merge(_run_row(run))
+        if with_nodes:
+            for i, node in enumerate(run["nodes"]):
+                db.merge(_node_row(run["id"], i, node))
+        db.commit()
+
+
+def save_node(run_id: str, position: int, node: Dict[str, Any]) -> None:
+    with SessionLocal() as db:
+        db.merge(_node_row(run_id, position, node))
+        db.commit()
+
+
+def claim_paused(run_id: str, status: str = "queued") -> bool:
+    """把 paused 运行原子地改为 status（恢复为 queued 或取消为 cancelled）；并发的审批/取消只有一个能成功。"""
+    with SessionLocal() as db:
+        result = db.execute(
+            update(WorkflowRunModel)
+            .where(WorkflowRunModel.id == run_id, WorkflowRunModel.status == "paused")
+            .values(status=status)
+        )
+        db.commit()
+        return result.rowcount == 1
+
+
+def _nodes_of(db: Session, run_ids: List[str]) -> Dict[str, List[NodeRunModel]]:
+    out: Dict[str, List[NodeRunModel]] = {rid: [] for rid in run_ids}
+    if run_ids:
+        rows = db.query(NodeRunModel).filter(NodeRunModel.run_id.in_(run_ids)).order_by(NodeRunModel.run_id, NodeRunModel.position)
+        for n in rows:
+            out[n.run_id].append(n)
+    return out
+
+
+def load_run(run_id: str) -> Optional[Dict[str, Any]]:
+    with SessionLocal() as db:
+        r = db.get(WorkflowRunModel, run_id)
+        if r is None:
+            return None
+        return _to_dict(r, _nodes_of(db, [run_id])[run_id])
+
+
+def encode_cursor(run: Dict[str, Any]) -> str:
+    # repr(float) 可精确往返，保证游标比较与库中值一致
+    return f"{run['created_at']!r}_{run['id']}"
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """非法游标抛 ValueError。"""
+    created_at, _, run_id = cursor.partition("_")
+    if not run_id:
+        raise ValueError("malformed cursor")
+    return float(created_at), run_id
+
+
+def list_runs(workflow_id: str, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """按创建时间倒序返回一页运行记录及下一页游标（无更多时为 None）。"""
+    with SessionLocal() as db:
+        q = db.query(WorkflowRunModel).filter(WorkflowRunModel.workflow_id == workflow_id)
+        if cursor:
+            created_at, run_id = decode_cursor(cursor)
+            q = q.filter(or_(
+                WorkflowRunModel.created_at < created_at,
+                and_(WorkflowRunModel.created_at == created_at, WorkflowRunModel.id < run_id),
+            ))
+        rows = q.order_by(WorkflowRunModel.created_at.desc(), WorkflowRunModel.id.desc()).limit(limit + 1).all()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        nodes = _nodes_of(db, [r.id for r in rows])
+        items = [_to_dict(r, nodes[r.id]) for r in rows]
+    return items, (encode_cursor(items[-1]) if more else None)
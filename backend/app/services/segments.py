@@ -0,0 +1,263 @@
+"""
+文件作用：不可变索引段（segment）的落盘、内存映射读取与合并。
+
+设计要点：
+- 一个段是一个目录，写入临时目录后整体 rename 生效，之后不再修改；读取一律 np.load(mmap_mode="r")，
+  数据留在操作系统页缓存中，多个 worker 进程映射同一文件即共享同一份物理内存，打开段几乎不耗时。
+- 倒排按词项哈希（blake2b 64 位）升序存放：term_hash/term_off 定位倒排区间，post_docs/post_tfs 为连续数组；
+  查询时按词项切片后向量化打分（bincount 累加），无需反序列化。
+- 向量按度量预处理后存放（cosine 已归一化）；规模达到 IVF 阈值的段同时保存 k-means 中心与按分区排序的行号。
+- 合并：各段倒排按 (词项哈希, 文档号) 重排拼接，原文与向量顺序拼接，IVF 重新训练；无需重新分词或向量化。
+"""
+
+import json
+import os
+import shutil
+import uuid
+from hashlib import blake2b
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+from .vector_index import kmeans, nearest_centroid, topk_rows
+
+_META = "meta.json"
+
+
+def term_hash(terms: Sequence[str]) -> np.ndarray:
+    return np.fromiter(
+        (int.from_bytes(blake2b(t.encode("utf-8"), digest_size=8).digest(), "little") for t in terms),
+        dtype=np.uint64,
+        count=len(terms),
+    )
+
+
+class Segment:
+    """只读段：全部数组以 mmap 方式打开。"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, _META), encoding="utf-8") as f:
+            meta = json.load(f)
+        self.total_len: int = meta["total_len"]
+        self.ids = self._load("ids.npy")
+        self.ids_sorted = self._load("ids_sorted.npy")
+        self.id_rows = self._load("id_rows.npy")
+        self.doc_len = self._load("doc_len.npy")
+        self.text_off = self._load("text_off.npy")
+        self.term_hash = self._load("term_hash.npy")
+        self.term_off = self._load("term_off.npy")
+        self.post_docs = self._load("post_docs.npy")
+        self.post_tfs = self._load("post_tfs.npy")
+        self.vectors = self._load("vectors.npy")
+        size = int(self.text_off[-1])
+        self._texts = np.memmap(os.path.join(path, "texts.bin"), dtype=np.uint8, mode="r") if size else np.empty(0, np.uint8)
+        self.centroids: Optional[np.ndarray] = None
+        if meta.get("ivf"):
+            self.centroids = np.asarray(self._load("ivf_centroids.npy"))
+            self.ivf_rows = self._load("ivf_rows.npy")
+            self.ivf_off = self._load("ivf_off.npy")
+
+    def _load(self, name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, name), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ---- 原文 ----
+    def text_bytes(self, row: int) -> bytes:
+        return self._texts[self.text_off[row]: self.text_off[row + 1]].tobytes()
+
+    def text(self, row: int) -> str:
+        return self.text_bytes(row).decode("utf-8")
+
+    def get_text(self, chunk_id: str) -> Optional[str]:
+        key = chunk_id.encode("ascii", "ignore")
+        pos = int(np.searchsorted(self.ids_sorted, key))
+        if pos < len(self.ids_sorted) and self.ids_sorted[pos] == key:
+            return self.text(int(self.id_rows[pos]))
+        return None
+
+    def iter_chunks(self) -> Iterator[Tuple[str, str]]:
+        for row in range(len(self.ids)):
+            yield self.ids[row].decode("ascii"), self.text(row)
+
+    # ---- BM25 ----
+    def _locate(self, hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        pos = np.searchsorted(self.term_hash, hashes)
+        found = pos < len(self.term_hash)
+        found[found] = self.term_hash[pos[found]] == hashes[found]
+        return pos, found
+
+    def df(self, hashes: np.ndarray) -> np.ndarray:
+        pos, found = self._locate(hashes)
+        out = np.zeros(len(hashes), dtype=np.int64)
+        out[found] = self.term_off[pos[found] + 1] - self.term_off[pos[found]]
+        return out
+
+    def search_bm25(
+        self,
+        hashes: np.ndarray,
+        idf: np.ndarray,
+        avgdl: float,
+        k1: float,
+        b: float,
+        top_k: int,
+    ) -> List[Tuple[str, float]]:
+        """按全局 idf/avgdl 打分，返回本段 Top-K [(chunk_id, score)]。"""
+        pos, found = self._locate(hashes)
+        docs_parts: List[np.ndarray] = []
+        score_parts: List[np.ndarray] = []
+        for i in np.flatnonzero(found):
+            start, end = int(self.term_off[pos[i]]), int(self.term_off[pos[i] + 1])
+            docs = np.asarray(self.post_docs[start:end])
+            tf = self.post_tfs[start:end].astype(np.float32)
+            norm = k1 * (1 - b + b * self.doc_len[docs] / avgdl)
+            docs_parts.append(docs)
+            score_parts.append(idf[i] * tf * (k1 + 1) / (tf + norm))
+        if not docs_parts:
+            return []
+        if len(docs_parts) == 1:
+            cand, scores = docs_parts[0], score_parts[0]
+        else:
+            # 各词项贡献按文档号累加；只在出现过的文档上取 Top-K
+            acc = np.bincount(np.concatenate(docs_parts), weights=np.concatenate(score_parts))
+            cand = np.flatnonzero(acc)
+            scores = acc[cand]
+        top = topk_rows(scores[None, :], min(top_k, len(cand)))[0]
+        return [(self.ids[cand[j]].decode("ascii"), float(scores[j])) for j in top]
+
+    # ---- 向量 ----
+    def search_vectors(self, queries: np.ndarray, top_k: int, nprobe: int) -> List[List[Tuple[str, float]]]:
+        """queries 需已按度量预处理。"""
+        if not len(self.ids) or top_k <= 0:
+            return [[] for _ in range(len(queries))]
+        if self.centroids is None:
+            scores = queries @ self.vectors.T
+            top = topk_rows(scores, top_k)
+            return [[(self.ids[j].decode("ascii"), float(scores[r, j])) for j in top[r]] for r in range(len(queries))]
+        out = []
+        c = self.centroids
+        near_all = topk_rows(-(np.einsum("ij,ij->i", c, c)[None, :] - 2.0 * queries @ c.T), min(nprobe, len(c)))
+        for q, near in zip(queries, near_all):
+            cand = np.concatenate([self.ivf_rows[self.ivf_off[i]: self.ivf_off[i + 1]] for i in near])
+            if not len(cand):
+                out.append([])
+                continue
+            cand.sort()  # 按行号顺序读取 mmap，减少随机 I/O
+            scores = self.vectors[cand] @ q
+            top = topk_rows(scores[None, :], top_k)[0]
+            out.append([(self.ids[cand[j]].decode("ascii"), float(scores[j])) for j in top])
+        return out
+
+
+def _write(
+    root: str,
+    ids: Sequence[str],
+    texts: Sequence[bytes],
+    doc_len: np.ndarray,
+    hashes: np.ndarray,
+    term_off: np.ndarray,
+    post_docs: np.ndarray,
+    post_tfs: np.ndarray,
+    vectors: np.ndarray,
+    ivf_nlist: int,
+) -> Segment:
+    name = f"seg-{uuid.uuid4().hex}"
+    tmp = os.path.join(root, f".tmp-{name}")
+    os.makedirs(tmp)
+    try:
+        id_arr = np.array([i.encode("ascii") for i in ids], dtype=f"S{max((len(i) for i in ids), default=1)}")
+        id_order = np.argsort(id_arr, kind="stable")
+        text_off = np.zeros(len(texts) + 1, dtype=np.int64)
+        with open(os.path.join(tmp, "texts.bin"), "wb") as f:
+            for i, t in enumerate(texts):
+                f.write(t)
+                text_off[i + 1] = text_off[i] + len(t)
+        arrays: Dict[str, np.ndarray] = {
+            "ids": id_arr,
+            "ids_sorted": id_arr[id_order],
+            "id_rows": id_order.astype(np.int64),
+            "doc_len": doc_len.astype(np.uint32),
+            "text_off": text_off,
+            "term_hash": hashes.astype(np.uint64),
+            "term_off": term_off.astype(np.int64),
+            "post_docs": post_docs.astype(np.uint32),
+            "post_tfs": post_tfs.astype(np.uint32),
+            "vectors": np.ascontiguousarray(vectors, dtype=np.float32),
+        }
+        nlist = min(ivf_nlist, len(ids))
+        if nlist > 0:
+            centroids = kmeans(vectors, nlist)
+            assign = nearest_centroid(vectors, centroids)
+            arrays["ivf_centroids"] = centroids
+            arrays["ivf_rows"] = np.argsort(assign, kind="stable").astype(np.int64)
+            arrays["ivf_off"] = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+        for key, arr in arrays.items():
+            np.save(os.path.join(tmp, f"{key}.npy"), arr)
+        with open(os.path.join(tmp, _META), "w", encoding="utf-8") as f:
+            json.dump({"docs": len(ids), "total_len": int(doc_len.sum()), "ivf": nlist > 0}, f)
+        path = os.path.join(root, name)
+        os.rename(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return Segment(path)
+
+
+def write_segment(
+    root: str,
+    ids: Sequence[str],
+    texts: Sequence[str],
+    doc_len: Sequence[int],
+    postings: Dict[str, Tuple[Sequence[int], Sequence[int]]],
+    vectors: np.ndarray,
+    ivf_nlist: int = 0,
+) -> Segment:
+    """把内存索引快照（BM25Index.export + 原文 + 向量）写成一个新段。ivf_nlist 为 0 时不建 IVF。"""
+    terms = list(postings)
+    hashes = term_hash(terms)
+    order = np.argsort(hashes, kind="stable")
+    lengths = np.fromiter((len(postings[terms[i]][0]) for i in order), dtype=np.int64, count=len(terms))
+    term_off = np.concatenate([[0], np.cumsum(lengths)])
+    post_docs = np.empty(int(term_off[-1]), dtype=np.uint32)
+    post_tfs = np.empty(int(term_off[-1]), dtype=np.uint32)
+    for j, i in enumerate(order):
+        docs, tfs = postings[terms[i]]
+        post_docs[term_off[j]: term_off[j + 1]] = docs
+        post_tfs[term_off[j]: term_off[j + 1]] = tfs
+    return _write(
+        root,
+        ids,
+        [t.encode("utf-8") for t in texts],
+        np.asarray(doc_len, dtype=np.uint32),
+        hashes[order],
+        term_off,
+        post_docs,
+        post_tfs,
+        vectors,
+        ivf_nlist,
+    )
+
+
+def merge_segments(root: str, segments: Sequence[Segment], ivf_nlist: int = 0) -> Segment:
+    """把多个段按顺序合并为一个新段（文档号依次平移）。"""
+    bases = np.cumsum([0] + [len(s) for s in segments])
+    hashes = np.concatenate([np.repeat(s.term_hash, np.diff(s.term_off)) for s in segments])
+    docs = np.concatenate([s.post_docs.astype(np.int64) + base for s, base in zip(segments, bases)])
+    tfs = np.concatenate([np.asarray(s.post_tfs) for s in segments])
+    order = np.lexsort((docs, hashes))
+    hashes, docs, tfs = hashes[order], docs[order], tfs[order]
+    starts = np.flatnonzero(np.concatenate([[True], hashes[1:] != hashes[:-1]])) if len(hashes) else np.empty(0, np.int64)
+    term_off = np.concatenate([starts, [len(hashes)]])
+    return _write(
+        root,
+        [cid for s in segments for cid in (i.decode("ascii") for i in s.ids)],
+        [s.text_bytes(r) for s in segments for r in range(len(s))],
+        np.concatenate([np.asarray(s.doc_len) for s in segments]),
+        hashes[starts],
+        term_off,
+        docs,
+        tfs,
+        np.concatenate([np.asarray(s.vectors) for s in segments]),
+        ivf_nlist,
+    )
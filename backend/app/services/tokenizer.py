@@ -0,0 +1,27 @@
+"""
+文件作用：检索用的轻量分词器（BM25 倒排索引、向量化、分块计数共用）。
+说明：英文/数字按词切分并小写化；中日韩文字按单字切分，无需外部词典即可离线运行。
+"""
+
+import re
+from itertools import islice
+from typing import List, Optional, Tuple
+
+# 拉丁词（含数字）整体成词；CJK 统一表意文字逐字成词
+_TOKEN_RE = re.compile(r"[0-9a-z]+|[㐀-䶿一-鿿]", re.I)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t.lower() for t in _TOKEN_RE.findall(text or "")]
+
+
+def count_tokens(text: str, pos: int = 0, endpos: Optional[int] = None) -> int:
+    """统计 text[pos:endpos] 的 token 数；直接在原串上按位置扫描，不产生切片副本。"""
+    end = len(text) if endpos is None else endpos
+    return sum(1 for _ in _TOKEN_RE.finditer(text, pos, end))
+
+
+def token_spans(text: str, pos: int = 0, endpos: Optional[int] = None, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+    """text[pos:endpos] 中各 token 的位置；给定 limit 时最多返回前 limit 个，找够即停止扫描。"""
+    end = len(text) if endpos is None else endpos
+    return [m.span() for m in islice(_TOKEN_RE.finditer(text, pos, end), limit)]
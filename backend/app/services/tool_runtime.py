@@ -0,0 +1,266 @@
+"""
+文件作用：工具执行运行时（HTTP / 本地函数后端、全局与单工具并发限制、限流、并行扇出）。
+
+设计要点：
+- 后端由工具的 backend 字段决定：
+  {"type": "http", "url": ..., "method": "POST", "headers": {...}, "timeout": 30} —— 参数作为 JSON 请求体（GET 时作为查询参数）；
+  {"type": "local", "function": "<已注册函数名>"} —— 协程函数直接 await，普通函数进入有界线程池，不阻塞事件循环；
+  未配置时返回占位结果（保持原 /invoke 行为）。
+- 并发：进程内全局信号量（tool_global_concurrency）限制同时执行的调用总数；每个工具再有自己的并发上限
+  （max_concurrency，缺省 tool_default_concurrency）与令牌桶限流（rate_limit 次/秒）。排队只在事件循环上等待。
+- invoke_many 并发执行一组相互独立的调用并按输入顺序收集结果，步骤耗时取决于最慢的一个而非总和；
+  as_completed 按完成顺序产出，便于流式返回。
+- HTTP 后端共享一个连接池化的 AsyncClient，按需创建。URL 由工具创建者提供，服务端会代为请求，
+  属于信任边界：只允许 http(s)；配置 tool_http_allowed_hosts 时只允许名单内主机，未配置时拒绝回环、
+  内网、链路本地（含云元数据 169.254.169.254）等地址字面量。域名解析到内网地址的情况只有名单能拦住，
+  生产环境应配置名单。保存时与调用时都会检查，名单收紧后已保存的工具也会被拒绝。
+- 信号量、限制器与 AsyncClient 都绑定创建时的事件循环，因此按当前事件循环创建并缓存；
+  换了事件循环（TestClient 每次启动、lifespan 重启）时自动重建，不复用旧循环上的对象。
+"""
+
+import asyncio
+import ipaddress
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import RLock
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+import httpx
+from loguru import logger
+from ..config import settings
+from ..schemas.tool import Tool
+
+
+class ToolError(Exception):
+    """工具后端调用失败（配置错误、超时、远端错误等）。"""
+
+
+_FUNCTIONS: Dict[str, Callable[..., Any]] = {}
+_POOL = ThreadPoolExecutor(max_workers=settings.tool_worker_threads, thread_name_prefix="tool")
+_GLOBAL_SLOTS: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Semaphore]] = None
+# tool_id -> ((并发上限, 限流), 限制器)；限制参数变化时重建
+_LIMITERS: Dict[str, Tuple[Tuple[int, Optional[float]], "_Limiter"]] = {}
+_LOCK = RLock()
+_HTTP: Optional[Tuple[asyncio.AbstractEventLoop, httpx.AsyncClient]] = None
+
+
+def register_function(name: str, fn: Callable[..., Any]) -> None:
+    """注册本地函数后端：fn(**args)，可为协程函数或普通函数。"""
+    _FUNCTIONS[name] = fn
+
+
+def _echo(**args: Any) -> Dict[str, Any]:
+    return args
+
+
+register_function("echo", _echo)
+
+
+class _Limiter:
+    """单个工具的并发上限 + 令牌桶限流；只在事件循环线程使用。"""
+
+    def __init__(self, concurrency: int, rate: Optional[float]) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.slots = asyncio.Semaphore(concurrency)
+        self.rate = rate
+        # 桶容量取 1 秒的配额（至少 1），允许短时突发
+        self.burst = max(1.0, rate or 0.0)
+        self.tokens = self.burst
+        self.stamp = time.monotonic()
+
+    async def throttle(self) -> None:
+        if not self.rate:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return
+            await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+def _global_slots() -> asyncio.Semaphore:
+    # 按当前事件循环创建（Semaphore 会绑定首次使用它的事件循环），换循环时重建
+    global _GLOBAL_SLOTS
+    loop = asyncio.get_running_loop()
+    if _GLOBAL_SLOTS is None or _GLOBAL_SLOTS[0] is not loop:
+        _GLOBAL_SLOTS = (loop, asyncio.Semaphore(settings.tool_global_concurrency))
+    return _GLOBAL_SLOTS[1]
+
+
+def _limiter(tool: Tool) -> _Limiter:
+    limits = (tool.max_concurrency or settings.tool_default_concurrency, tool.rate_limit)
+    with _LOCK:
+        entry = _LIMITERS.get(tool.id)
+        if entry is None or entry[0] != limits or entry[1].loop is not asyncio.get_running_loop():
+            entry = _LIMITERS[tool.id] = (limits, _Limiter(*limits))
+        return entry[1]
+
+
+def forget(tool_id: str) -> None:
+    """工具更新/删除后丢弃其限制器，下次调用按新配置重建。"""
+    with _LOCK:
+        _LIMITERS.pop(tool_id, None)
+
+
+def _check_url(url: Any) -> None:
+    if not isinstance(url, str):
+        raise ValueError("http backend needs an http(s) url")
+    try:
+        parsed = httpx.URL(url)
+    except httpx.InvalidURL:
+        raise ValueError("http backend needs an http(s) url")
+    host = parsed.host.lower().rstrip(".")
+    if parsed.scheme not in ("http", "https") or not host:
+        raise ValueError("http backend needs an http(s) url")
+    allowed = [h.strip().lower() for h in settings.tool_http_allowed_hosts.split(",") if h.strip()]
+    if allowed:
+        if not any(host == h or (h.startswith(".") and host.endswith(h)) for h in allowed):
+            raise ValueError(f"http backend host not allowed: {host}")
+        return
+    if host == "localhost" or host.endswith(".localhost"):
+        raise ValueError(f"http backend host not allowed: {host}")
+    try:
+        ip = ipaddress.ip_address(host)
+    except ValueError:
+        return
+    if not ip.is_global:
+        raise ValueError(f"http backend host not allowed: {host}")
+
+
+def _timeout(backend: Dict[str, Any]) -> float:
+    timeout = backend.get("timeout", settings.tool_timeout)
+    # bool 是 int 的子类，单独排除
+    if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not 0 < timeout < float("inf"):
+        raise ValueError("backend timeout must be a positive number of seconds")
+    return float(timeout)
+
+
+def check_backend(backend: Dict[str, Any]) -> None:
+    """保存工具时校验后端配置；非法时抛 ValueError。"""
+    kind = backend.get("type")
+    if not backend:
+        return
+    if kind == "http":
+        _check_url(backend.get("url"))
+        method = backend.get("method", "POST")
+        if not isinstance(method, str) or method.upper() not in ("GET", "POST", "PUT", "PATCH", "DELETE"):
+            raise ValueError("http backend method must be one of GET/POST/PUT/PATCH/DELETE")
+        headers = backend.get("headers")
+        if headers is not None and not (
+            isinstance(headers, dict) and all(isinstance(k, str) and isinstance(v, str) for k, v in headers.items())
+        ):
+            raise ValueError("http backend headers must be an object of strings")
+    elif kind == "local":
+        if not isinstance(backend.get("function"), str):
+            raise ValueError("local backend needs a function name")
+    else:
+        raise ValueError(f"unknown backend type: {kind}")
+    _timeout(backend)
+
+
+def _http() -> httpx.AsyncClient:
+    global _HTTP
+    loop = asyncio.get_running_loop()
+    if _HTTP is None or _HTTP[0] is not loop:
+        # 旧循环上的连接无法在新循环中复用或关闭，直接丢弃
+        _HTTP = (loop, httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.tool_timeout),
+            limits=httpx.Limits(max_connections=settings.tool_http_max_connections),
+        ))
+    return _HTTP[1]
+
+
+async def aclose() -> None:
+    """关闭当前事件循环上的 HTTP 客户端并丢弃本循环的并发限制对象（lifespan 关闭时调用）。"""
+    global _HTTP, _GLOBAL_SLOTS
+    http, _HTTP = _HTTP, None
+    _GLOBAL_SLOTS = None
+    with _LOCK:
+        _LIMITERS.clear()
+    if http is not None and http[0] is asyncio.get_running_loop():
+        await http[1].aclose()
+
+
+async def _call_http(backend: Dict[str, Any], args: Dict[str, Any]) -> Any:
+    method = str(backend.get("method", "POST")).upper()
+    payload = {"params": args} if method == "GET" else {"json": args}
+    try:
+        resp = await _http().request(method, backend["url"], headers=backend.get("headers"), **payload)
+    except httpx.HTTPError as e:
+        raise ToolError(f"http backend error: {e!r}")
+    if resp.status_code >= 400:
+        raise ToolError(f"http backend returned {resp.status_code}")
+    if resp.headers.get("content-type", "").startswith("application/json"):
+        return resp.json()
+    return resp.text
+
+
+async def _call_local(backend: Dict[str, Any], args: Dict[str, Any]) -> Any:
+    fn = _FUNCTIONS.get(backend["function"])
+    if fn is None:
+        raise ToolError(f"local function not registered: {backend['function']}")
+    if asyncio.iscoroutinefunction(fn):
+        return await fn(**args)
+    return await asyncio.get_running_loop().run_in_executor(_POOL, lambda: fn(**args))
+
+
+async def invoke(tool: Tool, args: Dict[str, Any]) -> Any:
+    """按工具配置执行一次调用（参数需已通过 schema 校验）；失败抛 ToolError。"""
+    backend = tool.backend or {}
+    if not backend:
+        return "placeholder"
+    try:
+        # 校验之前保存的工具可能带非法配置，按调用失败处理而不是 500
+        check_backend(backend)
+        timeout = _timeout(backend)
+    except ValueError as e:
+        raise ToolError(f"invalid backend: {e}")
+    limiter = _limiter(tool)
+    call = _call_http if backend.get("type") == "http" else _call_local
+    async with limiter.slots:
+        await limiter.throttle()
+        async with _global_slots():
+            try:
+                return await asyncio.wait_for(call(backend, args), timeout)
+            except asyncio.TimeoutError:
+                raise ToolError(f"tool timed out after {timeout:g}s")
+            except ToolError:
+                raise
+            except Exception as e:
+                logger.warning("[Tool] {} failed: {!r}", tool.id, e)
+                raise ToolError(f"{type(e).__name__}: {e}")
+
+
+async def invoke_many(calls: Sequence[Tuple[Tool, Dict[str, Any]]]) -> List[Any]:
+    """并发执行一组独立调用，按输入顺序返回结果；失败的调用位置上为 ToolError 实例。"""
+    return list(await asyncio.gather(*(invoke(t, a) for t, a in calls), return_exceptions=True))
+
+
+async def as_completed(
+    calls: Sequence[Tuple[Tool, Dict[str, Any]]],
+    limit: Optional[int] = None,
+) -> AsyncIterator[Tuple[int, Any]]:
+    """并发执行并按完成顺序产出 (输入下标, 结果或 ToolError)；提前退出时取消未完成的调用。
+
+    limit 限制本批同时执行的调用数（在工具自身的并发上限之外，避免一个大批次占满该工具的全部槽位）。
+    """
+    batch_slots = asyncio.Semaphore(limit) if limit else None
+
+    async def run(i: int, tool: Tool, args: Dict[str, Any]) -> Tuple[int, Any]:
+        try:
+            if batch_slots is None:
+                return i, await invoke(tool, args)
+            async with batch_slots:
+                return i, await invoke(tool, args)
+        except ToolError as e:
+            return i, e
+
+    tasks = [asyncio.ensure_future(run(i, t, a)) for i, (t, a) in enumerate(calls)]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+    finally:
+        for task in tasks:
+            task.cancel()
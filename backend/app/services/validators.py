@@ -0,0 +1,67 @@
+"""
+文件作用：JSON Schema 校验器的编译与缓存（工具参数校验热路径）。
+
+设计要点：
+- jsonschema.validate 每次调用都会重新 check_schema 并构造校验器；这里每个工具只编译一次，
+  按 (tool_id, schema 哈希) 缓存，update_tool/delete_tool 时显式失效。
+- 热路径只按 tool_id 查表并比对 schema 对象身份，不重新序列化/哈希 schema；
+  对象变化（工具被替换）时才计算哈希，相同 schema 直接复用已编译的校验器。
+- 校验先走 is_valid 快路径，只有失败时才收集错误并选出与 jsonschema.validate 相同的 best_match 信息。
+"""
+
+import hashlib
+import json
+from threading import RLock
+from typing import Any, Dict, Optional, Tuple
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+_DEFAULT_SCHEMA: Dict[str, Any] = {"type": "object"}
+
+# tool_id -> (schema 对象, schema 哈希, 校验器)
+_BY_TOOL: Dict[str, Tuple[Any, str, Any]] = {}
+# (tool_id, schema 哈希) -> 校验器
+_COMPILED: Dict[Tuple[str, str], Any] = {}
+_LOCK = RLock()
+
+
+def compile_schema(schema: Dict[str, Any]) -> Any:
+    """检查 schema 本身并构造校验器；schema 非法时抛 jsonschema.SchemaError。"""
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
+def schema_hash(schema: Dict[str, Any]) -> str:
+    text = json.dumps(schema, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def tool_validator(tool_id: str, schema: Optional[Dict[str, Any]]) -> Any:
+    """取工具的已编译校验器（空 schema 视为 {"type": "object"}）；schema 非法时抛 SchemaError。"""
+    entry = _BY_TOOL.get(tool_id)
+    if entry is not None and entry[0] is schema:
+        return entry[2]
+    digest = schema_hash(schema or _DEFAULT_SCHEMA)
+    with _LOCK:
+        validator = _COMPILED.get((tool_id, digest))
+        if validator is None:
+            validator = compile_schema(schema or _DEFAULT_SCHEMA)
+            _COMPILED[(tool_id, digest)] = validator
+        _BY_TOOL[tool_id] = (schema, digest, validator)
+        return validator
+
+
+def invalidate(tool_id: str) -> None:
+    """工具更新/删除时丢弃其全部已编译校验器。"""
+    with _LOCK:
+        _BY_TOOL.pop(tool_id, None)
+        for key in [k for k in _COMPILED if k[0] == tool_id]:
+            del _COMPILED[key]
+
+
+def validation_error(validator: Any, instance: Any) -> Optional[str]:
+    """通过返回 None，否则返回与 jsonschema.validate 抛出的 ValidationError 相同的 message。"""
+    if validator.is_valid(instance):
+        return None
+    return best_match(validator.iter_errors(instance)).message
@@ -0,0 +1,220 @@
+"""
+文件作用：基于 NumPy 的本地向量索引（精确检索 + 可选 IVF 粗聚类分区）。
+
+设计要点：
+- 向量存放在按容量倍增的连续 float32 矩阵中，打分一次矩阵乘完成，避免逐 chunk 的 Python 循环。
+- Top-K 使用 argpartition（O(n)）再对 K 个结果排序，而非对全量 argsort。
+- IVF 模式：对向量做 k-means 得到 nlist 个中心，查询只扫描最近的 nprobe 个分区；
+  向量数低于 ivf_min_vectors 时自动退化为精确检索（小 KB 精确检索更快也更准）。
+- 训练不在查询路径上：写入使向量数首次达到阈值或规模翻倍时，提交到后台训练线程；k-means 在锁外
+  对已写入前缀计算，只在换入中心与分区时短暂持锁。训练完成前查询照常走精确检索（或沿用旧分区）。
+- cosine 度量在写入时预先归一化，查询时只需点积。
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import RLock
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from loguru import logger
+
+_ASSIGN_BLOCK = 65536  # 分块计算到中心的距离，限制临时矩阵大小
+# IVF 训练在后台单线程执行，不阻塞写入与查询
+_TRAINER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ivf-train")
+
+
+def topk_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """对二维得分矩阵的每一行取 Top-K 下标（按得分降序）。"""
+    n = scores.shape[1]
+    if k >= n:
+        return np.argsort(-scores, axis=1)
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def nearest_centroid(vecs: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """返回每个向量最近（L2）中心的下标。"""
+    c_sq = np.einsum("ij,ij->i", centroids, centroids)
+    out = np.empty(vecs.shape[0], dtype=np.int32)
+    for s in range(0, vecs.shape[0], _ASSIGN_BLOCK):
+        block = vecs[s: s + _ASSIGN_BLOCK]
+        # ||x-c||^2 = ||x||^2 - 2x·c + ||c||^2，||x||^2 对 argmin 无影响
+        out[s: s + len(block)] = np.argmin(c_sq - 2.0 * block @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(data: np.ndarray, nlist: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+    """在 data 的采样上训练 nlist 个 k-means 中心。"""
+    n = data.shape[0]
+    rng = np.random.default_rng(seed)
+    sample = np.asarray(data[np.sort(rng.choice(n, size=min(n, nlist * 64), replace=False))])
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iters):
+        assign = nearest_centroid(sample, centroids)
+        # 按分区排序后 reduceat 分段求和，比 np.add.at 的逐元素散射快一个数量级
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        nonempty = np.flatnonzero(counts)
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+        sums = np.zeros_like(centroids)
+        sums[nonempty] = np.add.reduceat(sample[order], starts, axis=0)
+        # 空分区保留原中心，避免塌缩为零向量
+        updated = sums / np.maximum(counts, 1)[:, None].astype(np.float32)
+        updated[counts == 0] = centroids[counts == 0]
+        centroids = updated
+    return centroids
+
+
+class VectorIndex:
+    """单个 KB 的向量索引，线程安全。"""
+
+    def __init__(
+        self,
+        dim: int,
+        metric: str = "cosine",
+        mode: str = "exact",
+        nlist: int = 1024,
+        nprobe: int = 16,
+        ivf_min_vectors: int = 50000,
+    ) -> None:
+        if metric not in ("cosine", "dot"):
+            raise ValueError(f"unsupported metric: {metric}")
+        if mode not in ("exact", "ivf"):
+            raise ValueError(f"unsupported mode: {mode}")
+        self.dim = dim
+        self.metric = metric
+        self.mode = mode
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.ivf_min_vectors = ivf_min_vectors
+        self._vecs = np.empty((1024, dim), dtype=np.float32)
+        self._n = 0
+        self._ids: List[str] = []
+        # IVF 状态：中心矩阵、各分区成员下标
+        self._centroids: Optional[np.ndarray] = None
+        self._members: List[np.ndarray] = []
+        self._trained_n = 0
+        self._training = False
+        self._lock = RLock()
+
+    def __len__(self) -> int:
+        return self._n
+
+    def prepare(self, vecs: np.ndarray) -> np.ndarray:
+        vecs = np.asarray(vecs, dtype=np.float32).reshape(-1, self.dim)
+        if self.metric == "cosine":
+            norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+            vecs = np.divide(vecs, norms, out=np.zeros_like(vecs), where=norms > 0)
+        return vecs
+
+    def add(self, ids: Sequence[str], vecs: np.ndarray) -> None:
+        vecs = self.prepare(vecs)
+        if len(ids) != vecs.shape[0]:
+            raise ValueError("ids and vectors length mismatch")
+        with self._lock:
+            need = self._n + vecs.shape[0]
+            if need > self._vecs.shape[0]:
+                cap = self._vecs.shape[0]
+                while cap < need:
+                    cap *= 2
+                grown = np.empty((cap, self.dim), dtype=np.float32)
+                grown[: self._n] = self._vecs[: self._n]
+                self._vecs = grown
+            self._vecs[self._n: need] = vecs
+            self._ids.extend(ids)
+            start, self._n = self._n, need
+            if self._centroids is not None:
+                self._assign_range(start, need)
+            schedule = not self._training and self._needs_training()
+            if schedule:
+                self._training = True
+        if schedule:
+            _TRAINER.submit(self._train_background)
+
+    def export(self) -> Tuple[List[str], np.ndarray]:
+        """导出 (ids, 已预处理的向量) 快照，用于落盘为不可变段。"""
+        with self._lock:
+            return list(self._ids), self._vecs[: self._n].copy()
+
+    # ---- IVF ----
+    def _assign_range(self, start: int, end: int) -> None:
+        assign = nearest_centroid(self._vecs[start:end], self._centroids)
+        base = np.arange(start, end, dtype=np.int64)
+        for lst in np.unique(assign):
+            self._members[lst] = np.concatenate([self._members[lst], base[assign == lst]])
+
+    def _needs_training(self) -> bool:
+        # 首次达到阈值或规模翻倍后重新训练，保证分区均衡
+        if self.mode != "ivf" or self._n < self.ivf_min_vectors:
+            return False
+        return self._centroids is None or self._n >= 2 * self._trained_n
+
+    def train(self, iters: int = 10, seed: int = 0) -> None:
+        """在当前向量上训练 k-means 中心并重建分区；计算在锁外进行，期间查询与写入不受影响。"""
+        with self._lock:
+            n = self._n
+            # 只追加写入：前 n 行不会再被修改，扩容时旧矩阵也保持不变，可在锁外读取
+            data = self._vecs[:n]
+        nlist = min(self.nlist, n)
+        if nlist <= 0:
+            return
+        centroids = kmeans(data, nlist, iters, seed)
+        assign = nearest_centroid(data, centroids)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        members = np.split(order, np.cumsum(np.bincount(assign, minlength=nlist))[:-1])
+        with self._lock:
+            self._centroids, self._members, self._trained_n = centroids, members, n
+            # 训练期间新写入的向量补做分区归属
+            if self._n > n:
+                self._assign_range(n, self._n)
+
+    def _train_background(self) -> None:
+        try:
+            self.train()
+        except Exception as e:
+            logger.error("[Vector] IVF training failed n={}: {}", self._n, e)
+        finally:
+            with self._lock:
+                self._training = False
+                # 训练期间规模又翻倍：继续下一轮
+                schedule = self._needs_training() and self._trained_n > 0
+                if schedule:
+                    self._training = True
+            if schedule:
+                _TRAINER.submit(self._train_background)
+
+    def _use_ivf(self) -> bool:
+        # 只使用已训练好的分区；尚未训练完成时走精确检索
+        return self.mode == "ivf" and self._centroids is not None and self._n >= self.ivf_min_vectors
+
+    # ---- 查询 ----
+    def search_batch(self, queries: np.ndarray, top_k: int = 10) -> List[List[Tuple[str, float]]]:
+        """批量查询：返回每个查询的 [(chunk_id, score)]，按得分降序。"""
+        queries = self.prepare(queries)
+        with self._lock:
+            if not self._n or top_k <= 0:
+                return [[] for _ in range(len(queries))]
+            if self._use_ivf():
+                return [self._search_ivf(q, top_k) for q in queries]
+            scores = queries @ self._vecs[: self._n].T
+            top = topk_rows(scores, top_k)
+            ids = self._ids
+            return [
+                [(ids[j], float(scores[r, j])) for j in top[r]]
+                for r in range(len(queries))
+            ]
+
+    def search(self, query: np.ndarray, top_k: int = 10) -> List[Tuple[str, float]]:
+        return self.search_batch(np.asarray(query).reshape(1, -1), top_k)[0]
+
+    def _search_ivf(self, q: np.ndarray, top_k: int) -> List[Tuple[str, float]]:
+        c = self._centroids
+        # 与训练时的分区划分保持一致：按 L2 距离选最近的 nprobe 个分区
+        dist = np.einsum("ij,ij->i", c, c) - 2.0 * (c @ q)
+        near = topk_rows(-dist[None, :], min(self.nprobe, len(c)))[0]
+        cand = np.concatenate([self._members[i] for i in near])
+        if not len(cand):
+            return []
+        scores = self._vecs[cand] @ q
+        top = topk_rows(scores[None, :], top_k)[0]
+        return [(self._ids[cand[j]], float(scores[j])) for j in top]
@@ -1,44 +1,649 @@
 """
-文件作用：Workflow 引擎占位（简化的顺序节点执行）。
+文件作用：Workflow 引擎——按 DAG 依赖在 asyncio 上并发执行节点，运行在后台进行。
+
+设计要点：
+- 依赖来自 spec["edges"]（{"source","target"}，兼容 {"from","to"}）与节点自身的 depends_on。
+- 编译：规格在创建/更新时一次性编译为不可变执行计划 Plan（拓扑序、前驱/后继、已解析的处理器、
+  预编译的 input_schema/output_schema 校验器、节点定义的规范化序列化），按规格哈希缓存；
+  非法图（ID/引用错误、环、坏 schema）在保存时即被拒绝，运行启动时不再解析规格。
+- 调度：入度为 0 的节点立即启动，节点完成后递减后继入度；相互独立的分支并发执行，
+  总耗时趋近关键路径而非各节点耗时之和。
+- 并发限制：每个运行一个信号量（workflow_run_concurrency），进程内全局一个信号量（workflow_global_concurrency）。
+- start_run 只创建运行记录并提交后台任务，立即返回；状态通过 get_run 查询。
+- 超时与重试：节点可声明 timeout（秒，0 为不限）、retries 与 retry_backoff，缺省取配置；每次尝试单独
+  占用并发槽位，退避等待期间槽位已释放，卡住的节点超时后让出槽位，不会拖垮整个执行器。
+- 取消：cancel_run 经唤醒队列通知调度器，在途节点任务被 cancel（处理器在下一个 await 点收到 CancelledError），
+  槽位随 async with 退出必然释放；挂起（paused）的运行直接在库中原子地置为 cancelled。
+- 节点失败：不再调度新节点，等待在途节点结束，其余节点标记 skipped，运行标记 failed。
+- 审批节点挂起：节点置 pending 后释放槽位；无其他可执行节点时调度协程结束，运行置 paused，
+  全部状态（节点状态/输出 + 规格快照）留在运行记录中作为检查点，等待期间不占协程与并发槽位。
+  approve_node 标记通过后从检查点恢复，仅执行尚未完成的节点；运行仍在调度中时则经唤醒队列直接续跑。
+- 回放记忆化：每个节点记录输入哈希（节点定义 + 上游输出）；回放时 (节点 ID, 输入哈希) 命中旧运行的
+  已完成节点则直接复用其输出，只重算定义或输入变化的节点。from_node 模式下起点之外的节点按 ID 复用，
+  起点及其下游一律重算。
+- 事件：运行与节点的每次状态变化发布到进程内 pub/sub（主题为 run_id），供 SSE 推送，客户端无需轮询。
+- 存储：运行与节点结果持久化到数据库（services/run_store），写入由单线程 writer 按提交顺序执行，
+  不阻塞事件循环；内存中只保留调度中的运行（_ACTIVE）与有界 LRU 的热点运行快照。
 """
 
-from typing import List, Dict, Any, Optional
+import asyncio
+import hashlib
+import json
+import random
+import time
 import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import RLock
+from types import MappingProxyType
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, NamedTuple, Optional, Set, Tuple
+from jsonschema import SchemaError
+from loguru import logger
+from . import run_store
+from .validators import compile_schema, validation_error
+from .cache import TTLCache
+from .pubsub import PubSub, Subscription
+from ..config import settings
+
+# 节点处理器：(节点定义, 上游输出 {node_id: output}) -> 本节点输出
+NodeHandler = Callable[[Dict[str, Any], Dict[str, Any]], Awaitable[Any]]
+
+# 调度中的运行（含排队待恢复的）；执行器在事件循环线程写入，路由可能在线程池读取，读写都经 _LOCK
+_ACTIVE: Dict[str, Dict[str, Any]] = {}
+_LOCK = RLock()
+# 已结束/挂起运行的快照缓存，读多写少的热点运行不必每次查库
+_CACHE = TTLCache(maxsize=settings.workflow_run_cache_size, ttl=settings.workflow_run_cache_ttl)
+# 单线程顺序落库：同一运行的多次写入不会乱序，读未命中时也经它读取以看到已提交的写入
+_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="wf-store")
+# 后台运行任务的强引用，防止被 GC 提前回收
+_TASKS: Set[asyncio.Task] = set()
+_GLOBAL_SLOTS: Optional[asyncio.Semaphore] = None
+# 正在调度中的运行 -> 唤醒队列；挂起（paused）的运行不在其中
+_WAKE: Dict[str, asyncio.Queue] = {}
+# 已请求取消、尚未结束调度的运行
+_CANCELLED: Set[str] = set()
+# 节点返回该值表示挂起等待审批，不触发后继
+_SUSPEND = object()
+_DONE = ("ok", "approved")
+# 状态变化事件：主题为 run_id，事件为 ("node" | "run", 数据)
+_EVENTS = PubSub(maxsize=settings.workflow_event_queue_size)
+# 规格哈希 -> Plan；计划不可变，只按 LRU 淘汰
+_PLANS = TTLCache(maxsize=settings.workflow_plan_cache_size, ttl=float("inf"))
+
+
+async def _noop(node: Dict[str, Any], inputs: Dict[str, Any]) -> Any:
+    return None
+
+
+async def _wait(node: Dict[str, Any], inputs: Dict[str, Any]) -> Any:
+    # 等待节点：config.seconds 秒后继续
+    await asyncio.sleep(float((node.get("config") or {}).get("seconds", 0)))
+    return None
+
+
+_HANDLERS: Dict[str, NodeHandler] = {"wait": _wait}
+
+
+def register_handler(kind: str, handler: NodeHandler) -> None:
+    """注册节点类型处理器；未注册的类型按空操作执行。
+
+    处理器在编译时解析进 Plan，应在启动阶段（编译任何规格之前）注册；已编译的计划缓存随之清空。
+    """
+    _HANDLERS[kind] = handler
+    _PLANS.clear()
+
+
+def _global_slots() -> asyncio.Semaphore:
+    # 延迟到事件循环内创建（Python 3.9 的 Semaphore 构造时即绑定事件循环）
+    global _GLOBAL_SLOTS
+    if _GLOBAL_SLOTS is None:
+        _GLOBAL_SLOTS = asyncio.Semaphore(settings.workflow_global_concurrency)
+    return _GLOBAL_SLOTS
+
+
+def build_graph(spec: Dict[str, Any]) -> Tuple[List[str], Dict[str, Dict[str, Any]], Dict[str, List[str]], Dict[str, List[str]]]:
+    """解析并校验 DAG，返回 (拓扑序, 节点表, 前驱表, 后继表)；非法时抛 ValueError。"""
+    nodes: Dict[str, Dict[str, Any]] = {}
+    for node in spec.get("nodes") or []:
+        nid = node.get("id")
+        if not isinstance(nid, str) or not nid:
+            raise ValueError("every node needs a string id")
+        if nid in nodes:
+            raise ValueError(f"duplicate node id: {nid}")
+        nodes[nid] = node
+    deps: Dict[str, List[str]] = {nid: [] for nid in nodes}
+    children: Dict[str, List[str]] = {nid: [] for nid in nodes}
+
+    def link(src: Any, dst: Any) -> None:
+        if src not in nodes or dst not in nodes:
+            raise ValueError(f"edge references unknown node: {src} -> {dst}")
+        if src not in deps[dst]:
+            deps[dst].append(src)
+            children[src].append(dst)
+
+    for edge in spec.get("edges") or []:
+        link(edge.get("source", edge.get("from")), edge.get("target", edge.get("to")))
+    for nid, node in nodes.items():
+        for dep in node.get("depends_on") or []:
+            link(dep, nid)
+
+    # Kahn 拓扑排序：排不完说明有环
+    indegree = {nid: len(d) for nid, d in deps.items()}
+    order = [nid for nid in nodes if not indegree[nid]]
+    for nid in order:
+        for child in children[nid]:
+            indegree[child] -= 1
+            if not indegree[child]:
+                order.append(child)
+    if len(order) != len(nodes):
+        cyclic = sorted(nid for nid, n in indegree.items() if n)
+        raise ValueError(f"workflow graph has a cycle: {', '.join(cyclic)}")
+    return order, nodes, deps, children
+
+
+class NodePolicy(NamedTuple):
+    timeout: float  # 单次尝试的超时秒数，0 为不限
+    retries: int  # 失败后的重试次数
+    backoff: float  # 首次重试前的退避秒数，之后指数增长
+
+
+def _policy(nid: str, node: Dict[str, Any]) -> NodePolicy:
+    try:
+        policy = NodePolicy(
+            timeout=float(node.get("timeout", settings.workflow_node_timeout) or 0),
+            retries=int(node.get("retries", settings.workflow_node_retries) or 0),
+            backoff=float(node.get("retry_backoff", settings.workflow_retry_backoff) or 0),
+        )
+    except (TypeError, ValueError):
+        raise ValueError(f"node {nid} has an invalid timeout/retry policy")
+    if policy.timeout < 0 or policy.retries < 0 or policy.backoff < 0:
+        raise ValueError(f"node {nid} has a negative timeout/retry policy")
+    return policy
+
+
+@dataclass(frozen=True)
+class Plan:
+    """编译后的执行计划，创建后不再修改，可被多个运行共享。"""
+
+    spec_hash: str
+    spec: Dict[str, Any]
+    order: Tuple[str, ...]
+    nodes: Mapping[str, Mapping[str, Any]]
+    deps: Mapping[str, Tuple[str, ...]]
+    children: Mapping[str, Tuple[str, ...]]
+    handlers: Mapping[str, NodeHandler]
+    policies: Mapping[str, NodePolicy]
+    # 节点定义的规范化 JSON，计算输入哈希时直接拼接
+    node_keys: Mapping[str, str]
+    input_validators: Mapping[str, Any]
+    output_validators: Mapping[str, Any]
+
+
+def _canonical(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, default=str, separators=(",", ":"), ensure_ascii=False)
+
+
+def _compile_schema(nid: str, schema: Any) -> Any:
+    try:
+        return compile_schema(schema)
+    except SchemaError as e:
+        raise ValueError(f"node {nid} has an invalid schema: {e.message}")
+
+
+def compile_spec(spec: Dict[str, Any]) -> Plan:
+    """把规格编译为执行计划（按规格哈希缓存）；非法时抛 ValueError。"""
+    try:
+        text = json.dumps(spec, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"workflow spec is not JSON-serializable: {e}")
+    spec_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+    plan = _PLANS.get(spec_hash)
+    if plan is not None:
+        return plan
+    # 从规范化文本重建一份私有副本：之后修改原 dict 不会影响计划
+    spec = json.loads(text)
+    order, nodes, deps, children = build_graph(spec)
+    inputs, outputs = {}, {}
+    for nid, node in nodes.items():
+        if not isinstance(node.get("type", ""), str):
+            raise ValueError(f"node {nid} has a non-string type")
+        if node.get("input_schema") is not None:
+            inputs[nid] = _compile_schema(nid, node["input_schema"])
+        if node.get("output_schema") is not None:
+            outputs[nid] = _compile_schema(nid, node["output_schema"])
+    plan = Plan(
+        spec_hash=spec_hash,
+        spec=spec,
+        order=tuple(order),
+        nodes=MappingProxyType({nid: MappingProxyType(n) for nid, n in nodes.items()}),
+        deps=MappingProxyType({nid: tuple(d) for nid, d in deps.items()}),
+        children=MappingProxyType({nid: tuple(c) for nid, c in children.items()}),
+        handlers=MappingProxyType({nid: _HANDLERS.get(n.get("type"), _noop) for nid, n in nodes.items()}),
+        policies=MappingProxyType({nid: _policy(nid, n) for nid, n in nodes.items()}),
+        node_keys=MappingProxyType({nid: _canonical(n) for nid, n in nodes.items()}),
+        input_validators=MappingProxyType(inputs),
+        output_validators=MappingProxyType(outputs),
+    )
+    _PLANS.set(spec_hash, plan)
+    return plan
+
+
+def _plan_of(run: Dict[str, Any]) -> Plan:
+    # 恢复/回放时优先按运行记录中的哈希取缓存，未命中（如进程重启）再编译快照
+    return _PLANS.get(run.get("spec_hash")) or compile_spec(run["spec"])
+
+
+def _check(validator: Any, value: Any, what: str) -> None:
+    error = validation_error(validator, value)
+    if error is not None:
+        raise ValueError(f"{what} does not match schema: {error}")
+
+
+def _backoff(policy: NodePolicy, attempt: int) -> float:
+    # 指数退避 + 抖动，避免同时失败的节点同时重试
+    return min(policy.backoff * 2 ** (attempt - 1), settings.workflow_retry_backoff_max) * random.uniform(0.5, 1.0)
+
+
+async def _invoke(plan: Plan, nid: str, inputs: Dict[str, Any]) -> Any:
+    output = await plan.handlers[nid](plan.nodes[nid], inputs)
+    if nid in plan.output_validators:
+        _check(plan.output_validators[nid], output, "output")
+    return output
+
+
+def _log_failure(fut: Future) -> None:
+    if fut.exception() is not None:
+        logger.error("[WF] persist failed: {}", fut.exception())
+
 
-# 内存运行历史占位
-_RUNS: Dict[str, Dict[str, Any]] = {}
+def _persist(fn: Callable[..., Any], *args: Any) -> None:
+    _WRITER.submit(fn, *args).add_done_callback(_log_failure)
 
 
-def run_nodes(nodes: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    results = []
-    for node in nodes:
-        kind = node.get("type")
-        if kind == "approval":
-            # 人工审批节点：初始为 pending
-            results.append({"node": node.get("id"), "type": kind, "status": "pending"})
+def _input_hash(node_key: str, inputs: Dict[str, Any]) -> str:
+    return hashlib.sha256(f"{node_key}\n{_canonical(inputs)}".encode("utf-8")).hexdigest()
+
+
+class _Replay:
+    """回放复用表：(节点 ID, 输入哈希) -> 旧运行输出；from_node 模式下起点之外的节点按 ID 直接复用。"""
+
+    def __init__(self, old: Dict[str, Any], children: Mapping[str, Tuple[str, ...]], from_node: Optional[str]) -> None:
+        done = [n for n in old["nodes"] if n["status"] in _DONE]
+        self.memo = {(n["node"], n.get("input_hash")): n["output"] for n in done}
+        self.by_id = {n["node"]: n["output"] for n in done} if from_node else {}
+        self.force: Set[str] = set()
+        stack = [from_node] if from_node else []
+        while stack:
+            nid = stack.pop()
+            if nid not in self.force:
+                self.force.add(nid)
+                stack.extend(children.get(nid, []))
+
+    def lookup(self, node_id: str, input_hash: str) -> Tuple[bool, Any]:
+        if node_id in self.force:
+            return False, None
+        if node_id in self.by_id:
+            return True, self.by_id[node_id]
+        key = (node_id, input_hash)
+        return (True, self.memo[key]) if key in self.memo else (False, None)
+
+
+def subscribe(run_id: str) -> Subscription:
+    """订阅运行的状态变化事件；需在事件循环内调用，用完须 close。"""
+    return _EVENTS.subscribe(run_id)
+
+
+def _publish_node(run_id: str, node: Dict[str, Any]) -> None:
+    _EVENTS.publish(run_id, ("node", {"run_id": run_id, **node}))
+
+
+def _publish_run(run: Dict[str, Any]) -> None:
+    # 运行级事件较少（启动/挂起/结束），附带全部节点状态便于客户端对齐；规格不下发
+    _EVENTS.publish(run["id"], ("run", {k: v for k, v in _snapshot(run).items() if k != "spec"}))
+
+
+def _update_node(run_id: str, node_id: str, **fields: Any) -> None:
+    with _LOCK:
+        for i, n in enumerate(_ACTIVE[run_id]["nodes"]):
+            if n["node"] == node_id:
+                n.update(fields)
+                _persist(run_store.save_node, run_id, i, dict(n))
+                _publish_node(run_id, n)
+                return
+
+
+def _update_run(run_id: str, **fields: Any) -> None:
+    with _LOCK:
+        run = _ACTIVE[run_id]
+        run.update(fields)
+        _persist(run_store.save_run, _snapshot(run), False)
+        _publish_run(run)
+
+
+def _retire(run_id: str) -> None:
+    # 运行结束或挂起：移出 _ACTIVE，最终快照进缓存并落库
+    with _LOCK:
+        run = _ACTIVE.pop(run_id)
+        snap = _snapshot(run)
+        _CACHE.set(run_id, snap)
+        _persist(run_store.save_run, snap)
+        _publish_run(snap)
+
+
+async def _run_node(run_id: str, plan: Plan, nid: str, inputs: Dict[str, Any], run_slots: asyncio.Semaphore, replay: Optional[_Replay]) -> Any:
+    node = plan.nodes[nid]
+    kind = node.get("type")
+    input_hash = _input_hash(plan.node_keys[nid], inputs)
+    if replay is not None:
+        hit, output = replay.lookup(nid, input_hash)
+        if hit:
+            # 复用旧输出：不占并发槽位，审批节点沿用原审批结果
+            now = time.time()
+            _update_node(run_id, nid, status="approved" if kind == "approval" else "ok", output=output,
+                         input_hash=input_hash, memoized=True, started_at=now, finished_at=now)
+            return output
+    if kind == "approval":
+        # 人工审批节点：标记 pending 后即返回，不占并发槽位，由 approve_node 恢复
+        _update_node(run_id, nid, status="pending", input_hash=input_hash, started_at=time.time())
+        return _SUSPEND
+    policy = plan.policies[nid]
+    try:
+        if nid in plan.input_validators:
+            # 输入不符是确定性错误，不重试
+            try:
+                _check(plan.input_validators[nid], inputs, "input")
+            except ValueError as e:
+                _update_node(run_id, nid, status="failed", input_hash=input_hash, error=str(e), finished_at=time.time())
+                raise
+        attempt = 0
+        while True:
+            attempt += 1
+            async with run_slots, _global_slots():
+                _update_node(run_id, nid, status="running", input_hash=input_hash, attempts=attempt, started_at=time.time())
+                try:
+                    output = await asyncio.wait_for(_invoke(plan, nid, inputs), policy.timeout or None)
+                except asyncio.TimeoutError:
+                    error: Exception = asyncio.TimeoutError(f"timed out after {policy.timeout:g}s")
+                except Exception as e:
+                    error = e
+                else:
+                    _update_node(run_id, nid, status="ok", output=output, error=None, finished_at=time.time())
+                    return output
+            # 槽位已释放，退避期间不占用
+            if attempt > policy.retries:
+                _update_node(run_id, nid, status="failed", error=str(error), finished_at=time.time())
+                raise error
+            _update_node(run_id, nid, status="retrying", error=str(error))
+            await asyncio.sleep(_backoff(policy, attempt))
+    except asyncio.CancelledError:
+        _update_node(run_id, nid, status="cancelled", finished_at=time.time())
+        raise
+
+
+def _spawn(run_id: str) -> None:
+    task = asyncio.ensure_future(_execute(run_id))
+    _TASKS.add(task)
+    task.add_done_callback(_TASKS.discard)
+
+
+async def _execute(run_id: str) -> None:
+    try:
+        with _LOCK:
+            run = _ACTIVE[run_id]
+            plan, replay_of, from_node = _plan_of(run), run.get("replay_of"), run.get("from_node")
+        replay = None
+        if replay_of:
+            # 旧运行可能需查库：放到线程池，不阻塞事件循环
+            old = await asyncio.get_running_loop().run_in_executor(None, get_run, replay_of)
+            if old is not None:
+                replay = _Replay(old, plan.children, from_node)
+        await _schedule(run_id, plan, replay)
+    except Exception as e:
+        logger.error("[WF] run {} crashed: {}", run_id, e)
+        with _LOCK:
+            if run_id in _ACTIVE:
+                _ACTIVE[run_id].update(status="failed", error=str(e), finished_at=time.time())
+                _retire(run_id)
+
+
+async def _schedule(run_id: str, plan: Plan, replay: Optional[_Replay] = None) -> None:
+    """从运行记录（检查点）恢复调度：已完成节点的输出直接复用，其余按依赖继续执行。"""
+    order, deps, children = plan.order, plan.deps, plan.children
+    with _LOCK:
+        run = _ACTIVE[run_id]
+        status = {n["node"]: n["status"] for n in run["nodes"]}
+        outputs: Dict[str, Any] = {n["node"]: n["output"] for n in run["nodes"] if n["status"] in _DONE}
+        _update_run(run_id, status="running", started_at=run["started_at"] or time.time())
+    run_slots = asyncio.Semaphore(settings.workflow_run_concurrency)
+    remaining = {nid: sum(1 for d in deps[nid] if d not in outputs) for nid in order}
+    running: Dict[asyncio.Task, str] = {}
+    failed = False
+    # 运行期间的审批通过经此队列通知调度器
+    wake: asyncio.Queue = asyncio.Queue()
+    _WAKE[run_id] = wake
+
+    def launch(nid: str) -> None:
+        inputs = {dep: outputs.get(dep) for dep in deps[nid]}
+        running[asyncio.ensure_future(_run_node(run_id, plan, nid, inputs, run_slots, replay))] = nid
+
+    def finish(item: Optional[Tuple[str, Any]]) -> None:
+        # item 为 None 表示取消通知，由主循环检查 _CANCELLED 处理
+        if item is None:
+            return
+        nid, output = item
+        outputs[nid] = output
+        if failed:
+            return
+        for child in children[nid]:
+            remaining[child] -= 1
+            if not remaining[child]:
+                launch(child)
+
+    for nid in order:
+        if status[nid] == "queued" and not remaining[nid]:
+            launch(nid)
+    try:
+        while True:
+            while not wake.empty():
+                finish(wake.get_nowait())
+            if not running or run_id in _CANCELLED:
+                break
+            getter = asyncio.ensure_future(wake.get())
+            done, _ = await asyncio.wait([*running, getter], return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                finish(getter.result())
+            else:
+                getter.cancel()
+            for task in done:
+                if task is getter:
+                    continue
+                nid = running.pop(task)
+                if task.exception() is not None:
+                    failed = True
+                elif task.result() is not _SUSPEND:
+                    finish((nid, task.result()))
+        if running:
+            # 取消：通知在途节点并等待其退出（节点状态置 cancelled、槽位释放）
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+    finally:
+        _WAKE.pop(run_id, None)
+        # 调度协程自身被取消（如进程关闭）时同样不留下孤儿节点任务
+        for task in running:
+            task.cancel()
+
+    # 以下至函数结束没有 await：与事件循环内的 approve_node 不会交错
+    with _LOCK:
+        run = _ACTIVE[run_id]
+        cancelled = run_id in _CANCELLED
+        _CANCELLED.discard(run_id)
+        waiting = any(n["status"] == "pending" for n in run["nodes"])
+        if cancelled or failed or not waiting:
+            _skip_unfinished(run)
+            run.update(status="cancelled" if cancelled else "failed" if failed else "completed", finished_at=time.time())
         else:
-            results.append({"node": node.get("id"), "type": kind, "status": "ok"})
-    return results
+            # 挂起：检查点已在库中，调度协程就此结束，不占任务、并发槽位与 _ACTIVE
+            run["status"] = "paused"
+        _retire(run_id)
+    logger.info("[WF] run {} {}", run_id, run["status"])
 
 
-def start_run(workflow_id: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+def _skip_unfinished(run: Dict[str, Any]) -> None:
+    for n in run["nodes"]:
+        if n["status"] in ("queued", "pending", "retrying"):
+            n["status"] = "skipped"
+
+
+def start_run(workflow_id: str, plan: Plan, replay_of: Optional[str] = None, from_node: Optional[str] = None) -> Dict[str, Any]:
+    """按已编译的计划创建运行记录并在后台开始执行；需在事件循环内调用。
+
+    replay_of 指定被回放的运行，复用其中输入未变的节点输出；from_node 指定从该节点起强制重算（不存在时抛 ValueError）。
+    """
+    if from_node is not None and from_node not in plan.nodes:
+        raise ValueError(f"unknown node: {from_node}")
     run_id = str(uuid.uuid4())
-    result_nodes = run_nodes(spec.get("nodes", []))
     run = {
         "id": run_id,
         "workflow_id": workflow_id,
-        "status": "completed",
-        "nodes": result_nodes,
+        "status": "queued",
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        # 规格快照：挂起后按启动时的版本恢复，不受之后的修改影响
+        "spec": plan.spec,
+        "spec_hash": plan.spec_hash,
+        "replay_of": replay_of,
+        "from_node": from_node,
+        "nodes": [
+            {"node": nid, "type": plan.nodes[nid].get("type"), "status": "queued", "depends_on": list(plan.deps[nid]),
+             "output": None, "error": None, "input_hash": None, "memoized": False, "attempts": 0,
+             "started_at": None, "finished_at": None}
+            for nid in plan.order
+        ],
     }
-    _RUNS[run_id] = run
-    return run
+    with _LOCK:
+        _ACTIVE[run_id] = run
+        _persist(run_store.save_run, _snapshot(run))
+    _spawn(run_id)
+    return get_run(run_id)
+
+
+def _snapshot(run: Dict[str, Any]) -> Dict[str, Any]:
+    return {**run, "nodes": [dict(n) for n in run["nodes"]]}
 
 
 def get_run(run_id: str) -> Optional[Dict[str, Any]]:
-    return _RUNS.get(run_id)
+    with _LOCK:
+        run = _ACTIVE.get(run_id) or _CACHE.get(run_id)
+        if run is not None:
+            return _snapshot(run)
+    # 经 writer 读取：排在本进程已提交的写入之后
+    run = _WRITER.submit(run_store.load_run, run_id).result()
+    if run is None:
+        return None
+    with _LOCK:
+        # 读库期间运行可能已恢复或结束，以内存中的新状态为准
+        fresh = _ACTIVE.get(run_id) or _CACHE.get(run_id)
+        if fresh is not None:
+            return _snapshot(fresh)
+        _CACHE.set(run_id, run)
+        return _snapshot(run)
+
+
+def list_runs(workflow_id: str, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """键集分页列出运行（创建时间倒序），返回 (本页, 下一页游标)；游标非法抛 ValueError。"""
+    items, next_cursor = run_store.list_runs(workflow_id, limit, cursor)
+    with _LOCK:
+        # 库中可能尚未追上内存中的最新状态
+        items = [_snapshot(_ACTIVE.get(r["id"]) or _CACHE.get(r["id"]) or r) for r in items]
+    return items, next_cursor
+
+
+def _find_approval(run: Dict[str, Any], node_id: str) -> Tuple[int, Dict[str, Any]]:
+    for i, n in enumerate(run["nodes"]):
+        if n["node"] == node_id and n["type"] == "approval":
+            if n["status"] != "pending":
+                raise ValueError(f"approval node is {n['status']}")
+            return i, n
+    raise LookupError(node_id)
+
+
+def _approve_active(run_id: str, node_id: str, output: Any) -> bool:
+    with _LOCK:
+        run = _ACTIVE.get(run_id)
+        if run is None:
+            return False
+        i, node = _find_approval(run, node_id)
+        node.update(status="approved", output=output, finished_at=time.time())
+        _persist(run_store.save_node, run_id, i, dict(node))
+        _publish_node(run_id, node)
+        # 调度中则唤醒；尚未开始调度的（刚恢复排队）会在启动时把已通过节点视为完成
+        wake = _WAKE.get(run_id)
+        if wake is not None:
+            wake.put_nowait((node_id, output))
+        return True
+
+
+async def approve_node(run_id: str, node_id: str, output: Any = None) -> None:
+    """审批通过并从该节点继续执行；需在事件循环内调用。
+
+    运行或节点不存在抛 LookupError，节点未处于 pending 抛 ValueError。
+    """
+    if _approve_active(run_id, node_id, output):
+        return
+    loop = asyncio.get_running_loop()
+    run = await loop.run_in_executor(_WRITER, run_store.load_run, run_id)
+    if run is None:
+        raise LookupError(run_id)
+    i, node = _find_approval(run, node_id)
+    if not await loop.run_in_executor(_WRITER, run_store.claim_paused, run_id, "queued"):
+        # 已被并发的审批恢复（本进程或其他 worker）
+        if _approve_active(run_id, node_id, output):
+            return
+        raise ValueError(f"run is {run['status']}")
+    node.update(status="approved", output=output, finished_at=time.time())
+    run["status"] = "queued"
+    with _LOCK:
+        _ACTIVE[run_id] = run
+        _persist(run_store.save_node, run_id, i, dict(node))
+        _publish_node(run_id, node)
+        _publish_run(run)
+    _spawn(run_id)
+
 
+def _cancel_active(run_id: str) -> bool:
+    with _LOCK:
+        if run_id not in _ACTIVE:
+            return False
+        _CANCELLED.add(run_id)
+        # 尚未开始调度的运行会在调度循环首轮看到取消标记
+        wake = _WAKE.get(run_id)
+        if wake is not None:
+            wake.put_nowait(None)
+        return True
 
-def list_runs(workflow_id: str) -> List[Dict[str, Any]]:
-    return [r for r in _RUNS.values() if r.get("workflow_id") == workflow_id]
 
+async def cancel_run(run_id: str) -> str:
+    """取消运行；需在事件循环内调用。返回 "cancelling"（调度中，异步结束）或 "cancelled"（挂起的运行已直接取消）。
 
+    运行不存在抛 LookupError，运行已结束抛 ValueError。
+    """
+    if _cancel_active(run_id):
+        return "cancelling"
+    loop = asyncio.get_running_loop()
+    run = await loop.run_in_executor(_WRITER, run_store.load_run, run_id)
+    if run is None:
+        raise LookupError(run_id)
+    if not await loop.run_in_executor(_WRITER, run_store.claim_paused, run_id, "cancelled"):
+        # 与审批恢复并发：运行已回到调度中
+        if _cancel_active(run_id):
+            return "cancelling"
+        raise ValueError(f"run is {run['status']}")
+    _skip_unfinished(run)
+    run.update(status="cancelled", finished_at=time.time())
+    with _LOCK:
+        _CACHE.set(run_id, run)
+        _persist(run_store.save_run, _snapshot(run))
+        _publish_run(run)
+    return "cancelled"